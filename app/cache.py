@@ -0,0 +1,144 @@
+"""
+In-process cache for all-item analytics responses.
+
+Entries expire after settings.ANALYTICS_CACHE_TTL seconds and are dropped as
+soon as a session commits a change to anything the analytics read (items,
+categories, stock/restock/sales history, analytics snapshots). The cache is
+per process, so with several workers the TTL bounds how stale another
+worker's copy can get. Keys include client-supplied query parameters, so the
+cache holds at most ANALYTICS_CACHE_MAX_ENTRIES entries, least recently used
+first out, and concurrent misses share a fixed set of striped locks.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Dict, Hashable, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import models
+from .config import settings
+
+# Models whose changes invalidate cached analytics
+TRACKED_MODELS = (
+    models.Item,
+    models.Category,
+    models.StockHistory,
+    models.RestockHistory,
+    models.SalesHistory,
+    models.ItemAnalytics,
+    models.MenuOptimization,
+    models.ItemDailyRollup,
+)
+
+# Locks that serialize computing a key; keys hash onto them, so the set stays fixed
+KEY_LOCK_STRIPES = 64
+
+class ResponseCache:
+    def __init__(self, ttl_seconds: float, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._key_locks: List[threading.Lock] = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], object]):
+        """Return the cached value for key, computing it at most once at a time"""
+        if self.ttl_seconds <= 0:
+            return compute()
+
+        value = self._get(key)
+        if value is not None:
+            return value
+
+        with self._key_locks[hash(key) % KEY_LOCK_STRIPES]:
+            # Another request may have filled it while we waited
+            value = self._get(key)
+            if value is not None:
+                return value
+
+            self.misses += 1
+            generation = self._generation
+            value = compute()
+            with self._lock:
+                # Don't store a result computed from data that changed meanwhile
+                if generation == self._generation:
+                    self._store(key, value)
+            return value
+
+    def _store(self, key: Hashable, value):
+        """Add an entry, dropping expired ones and then the least recently used past max_entries. Hold _lock."""
+        now = time.monotonic()
+        for expired in [cached for cached, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[expired]
+        self._entries[key] = (now + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        return None
+
+    def invalidate(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+analytics_cache = ResponseCache(settings.ANALYTICS_CACHE_TTL, settings.ANALYTICS_CACHE_MAX_ENTRIES)
+
+def cached_response(endpoint):
+    """Serve a route from analytics_cache, keyed by its name and query parameters"""
+    @wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        params = tuple(sorted((name, value) for name, value in kwargs.items() if name != "db"))
+        return analytics_cache.get_or_compute(
+            (endpoint.__name__, params),
+            lambda: endpoint(*args, **kwargs)
+        )
+    return wrapper
+
+# Write tracking: flag the session on relevant changes, invalidate on commit
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, TRACKED_MODELS):
+            session.info["analytics_changed"] = True
+            return
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_execute(orm_execute_state):
+    # Bulk inserts/updates/deletes and Core upserts bypass the unit of work
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is None or issubclass(mapper.class_, TRACKED_MODELS):
+            orm_execute_state.session.info["analytics_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    if session.info.pop("analytics_changed", False):
+        analytics_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session):
+    session.info.pop("analytics_changed", None)
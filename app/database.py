@@ -1,9 +1,31 @@
 import os
+from typing import Dict
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
+from .instrumentation import instrument_engine
+from .sqlite_profile import tune_engine
 
-engine = create_engine(settings.DATABASE_URL)
+def _pool_options(url) -> Dict:
+    """create_engine() pool arguments from settings"""
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING, "pool_recycle": settings.DB_POOL_RECYCLE}
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite uses one connection per thread, which takes no size or overflow
+        return options
+    return {
+        **options,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT
+    }
+
+url = make_url(settings.DATABASE_URL)
+engine = create_engine(url, **_pool_options(url))
+if url.get_backend_name() == "sqlite":
+    tune_engine(engine)
+if settings.SQL_INSTRUMENTATION:
+    instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -0,0 +1,125 @@
+"""
+One date-ordered stream of stock counts, restocks and sales.
+
+merged_events() k-way merges the three history tables, each read in
+(item_id, date, id) order in batches, so a pass over one item or the whole
+catalog holds a batch per table in memory rather than the full history.
+usage_intervals() folds the stream into one UsageInterval per pair of
+consecutive stock counts. Stock used over an interval is the opening count
+plus what was restocked minus the closing count, so a restock between two
+counts no longer hides what was used.
+
+Once history is archived (see retention), each item's carryover stands in
+for its last archived count, so the first interval of the retained history
+still has an opening count.
+"""
+import heapq
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from sqlalchemy.orm import Query, Session
+from . import models
+
+# Event kinds, in the order events with the same timestamp are applied
+SALE = 0
+RESTOCK = 1
+COUNT = 2
+
+ALL_KINDS = (SALE, RESTOCK, COUNT)
+
+# Rows fetched per round trip from each history table
+BATCH_SIZE = 5000
+
+class Event(NamedTuple):
+    item_id: int
+    date: datetime
+    kind: int
+    id: int
+    value: float  # Units sold, units restocked, or the counted quantity
+
+class UsageInterval(NamedTuple):
+    item_id: int
+    start: datetime  # Opening count
+    end: datetime  # Closing count
+    opening: float
+    closing: float
+    restocked: float
+    sold: float
+
+    @property
+    def consumed(self) -> float:
+        """Stock used between the two counts (never negative)"""
+        return max(0.0, self.opening + self.restocked - self.closing)
+
+def _query(db: Session, kind: int, item_ids: Optional[List[int]], since: Optional[datetime],
+           until: Optional[datetime]) -> Query:
+    """One history table's rows as (item_id, date, id, value), in (item_id, date, id) order"""
+    model, value = {
+        SALE: (models.SalesHistory, models.SalesHistory.quantity_sold),
+        RESTOCK: (models.RestockHistory, models.RestockHistory.restock_amount),
+        COUNT: (models.StockHistory, models.StockHistory.quantity),
+    }[kind]
+
+    query = db.query(model.item_id, model.date, model.id, value)
+    if item_ids is not None:
+        query = query.filter(model.item_id.in_(item_ids))
+    if since is not None:
+        query = query.filter(model.date >= since)
+    if until is not None:
+        query = query.filter(model.date < until)
+    return query.order_by(model.item_id, model.date, model.id)
+
+def _stream(db: Session, kind: int, item_ids: Optional[List[int]], since: Optional[datetime],
+            until: Optional[datetime]) -> Iterator[Event]:
+    query = _query(db, kind, item_ids, since, until).yield_per(BATCH_SIZE)
+    return (Event(item_id, when, kind, row_id, amount) for item_id, when, row_id, amount in query)
+
+def _carryovers(db: Session, item_ids: Optional[List[int]], since: Optional[datetime],
+                until: Optional[datetime]) -> Iterator[Event]:
+    """Carryovers as counts (id 0); each item's is dated before any of its retained history"""
+    Carryover = models.StockCarryover
+    query = db.query(Carryover.item_id, Carryover.date, Carryover.quantity)
+    if item_ids is not None:
+        query = query.filter(Carryover.item_id.in_(item_ids))
+    if since is not None:
+        query = query.filter(Carryover.date >= since)
+    if until is not None:
+        query = query.filter(Carryover.date < until)
+    return (Event(item_id, when, COUNT, 0, quantity) for item_id, when, quantity in query.order_by(Carryover.item_id))
+
+def merged_events(db: Session, item_ids: Optional[List[int]] = None, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None, kinds: Sequence[int] = ALL_KINDS,
+                  carryovers: bool = True) -> Iterator[Event]:
+    """History events dated in [since, until), ordered by item, date, kind and id.
+
+    Pass carryovers=False when the caller replays archived days itself.
+    """
+    if item_ids is not None and not item_ids:
+        return iter(())
+    streams = [_stream(db, kind, item_ids, since, until) for kind in kinds]
+    if COUNT in kinds and carryovers:
+        streams.append(_carryovers(db, item_ids, since, until))
+    return heapq.merge(*streams)
+
+def usage_intervals(events: Iterable[Event]) -> Iterator[UsageInterval]:
+    """Fold a merged stream into intervals between consecutive counts of each item.
+
+    Restocks and sales before an item's first count in the stream have
+    nothing to be measured against and are dropped.
+    """
+    item_id = None
+    opening = None
+    restocked = sold = 0.0
+    for event in events:
+        if event.item_id != item_id:
+            item_id, opening = event.item_id, None
+        if event.kind == COUNT:
+            if opening is not None:
+                yield UsageInterval(item_id, opening.date, event.date, opening.value, event.value, restocked, sold)
+            opening = event
+            restocked = sold = 0.0
+        elif opening is None:
+            continue
+        elif event.kind == RESTOCK:
+            restocked += event.value
+        else:
+            sold += event.value
@@ -0,0 +1,335 @@
+"""
+Trained demand forecasting models.
+
+One RandomForestRegressor per category predicts an item's daily consumption
+from the previous LOOKBACK_DAYS of it: day of week, lagged consumption (1 and 7
+days), the 7-day mean and its trend against the week before. With
+FORECAST_MODE=global a single GlobalDemandModel covers the whole catalog
+instead, adding item and category encodings and predicting every item's
+next FORECAST_HORIZON_DAYS in one call. Models are
+trained by the analytics refresh (InventoryAnalytics.train_forecast_models),
+saved as numbered versions in a ModelStore on disk, and loaded through an
+in-memory LRU cache, so serving a prediction never trains anything.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from .config import settings
+from .lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+ensemble = lazy_import("sklearn.ensemble")
+joblib = lazy_import("joblib")
+
+# Bump when the features change: models trained on other features are retrained
+FEATURE_VERSION = 2
+
+# Days of history each prediction looks at
+LOOKBACK_DAYS = 14
+
+# Days with any consumption a category needs before a model is trained for it
+MIN_TRAINING_DAYS = 28
+
+# Fraction of the training days (the most recent) held out to measure accuracy
+HOLDOUT_FRACTION = 0.2
+
+# Store key of the catalog-wide model
+GLOBAL_MODEL_KEY = "global"
+
+def model_key(category_id: Optional[int]) -> str:
+    """Store key of the model that forecasts items in this category"""
+    if settings.FORECAST_MODE == "global":
+        return GLOBAL_MODEL_KEY
+    return f"category-{category_id if category_id is not None else 'none'}"
+
+def daily_consumption_matrix(usage, start: date, end: date) -> Tuple[List[int], "np.ndarray"]:
+    """Pivot usage intervals into an items x days matrix of consumption.
+
+    usage has item_id, date (of the interval's closing count) and consumption,
+    see InventoryAnalytics.load_usage_frame. Consumption on a day is the
+    stock used over the intervals ending on it; days without counts are zero.
+    Returns (item ids, matrix) with one column per day from start to end
+    inclusive.
+    """
+    days = pd.date_range(start, end, freq="D")
+    if usage.empty:
+        return [], np.zeros((0, len(days)))
+
+    daily = usage.assign(day=pd.to_datetime(usage["date"]).dt.normalize())
+    matrix = daily.pivot_table(index="item_id", columns="day", values="consumption", aggfunc="sum")
+    matrix = matrix.reindex(columns=days, fill_value=0).fillna(0)
+    return [int(item_id) for item_id in matrix.index], matrix.to_numpy(dtype=float)
+
+def rollup_consumption_matrix(rollups, start: date, end: date) -> Tuple[List[int], "np.ndarray"]:
+    """Same as daily_consumption_matrix, from item_daily_rollups rows"""
+    days = pd.date_range(start, end, freq="D")
+    if rollups.empty:
+        return [], np.zeros((0, len(days)))
+
+    matrix = rollups.assign(day=pd.to_datetime(rollups["day"])).pivot_table(
+        index="item_id", columns="day", values="consumption", aggfunc="sum"
+    )
+    matrix = matrix.reindex(columns=days, fill_value=0).fillna(0)
+    return [int(item_id) for item_id in matrix.index], matrix.to_numpy(dtype=float)
+
+def window_features(windows: "np.ndarray", weekdays: "np.ndarray") -> "np.ndarray":
+    """Feature rows from LOOKBACK_DAYS-long consumption windows and the target day's weekday"""
+    recent = windows[:, -7:].mean(axis=1)
+    previous = windows[:, -14:-7].mean(axis=1)
+    return np.column_stack([
+        np.eye(7)[weekdays],
+        windows[:, -1],
+        windows[:, -7],
+        recent,
+        recent - previous
+    ])
+
+def training_set(matrix: "np.ndarray", start: date) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+    """(features, targets, day positions) for every item-day with a full lookback window"""
+    windows = np.lib.stride_tricks.sliding_window_view(matrix, LOOKBACK_DAYS + 1, axis=1)
+    n_items, n_positions, _ = windows.shape
+    windows = windows.reshape(n_items * n_positions, LOOKBACK_DAYS + 1)
+
+    positions = np.tile(np.arange(n_positions), n_items)
+    weekdays = (start.weekday() + LOOKBACK_DAYS + positions) % 7
+    return window_features(windows[:, :-1], weekdays), windows[:, -1], positions
+
+def train(matrix: "np.ndarray", start: date) -> Tuple[object, Optional[float], int]:
+    """Fit a model on a consumption matrix, returning (model, accuracy, training rows).
+
+    Accuracy is 1 - weighted absolute percentage error on the most recent
+    HOLDOUT_FRACTION of days (None when nothing was consumed in them); the
+    returned model is then refit on every day.
+    """
+    features, targets, positions = training_set(matrix, start)
+
+    def fit(rows):
+        model = ensemble.RandomForestRegressor(
+            n_estimators=50, max_depth=8, min_samples_leaf=3, random_state=0, n_jobs=1
+        )
+        return model.fit(features[rows], targets[rows])
+
+    cutoff = positions.max() - max(1, int((positions.max() + 1) * HOLDOUT_FRACTION))
+    train_rows, holdout_rows = positions <= cutoff, positions > cutoff
+
+    accuracy = None
+    actual = targets[holdout_rows]
+    if train_rows.any() and actual.sum() > 0:
+        predicted = fit(train_rows).predict(features[holdout_rows])
+        accuracy = max(0.0, 1.0 - float(np.abs(predicted - actual).sum() / actual.sum()))
+
+    return fit(np.ones(len(targets), dtype=bool)), accuracy, len(targets)
+
+def forecast(model, matrix: "np.ndarray", first_day: date, horizon: int) -> "np.ndarray":
+    """Predicted consumption for each of the next horizon days (rows x horizon).
+
+    matrix holds at least the last LOOKBACK_DAYS days before first_day. Each
+    day is predicted for all rows in one call and fed back as history for
+    the next.
+    """
+    history = matrix[:, -LOOKBACK_DAYS:]
+    predictions = []
+    for step in range(horizon):
+        weekday = (first_day + timedelta(days=step)).weekday()
+        predicted = np.clip(model.predict(window_features(history, np.full(len(history), weekday))), 0, None)
+        predictions.append(predicted)
+        history = np.column_stack([history[:, 1:], predicted])
+    return np.column_stack(predictions)
+
+class GlobalDemandModel:
+    """One model for the whole catalog, predicting the next horizon days jointly.
+
+    Window features are extended with item and category encodings: the
+    category one-hot (categories seen in training), the item's and its
+    category's mean daily consumption over the training days (falling back to
+    the category, then catalog mean for unseen items), the restock threshold
+    and the unit cost. The horizon days are a multi-output target, so the
+    whole catalog is forecast with a single predict call.
+    """
+    # Rows each tree samples, to bound training time on large catalogs
+    MAX_SAMPLES = 50_000
+
+    def __init__(self, horizon: int):
+        self.horizon = horizon
+        self.categories: List[Optional[int]] = []
+        self.item_means: Dict[int, float] = {}
+        self.category_means: Dict[Optional[int], float] = {}
+        self.catalog_mean = 0.0
+        self.regressor = None
+
+    def _fit_encodings(self, matrix: "np.ndarray", items: List):
+        item_means = matrix.mean(axis=1)
+        self.catalog_mean = float(item_means.mean())
+        self.item_means = {item.id: float(mean) for item, mean in zip(items, item_means)}
+        by_category: Dict[Optional[int], List[float]] = {}
+        for item, mean in zip(items, item_means):
+            by_category.setdefault(item.category_id, []).append(mean)
+        self.category_means = {category_id: float(np.mean(means)) for category_id, means in by_category.items()}
+        self.categories = list(by_category)
+
+    def encode(self, items: List) -> "np.ndarray":
+        """Encoding rows for Item-like objects (id, category_id, restock_threshold, cost_per_unit)"""
+        columns = {category_id: column for column, category_id in enumerate(self.categories)}
+        encodings = np.zeros((len(items), len(self.categories) + 4))
+        for row, item in enumerate(items):
+            if item.category_id in columns:
+                encodings[row, columns[item.category_id]] = 1
+            category_mean = self.category_means.get(item.category_id, self.catalog_mean)
+            encodings[row, -4] = self.item_means.get(item.id, category_mean)
+            encodings[row, -3] = category_mean
+            encodings[row, -2] = item.restock_threshold or 0
+            encodings[row, -1] = item.cost_per_unit if item.cost_per_unit is not None else -1
+        return encodings
+
+    def fit(self, matrix: "np.ndarray", start: date, items: List) -> Tuple[Optional[float], int]:
+        """Fit on a consumption matrix with one row per item, returning (accuracy, training rows).
+
+        Accuracy is measured as in train(), with encodings fit on the days
+        before the holdout only.
+        """
+        span = LOOKBACK_DAYS + self.horizon
+        windows = np.lib.stride_tricks.sliding_window_view(matrix, span, axis=1)
+        n_items, n_positions, _ = windows.shape
+        windows = windows.reshape(n_items * n_positions, span)
+        positions = np.tile(np.arange(n_positions), n_items)
+        item_rows = np.repeat(np.arange(n_items), n_positions)
+        weekdays = (start.weekday() + LOOKBACK_DAYS + positions) % 7
+        base = window_features(windows[:, :LOOKBACK_DAYS], weekdays)
+        targets = windows[:, LOOKBACK_DAYS:]
+
+        def fit(rows, encoding_days: int):
+            self._fit_encodings(matrix[:, :encoding_days], items)
+            features = np.column_stack([base[rows], self.encode(items)[item_rows[rows]]])
+            self.regressor = ensemble.RandomForestRegressor(
+                n_estimators=50, max_depth=10, min_samples_leaf=5, random_state=0, n_jobs=1,
+                max_samples=min(1.0, self.MAX_SAMPLES / max(1, rows.sum()))
+            ).fit(features, targets[rows])
+
+        # Training targets end before the holdout windows start
+        cutoff = positions.max() - max(1, int((positions.max() + 1) * HOLDOUT_FRACTION))
+        train_rows, holdout_rows = positions <= cutoff - self.horizon, positions > cutoff
+
+        accuracy = None
+        actual = targets[holdout_rows]
+        if train_rows.any() and actual.sum() > 0:
+            fit(train_rows, cutoff + LOOKBACK_DAYS)
+            features = np.column_stack([base[holdout_rows], self.encode(items)[item_rows[holdout_rows]]])
+            predicted = self.regressor.predict(features).reshape(actual.shape)
+            accuracy = max(0.0, 1.0 - float(np.abs(predicted - actual).sum() / actual.sum()))
+
+        fit(np.ones(len(targets), dtype=bool), matrix.shape[1])
+        return accuracy, len(targets)
+
+    def predict_demand(self, matrix: "np.ndarray", items: List, first_day: date) -> "np.ndarray":
+        """Consumption for each of the next horizon days (rows x horizon), in one predict call"""
+        history = matrix[:, -LOOKBACK_DAYS:]
+        features = np.column_stack([
+            window_features(history, np.full(len(history), first_day.weekday())),
+            self.encode(items)
+        ])
+        return np.clip(self.regressor.predict(features).reshape(len(history), self.horizon), 0, None)
+
+class ModelStore:
+    """Versioned models on disk: <root>/<key>/v<version>.joblib plus metadata.json for the latest"""
+    def __init__(self, root: str, keep_versions: int = 3):
+        self.root = root
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+
+    def _path(self, key: str, name: str) -> str:
+        return os.path.join(self.root, key, name)
+
+    def latest(self, key: str) -> Optional[Dict]:
+        """Metadata of the latest version of key, or None"""
+        try:
+            with open(self._path(key, "metadata.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, key: str, version: int):
+        return joblib.load(self._path(key, f"v{version}.joblib"))
+
+    def save(self, key: str, model, metadata: Dict) -> Dict:
+        """Write model as the next version of key and return its metadata"""
+        with self._lock:
+            os.makedirs(os.path.join(self.root, key), exist_ok=True)
+            previous = self.latest(key)
+            version = previous["version"] + 1 if previous else 1
+            metadata = {**metadata, "key": key, "version": version}
+
+            # Write then rename, so readers never see a partial file
+            model_path = self._path(key, f"v{version}.joblib")
+            joblib.dump(model, model_path + ".tmp")
+            os.replace(model_path + ".tmp", model_path)
+            metadata_path = self._path(key, "metadata.json")
+            with open(metadata_path + ".tmp", "w") as f:
+                json.dump(metadata, f, indent=2)
+            os.replace(metadata_path + ".tmp", metadata_path)
+
+            for old in range(1, version - self.keep_versions + 1):
+                try:
+                    os.remove(self._path(key, f"v{old}.joblib"))
+                except OSError:
+                    pass
+            return metadata
+
+class ModelCache:
+    """LRU cache of loaded models, keyed by (key, version)"""
+    def __init__(self, store: ModelStore, capacity: int):
+        self.store = store
+        self.capacity = capacity
+        self._models: "OrderedDict[Tuple[str, int], object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Tuple[Optional[object], Optional[Dict]]:
+        """(model, metadata) of the latest version of key, or (None, None)"""
+        metadata = self.store.latest(key)
+        if metadata is None:
+            return None, None
+
+        cache_key = (key, metadata["version"])
+        with self._lock:
+            if cache_key in self._models:
+                self._models.move_to_end(cache_key)
+                self.hits += 1
+                return self._models[cache_key], metadata
+            self.misses += 1
+
+        try:
+            model = self.store.load(key, metadata["version"])
+        except (OSError, EOFError):
+            return None, None
+        self.put(key, metadata["version"], model)
+        return model, metadata
+
+    def put(self, key: str, version: int, model):
+        with self._lock:
+            self._models[(key, version)] = model
+            self._models.move_to_end((key, version))
+            while len(self._models) > self.capacity:
+                self._models.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._models), "hits": self.hits, "misses": self.misses}
+
+def needs_training(metadata: Optional[Dict], new_rows: int) -> bool:
+    """Whether a model should be retrained, given history rows added since it was"""
+    if metadata is None or metadata.get("feature_version") != FEATURE_VERSION:
+        return True
+    if metadata.get("horizon", settings.FORECAST_HORIZON_DAYS) != settings.FORECAST_HORIZON_DAYS:
+        return True
+    trained_at = datetime.fromisoformat(metadata["trained_at"])
+    if datetime.now(timezone.utc) - trained_at > timedelta(days=settings.FORECAST_MAX_MODEL_AGE_DAYS):
+        return True
+    return new_rows >= max(1, settings.FORECAST_RETRAIN_FRACTION * metadata.get("history_rows", 0))
+
+model_store = ModelStore(settings.MODEL_STORE_DIR)
+model_cache = ModelCache(model_store, settings.MODEL_CACHE_SIZE)
@@ -0,0 +1,225 @@
+"""
+Bulk ingestion of stock counts, sales and restocks.
+
+A batch is a JSON array of row objects or a CSV file with a header row. Each
+row is validated on its own and bad rows are reported by index instead of
+failing the batch. CSV columns that aren't fields of the row kind (such as an
+item_name column in an export) are ignored and listed once in the result. The remaining rows are written in one transaction with a
+fixed number of statements: one query checks every item id, one INSERT
+(COPY on PostgreSQL with psycopg2) writes the history, one UPDATE applies the
+item changes, and rollups and Holt-Winters states are updated per batch.
+Like the single-row routes, every row in a batch is dated when it arrives.
+"""
+import csv
+import io
+import json
+import math
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+from fastapi import HTTPException, Request
+from sqlalchemy import case, insert, or_, update
+from sqlalchemy.orm import Session
+from . import events, models, rollups, smoothing
+from .config import settings
+
+# Accepted fields per kind of row: name -> (type, required)
+STOCK_FIELDS = {"item_id": (int, True), "quantity": (float, True), "notes": (str, False), "staff_name": (str, False)}
+SALE_FIELDS = {"item_id": (int, True), "quantity_sold": (float, True), "revenue": (float, False), "notes": (str, False)}
+RESTOCK_FIELDS = {
+    "item_id": (int, True), "restock_amount": (float, True), "supplier": (str, False), "notes": (str, False)
+}
+
+# Quantities and amounts can't be negative; revenue can (refunds), as in the single-row routes
+NON_NEGATIVE_FIELDS = {"quantity", "quantity_sold", "restock_amount"}
+
+async def read_batch(request: Request) -> List[Dict]:
+    """Rows of a bulk request: a JSON array, a text/csv body, or a CSV upload in the "file" form field"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Upload the CSV in a \"file\" form field")
+        rows = _parse_csv(await upload.read())
+    elif content_type.startswith("text/csv"):
+        rows = _parse_csv(await request.body())
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of rows or CSV")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array of rows or CSV")
+
+    if len(rows) > settings.BULK_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BULK_MAX_ROWS} rows per batch")
+    return rows
+
+class CsvRows(list):
+    """Rows of a CSV batch, remembering the header's columns"""
+    def __init__(self, rows: List[Dict], columns: List[str]):
+        super().__init__(rows)
+        self.columns = columns
+
+def _parse_csv(data: bytes) -> CsvRows:
+    try:
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+        return CsvRows(list(reader), reader.fieldnames or [])
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}")
+
+def _clean_row(row, fields: Dict) -> Dict:
+    """Row with every field converted to its type, or ValueError naming the problem"""
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    if None in row:
+        # csv.DictReader's key for values beyond the header
+        raise ValueError("more values than header columns")
+    unknown = set(row) - set(fields)
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(sorted(map(str, unknown)))}")
+
+    clean = {}
+    for name, (kind, required) in fields.items():
+        value = row.get(name)
+        if value is None or value == "":
+            if required:
+                raise ValueError(f"{name} is required")
+            clean[name] = None
+            continue
+        try:
+            if kind is int and isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            clean[name] = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be {'an integer' if kind is int else 'a number' if kind is float else 'text'}")
+        if kind is float and not math.isfinite(clean[name]):
+            raise ValueError(f"{name} must be a finite number")
+        if name in NON_NEGATIVE_FIELDS and clean[name] < 0:
+            raise ValueError(f"{name} must be a non-negative number")
+    return clean
+
+def _validate(db: Session, rows: List, fields: Dict) -> Tuple[List[Dict], List[Dict], List[str]]:
+    """(valid rows, errors, ignored CSV columns) with every item id checked in one query"""
+    ignored = sorted(set(rows.columns) - set(fields)) if isinstance(rows, CsvRows) else []
+    cleaned, errors = [], []
+    for index, row in enumerate(rows):
+        if ignored:
+            row = {name: value for name, value in row.items() if name not in ignored}
+        try:
+            cleaned.append((index, _clean_row(row, fields)))
+        except ValueError as e:
+            errors.append({"index": index, "error": str(e)})
+
+    item_ids = {row["item_id"] for _, row in cleaned}
+    known = {item_id for (item_id,) in db.query(models.Item.id).filter(models.Item.id.in_(item_ids))} if item_ids else set()
+    valid = []
+    for index, row in cleaned:
+        if row["item_id"] in known:
+            valid.append(row)
+        else:
+            errors.append({"index": index, "error": "Item not found"})
+    errors.sort(key=lambda error: error["index"])
+    return valid, errors, ignored
+
+def _insert_rows(db: Session, model, rows: List[Dict]):
+    """Insert rows with COPY on PostgreSQL/psycopg2, else one executemany INSERT"""
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql" and bind.dialect.driver == "psycopg2":
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([
+                row[column].isoformat() if isinstance(row[column], datetime) else row[column]
+                for column in columns
+            ])
+        buffer.seek(0)
+        cursor = db.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+        finally:
+            cursor.close()
+        # COPY bypasses the ORM, so flag the write for the analytics cache (see cache)
+        db.info["analytics_changed"] = True
+        return
+    db.execute(insert(model), rows)
+
+def _result(rows: List, entries: List[Dict], errors: List[Dict], ignored: List[str]) -> Dict:
+    return {"received": len(rows), "inserted": len(entries), "errors": errors, "ignored_columns": ignored}
+
+def ingest_stock_counts(db: Session, rows: List) -> Dict:
+    """Insert a batch of stock counts and set each item's quantity to its last count"""
+    valid, errors, ignored = _validate(db, rows, STOCK_FIELDS)
+    if valid:
+        now = datetime.now(timezone.utc)
+        entries = [{**row, "date": now} for row in valid]
+        _insert_rows(db, models.StockHistory, entries)
+        rollups.record_stock_counts(db, entries)
+        smoothing.record_batch(db, events.COUNT, entries)
+
+        latest = {entry["item_id"]: entry["quantity"] for entry in entries}
+        db.execute(
+            update(models.Item).where(models.Item.id.in_(latest)).values(
+                quantity=case(latest, value=models.Item.id), updated_at=now
+            )
+        )
+    db.commit()
+    return _result(rows, valid, errors, ignored)
+
+def write_sales(db: Session, entries: List[Dict]):
+    """Insert dated sales of known items and move each item's last sale date to its latest one"""
+    _insert_rows(db, models.SalesHistory, entries)
+    by_day: Dict = {}
+    for entry in entries:
+        by_day.setdefault(rollups.day_of(entry["date"]), []).append(entry)
+    for day_entries in by_day.values():
+        rollups.record_sales(db, day_entries)
+    smoothing.record_batch(db, events.SALE, entries)
+
+    latest: Dict[int, datetime] = {}
+    for entry in entries:
+        if entry["item_id"] not in latest or entry["date"] > latest[entry["item_id"]]:
+            latest[entry["item_id"]] = entry["date"]
+    # Never move a date back: spooled sales can be committed after newer ones
+    sale_date = case(latest, value=models.Item.id)
+    db.execute(
+        update(models.Item).where(models.Item.id.in_(latest)).values(
+            last_sale_date=case(
+                (or_(models.Item.last_sale_date.is_(None), models.Item.last_sale_date < sale_date), sale_date),
+                else_=models.Item.last_sale_date
+            )
+        )
+    )
+
+def ingest_sales(db: Session, rows: List) -> Dict:
+    """Insert a batch of sales and set the items' last sale date"""
+    valid, errors, ignored = _validate(db, rows, SALE_FIELDS)
+    if valid:
+        now = datetime.now(timezone.utc)
+        write_sales(db, [{**row, "date": now} for row in valid])
+    db.commit()
+    return _result(rows, valid, errors, ignored)
+
+def ingest_restocks(db: Session, rows: List) -> Dict:
+    """Insert a batch of restocks and add them to the items' quantities"""
+    valid, errors, ignored = _validate(db, rows, RESTOCK_FIELDS)
+    if valid:
+        now = datetime.now(timezone.utc)
+        entries = [{**row, "date": now} for row in valid]
+        _insert_rows(db, models.RestockHistory, entries)
+        rollups.record_restocks(db, entries)
+        smoothing.record_batch(db, events.RESTOCK, entries)
+
+        added: Dict[int, float] = {}
+        for entry in entries:
+            added[entry["item_id"]] = added.get(entry["item_id"], 0.0) + entry["restock_amount"]
+        db.execute(
+            update(models.Item).where(models.Item.id.in_(added)).values(
+                quantity=models.Item.quantity + case(added, value=models.Item.id)
+            )
+        )
+    db.commit()
+    return _result(rows, valid, errors, ignored)
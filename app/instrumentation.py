@@ -0,0 +1,94 @@
+"""
+Per-request SQL instrumentation.
+
+Engine event hooks (installed by database.py) record every statement into the
+QueryStats of the current request, which the middleware in main.py creates and
+reports as response headers and log lines. Work outside a request (background
+jobs, scripts) is not recorded.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+
+logger = logging.getLogger("stocker.sql")
+
+current_stats: ContextVar[Optional["QueryStats"]] = ContextVar("current_stats", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*(?:\?|%\(\w+\)s|:\w+|\$\d+|'[^']*'|-?\d+(?:\.\d+)?)\s*,?)+\)", re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+
+def normalize_statement(statement: str) -> str:
+    """Collapse literals and IN lists so repeated queries share one shape"""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _IN_LIST.sub("IN (...)", statement)
+
+class QueryStats:
+    """Statements executed while handling one request"""
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes: Counter = Counter()
+        self._timings: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        shape = normalize_statement(statement)
+        self.shapes[shape] += 1
+        self._timings.append((seconds, shape))
+
+    def slowest(self, limit: int = None) -> List[Tuple[float, str]]:
+        limit = settings.SQL_SLOWEST_STATEMENTS if limit is None else limit
+        return sorted(self._timings, key=lambda timing: timing[0], reverse=True)[:limit]
+
+    def n_plus_one(self, threshold: int = None) -> Dict[str, int]:
+        """Statement shapes repeated more than threshold times"""
+        threshold = settings.N_PLUS_ONE_THRESHOLD if threshold is None else threshold
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+def instrument_engine(engine: Engine):
+    """Time every statement on engine and attribute it to the current request"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if current_stats.get() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stats = current_stats.get()
+        if stats is not None and conn.info.get("query_started"):
+            stats.record(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+def report(stats: QueryStats, method: str, path: str) -> Dict[str, str]:
+    """Log the request's query profile and return the response headers for it"""
+    repeated = stats.n_plus_one()
+    for shape, count in repeated.items():
+        logger.warning("Possible N+1 in %s %s: %d x %s", method, path, count, shape)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "%s %s: %d statements, %.1f ms in DB; slowest: %s",
+            method, path, stats.count, stats.total_seconds * 1000,
+            "; ".join(f"{seconds * 1000:.1f} ms {shape}" for seconds, shape in stats.slowest())
+        )
+
+    return {
+        "X-DB-Statements": str(stats.count),
+        "X-DB-Time-Ms": f"{stats.total_seconds * 1000:.1f}",
+        "X-DB-N-Plus-One": str(len(repeated))
+    }
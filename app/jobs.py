@@ -0,0 +1,220 @@
+"""
+Background analytics refresh jobs.
+
+A refresh runs in a daemon thread of the worker that started it and is
+recorded in the analytics_jobs table, so any worker can report its status.
+RefreshLock keeps refreshes single-flight across workers: a PostgreSQL
+advisory lock when available, otherwise an exclusive lock on
+settings.ANALYTICS_LOCK_FILE.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from sqlalchemy import text
+from . import metrics, models, smoothing
+from .config import settings
+from .database import SessionLocal, engine
+from .ml_analytics import InventoryAnalytics
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a per-process lock
+    fcntl = None
+
+# Arbitrary application-wide key for pg_try_advisory_lock
+ADVISORY_LOCK_KEY = 73_560_001
+
+# Seconds between progress writes to the analytics_jobs row
+PROGRESS_WRITE_INTERVAL = 2.0
+
+class RefreshLock:
+    """Non-blocking mutex shared by every worker using the same database"""
+    _process_lock = threading.Lock()
+
+    def __init__(self):
+        self._connection = None
+        self._file = None
+        self._holds_process_lock = False
+
+    def acquire(self) -> bool:
+        if engine.dialect.name == "postgresql":
+            self._connection = engine.connect()
+            acquired = self._connection.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY}
+            ).scalar()
+            if not acquired:
+                self._connection.close()
+                self._connection = None
+            return bool(acquired)
+
+        if fcntl is not None:
+            self._file = open(settings.ANALYTICS_LOCK_FILE, "a")
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except OSError:
+                self._file.close()
+                self._file = None
+                return False
+
+        self._holds_process_lock = self._process_lock.acquire(blocking=False)
+        return self._holds_process_lock
+
+    def release(self):
+        if self._connection is not None:
+            self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            self._connection.close()
+            self._connection = None
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        if self._holds_process_lock:
+            self._process_lock.release()
+            self._holds_process_lock = False
+
+# Live progress of jobs running in this process, by job id
+_running: Dict[int, Dict] = {}
+
+def start_refresh(trigger: str = "manual", incremental: bool = False) -> Optional[int]:
+    """Start an analytics refresh in the background and return its job id.
+
+    Returns None if another refresh is already running in any worker.
+    """
+    lock = RefreshLock()
+    if not lock.acquire():
+        return None
+
+    db = SessionLocal()
+    try:
+        # We hold the lock, so any job still marked running was interrupted
+        db.query(models.AnalyticsJob).filter(models.AnalyticsJob.status == "running").update(
+            {"status": "failed", "error": "Interrupted"}, synchronize_session=False
+        )
+        job = models.AnalyticsJob(trigger=trigger, incremental=incremental, status="running")
+        db.add(job)
+        db.commit()
+        job_id = job.id
+    except Exception:
+        db.rollback()
+        lock.release()
+        raise
+    finally:
+        db.close()
+
+    _running[job_id] = {"items_done": 0, "items_total": None, "started": time.monotonic(), "trigger": trigger}
+    threading.Thread(
+        target=_run_refresh, args=(job_id, incremental, lock), name=f"analytics-job-{job_id}", daemon=True
+    ).start()
+    return job_id
+
+def _run_refresh(job_id: int, incremental: bool, lock: RefreshLock):
+    db = SessionLocal()
+    status_db = SessionLocal()
+    state = _running[job_id]
+    # SQLite allows one writer, and the analytics session holds the write lock
+    # until it commits, so only persist progress where writers can interleave
+    persist_progress = engine.dialect.name != "sqlite"
+    last_write = 0.0
+
+    def progress(done: int, total: int):
+        nonlocal last_write
+        state["items_done"] = done
+        state["items_total"] = total
+        if persist_progress and time.monotonic() - last_write >= PROGRESS_WRITE_INTERVAL:
+            status_db.query(models.AnalyticsJob).filter(models.AnalyticsJob.id == job_id).update(
+                {"items_done": done, "items_total": total}, synchronize_session=False
+            )
+            status_db.commit()
+            last_write = time.monotonic()
+
+    trigger = state["trigger"]
+    status, result, error = "succeeded", None, None
+    try:
+        # Forecast states whose history was edited since the last refresh
+        rebuilt = smoothing.rebuild_stale_states(db)
+        db.commit()
+        result = InventoryAnalytics(db).update_analytics_for_all_items(incremental=incremental, progress=progress)
+        if rebuilt:
+            result["forecast_states_rebuilt"] = rebuilt
+    except Exception as e:
+        db.rollback()
+        status, error = "failed", str(e)
+    finally:
+        db.close()
+        try:
+            job = status_db.query(models.AnalyticsJob).filter(models.AnalyticsJob.id == job_id).first()
+            job.status = status
+            job.result = result
+            job.error = error
+            job.items_done = state["items_done"]
+            job.items_total = state["items_total"]
+            job.finished_at = datetime.now(timezone.utc)
+            job.duration_seconds = time.monotonic() - state["started"]
+            status_db.commit()
+        finally:
+            metrics.analytics_job_duration_seconds.observe((trigger, status), time.monotonic() - state["started"])
+            status_db.close()
+            _running.pop(job_id, None)
+            lock.release()
+
+def running_job_id() -> Optional[int]:
+    """Id of the refresh currently marked running, if any"""
+    db = SessionLocal()
+    try:
+        job = db.query(models.AnalyticsJob).filter(
+            models.AnalyticsJob.status == "running"
+        ).order_by(models.AnalyticsJob.id.desc()).first()
+        return job.id if job else None
+    finally:
+        db.close()
+
+def job_status(job: models.AnalyticsJob) -> Dict:
+    """Serialize a job, overlaying live progress when it runs in this process"""
+    state = _running.get(job.id)
+    if state:
+        items_done, items_total = state["items_done"], state["items_total"]
+        duration = time.monotonic() - state["started"]
+    else:
+        items_done, items_total = job.items_done, job.items_total
+        duration = job.duration_seconds
+
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "trigger": job.trigger,
+        "incremental": job.incremental,
+        "status": job.status,
+        "items_done": items_done,
+        "items_total": items_total,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+        "duration_seconds": duration,
+        "result": job.result,
+        "error": job.error
+    }
+
+class RefreshScheduler:
+    """Starts an incremental refresh every interval seconds.
+
+    Every worker runs one; RefreshLock makes all but one skip each tick.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="analytics-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                start_refresh(trigger="scheduled", incremental=True)
+            except Exception:
+                continue  # Try again next tick
@@ -0,0 +1,63 @@
+"""
+Deferred imports for the ML stack.
+
+pandas, NumPy and scikit-learn take seconds and tens of MB to import, and only
+the analytics routes and jobs need them. lazy_import() returns a stand-in that
+imports the real module on first attribute access, so workers that only serve
+CRUD routes never load them. Set ANALYTICS_PRELOAD=true on workers dedicated
+to analytics to pay the cost at startup instead of on the first request.
+"""
+import importlib
+import logging
+import threading
+import time
+from types import ModuleType
+from typing import Dict, List
+
+logger = logging.getLogger("stocker.startup")
+
+# Modules the analytics engine loads lazily
+ML_MODULES = ("numpy", "pandas", "sklearn.preprocessing")
+
+# Seconds each lazily loaded module took to import, in load order
+load_times: Dict[str, float] = {}
+
+_lock = threading.Lock()
+_modules: Dict[str, "LazyModule"] = {}
+
+class LazyModule:
+    """Module stand-in that imports the named module on first attribute access"""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    load_times[self._name] = time.perf_counter() - started
+                    logger.info("Loaded %s in %.0f ms", self._name, load_times[self._name] * 1000)
+                    self._module = module
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+    """Shared stand-in for the named module"""
+    with _lock:
+        if name not in _modules:
+            _modules[name] = LazyModule(name)
+        return _modules[name]
+
+def preload(names: List[str] = ML_MODULES) -> Dict[str, float]:
+    """Import modules now (e.g. at startup of an analytics worker) and return their load times"""
+    for name in names:
+        lazy_import(name)._load()
+    return dict(load_times)
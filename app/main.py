@@ -1,8 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from . import models
+from fastapi.responses import PlainTextResponse
+from . import instrumentation, metrics, migrations, retention, sales_buffer
+from .config import settings
 from .database import engine
-from .routes import categories, items, stock_history, restock_history, analytics, auth
+from .jobs import RefreshScheduler
+from .lazy_imports import preload
+from .routes import categories, items, stock_history, restock_history, analytics, auth, exports
 
 app = FastAPI()
 
@@ -13,9 +17,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=[
+        "X-DB-Statements", "X-DB-Time-Ms", "X-DB-N-Plus-One",  # SQL instrumentation
+        "X-Next-Cursor", "Link"  # Pagination
+    ],
 )
 
-models.Base.metadata.create_all(bind=engine)
+# Per-request SQL statement count, DB time and N+1 detection
+if settings.SQL_INSTRUMENTATION:
+    @app.middleware("http")
+    async def sql_instrumentation(request: Request, call_next):
+        stats = instrumentation.QueryStats()
+        token = instrumentation.current_stats.set(stats)
+        try:
+            response = await call_next(request)
+        finally:
+            instrumentation.current_stats.reset(token)
+        response.headers.update(instrumentation.report(stats, request.method, request.url.path))
+        return response
+
+# Per-route request counts, latency and in-flight requests for /metrics
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Runs before the other startup hooks, which may read the database
+@app.on_event("startup")
+def migrate_database():
+    if settings.AUTO_MIGRATE:
+        migrations.upgrade(engine, startup=True)
+    retention.maintain_partitions(engine)
 
 app.include_router(categories.router)
 app.include_router(items.router)
@@ -23,6 +53,39 @@ app.include_router(stock_history.router)
 app.include_router(restock_history.router)
 app.include_router(analytics.router)
 app.include_router(auth.router)
+app.include_router(exports.router)
+
+# Periodic incremental analytics refresh (off unless ANALYTICS_REFRESH_INTERVAL is set)
+scheduler = RefreshScheduler(settings.ANALYTICS_REFRESH_INTERVAL)
+
+@app.on_event("startup")
+def preload_analytics():
+    if settings.ANALYTICS_PRELOAD:
+        preload()
+
+@app.on_event("startup")
+def start_scheduler():
+    if settings.ANALYTICS_REFRESH_INTERVAL > 0:
+        scheduler.start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    scheduler.stop()
+
+# Write-behind sales logging (off unless SALES_BUFFER_ENABLED is set)
+@app.on_event("startup")
+def start_sales_buffer():
+    if settings.SALES_BUFFER_ENABLED:
+        sales_buffer.start()
+
+@app.on_event("shutdown")
+def stop_sales_buffer():
+    sales_buffer.stop()
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics for this worker"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/")
 def home():
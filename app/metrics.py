@@ -0,0 +1,199 @@
+"""
+Prometheus metrics for the API.
+
+MetricsMiddleware records per-route request counts, latency histograms and
+in-flight gauges; jobs.py records analytics job durations; DB pool gauges are
+read from the engine at scrape time. render() produces the Prometheus text
+exposition format served at /metrics. Metrics are per process, so with several
+workers each one reports its own series.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Tuple
+from .database import engine
+
+# Latency buckets in seconds (Prometheus client defaults)
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+# Route label for requests that match no route, so 404 scans don't create new series
+UNMATCHED_ROUTE = "unmatched"
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Labels):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    def dec(self, labels: Labels, amount: float = 1):
+        self.inc(labels, -amount)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, label_names: Labels, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        # Per label set: [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Labels, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+http_requests_total = Counter(
+    "stocker_http_requests_total", "HTTP requests by route, method and status", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "stocker_http_request_duration_seconds", "HTTP request latency by route and method", ("method", "route"),
+    REQUEST_BUCKETS
+)
+http_requests_in_flight = Gauge(
+    "stocker_http_requests_in_flight", "HTTP requests currently being handled", ("method", "route")
+)
+analytics_job_duration_seconds = Histogram(
+    "stocker_analytics_job_duration_seconds", "Analytics refresh job duration by trigger and status",
+    ("trigger", "status"), JOB_BUCKETS
+)
+
+def _pool_metrics() -> List[str]:
+    """Connection pool gauges, read from the engine at scrape time"""
+    pool = engine.pool
+    readings = (
+        ("stocker_db_pool_size", "Configured connection pool size", "size"),
+        ("stocker_db_pool_checked_out", "Connections currently checked out of the pool", "checkedout"),
+        ("stocker_db_pool_checked_in", "Idle connections held in the pool", "checkedin"),
+        ("stocker_db_pool_overflow", "Connections open beyond the pool size", "overflow"),
+    )
+    lines = []
+    for name, help, method in readings:
+        # NullPool/StaticPool don't track these
+        reading = getattr(pool, method, None)
+        if reading is None:
+            continue
+        value = reading()
+        if method == "overflow":
+            value = max(0, value)  # QueuePool reports overflow as negative until the pool fills up
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+def render() -> str:
+    lines = []
+    for metric in (http_requests_total, http_request_duration_seconds, http_requests_in_flight,
+                   analytics_job_duration_seconds):
+        lines += metric.render()
+    lines += _pool_metrics()
+    return "\n".join(lines) + "\n"
+
+def _route_patterns(routes) -> List[Tuple[object, str]]:
+    """(compiled path regex, path template) for every route, in matching order"""
+    patterns = []
+    for route in routes:
+        # Newer FastAPI keeps included routers nested instead of copying their routes
+        effective_routes = getattr(route, "effective_route_contexts", None)
+        if effective_routes is not None:
+            patterns += [(context.path_regex, context.path_format) for context in effective_routes()]
+        elif getattr(route, "path_regex", None) is not None:
+            patterns.append((route.path_regex, route.path_format))
+    return patterns
+
+class MetricsMiddleware:
+    """ASGI middleware recording request metrics, labelled by route template.
+
+    Plain ASGI rather than @app.middleware("http") so the hot CRUD routes don't
+    pay for an extra request/response wrapper.
+    """
+    def __init__(self, app):
+        self.app = app
+        self._patterns = None
+
+    def _route(self, scope) -> str:
+        if self._patterns is None:
+            # Built on first request, once every router is registered
+            self._patterns = _route_patterns(scope["app"].router.routes)
+        path = scope["path"]
+        for regex, template in self._patterns:
+            if regex.match(path):
+                return template
+        return UNMATCHED_ROUTE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        labels = (scope["method"], self._route(scope))
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(labels)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_duration_seconds.observe(labels, time.perf_counter() - started)
+            http_requests_in_flight.dec(labels)
+            http_requests_total.inc((*labels, str(status)))
@@ -0,0 +1,182 @@
+"""
+Versioned schema migrations.
+
+MIGRATIONS is an ordered list of numbered steps and schema_migrations records
+the ones a database has applied, so upgrade() brings any database, fresh or
+live, to the current schema without dropping data. Version 1 creates the
+tables that don't exist yet from the models. A fresh database therefore gets
+the current schema in one step, so every later step must be idempotent
+(create only what's missing, see create_index).
+
+On PostgreSQL, non-transactional steps run in autocommit, which lets indexes
+on live tables be built with CREATE INDEX CONCURRENTLY without blocking
+writes. Workers starting together serialize on an advisory lock. Steps that
+rewrite whole tables (startup=False) are left to `python migrate.py`: the API
+skips them when it migrates on startup, so workers don't start behind them.
+
+To change the schema, edit the models and append a step here; never edit a
+step that has shipped. Run `python migrate.py` to apply pending steps and
+`python migrate.py status` to list them.
+"""
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple, Optional
+from sqlalchemy import Column, Index, func, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from . import models, retention
+
+logger = logging.getLogger("stocker.migrations")
+
+# pg_advisory_lock key held while migrating
+LOCK_KEY = 7_420_311
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+    transactional: bool = True  # False: run in autocommit (CREATE INDEX CONCURRENTLY)
+    startup: bool = True  # False: only applied by migrate.py, never on API startup
+
+def create_index(connection: Connection, index: Index):
+    """Create a model's index unless it exists, concurrently when the connection autocommits on PostgreSQL"""
+    table = index.table.name
+    if connection.dialect.name == "postgresql" and connection.get_isolation_level() == "AUTOCOMMIT":
+        # A failed concurrent build leaves an invalid index behind that IF NOT EXISTS would keep
+        invalid = connection.execute(text(
+            "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+            "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+        ), {"name": index.name}).first()
+        if invalid:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY {index.name}"))
+        columns = ", ".join(column.name for column in index.columns)
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table} ({columns})"))
+        return
+    if index.name not in {existing["name"] for existing in inspect(connection).get_indexes(table)}:
+        index.create(connection)
+
+def add_column(connection: Connection, column: Column):
+    """Add a model's column to its table unless it exists"""
+    table = column.table.name
+    if column.name in {existing["name"] for existing in inspect(connection).get_columns(table)}:
+        return
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+
+def _model_indexes(*names: str) -> List[Index]:
+    indexes = {index.name: index for table in models.Base.metadata.tables.values() for index in table.indexes}
+    return [indexes[name] for name in names]
+
+def _create_tables(connection: Connection):
+    models.Base.metadata.create_all(bind=connection)
+
+def _history_indexes(connection: Connection):
+    for index in _model_indexes(
+        "ix_stock_history_item_date", "ix_stock_history_date",
+        "ix_sales_history_item_date", "ix_sales_history_date",
+        "ix_restock_history_item_date", "ix_restock_history_date",
+        "ix_item_analytics_item_date", "ix_menu_optimization_item_date",
+    ):
+        create_index(connection, index)
+
+def _history_archives(connection: Connection):
+    models.Base.metadata.create_all(
+        bind=connection, tables=[models.HistoryArchive.__table__, models.StockCarryover.__table__]
+    )
+    add_column(connection, models.ItemDailyRollup.__table__.c.closing_quantity)
+
+    # Backfill each day's closing count from raw history
+    Rollup, StockHistory = models.ItemDailyRollup, models.StockHistory
+    last_count = select(StockHistory.quantity).where(
+        StockHistory.item_id == Rollup.item_id,
+        func.date(StockHistory.date) == Rollup.day
+    ).order_by(StockHistory.date.desc(), StockHistory.id.desc()).limit(1).scalar_subquery()
+    connection.execute(update(Rollup).where(
+        Rollup.stock_count > 0, Rollup.closing_quantity.is_(None)
+    ).values(closing_quantity=last_count))
+
+def _item_updated_at(connection: Connection):
+    add_column(connection, models.Item.__table__.c.updated_at)
+    # Unknown for existing items; now makes the next incremental refresh recompute them once
+    connection.execute(update(models.Item).where(models.Item.updated_at.is_(None)).values(
+        updated_at=datetime.now(timezone.utc)
+    ))
+
+def _forecast_state_stale(connection: Connection):
+    add_column(connection, models.ItemForecastState.__table__.c.stale)
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Create missing tables", _create_tables),
+    Migration(2, "Composite (item_id, date) and (date, id) history indexes", _history_indexes, transactional=False),
+    Migration(3, "History archives, stock carryovers and daily closing counts", _history_archives),
+    # Rewrites every history table under an exclusive lock
+    Migration(4, "Partition history tables by month (PostgreSQL)", retention.partition_history, startup=False),
+    Migration(5, "Item updated_at for incremental analytics", _item_updated_at),
+    Migration(6, "Forecast state stale flag", _forecast_state_stale),
+]
+
+def applied_versions(engine: Engine) -> List[int]:
+    with engine.connect() as connection:
+        if not inspect(connection).has_table(models.SchemaMigration.__tablename__):
+            return []
+        return [version for (version,) in connection.execute(
+            text(f"SELECT version FROM {models.SchemaMigration.__tablename__} ORDER BY version")
+        )]
+
+def pending(engine: Engine) -> List[Migration]:
+    applied = set(applied_versions(engine))
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+def _record(engine: Engine, migration: Migration, duration: float):
+    table = models.SchemaMigration.__table__
+    try:
+        with engine.begin() as connection:
+            connection.execute(table.insert().values(
+                version=migration.version, description=migration.description, duration_seconds=duration
+            ))
+    except IntegrityError:
+        # Another worker applied it too (only possible without the advisory lock)
+        pass
+
+def _apply(engine: Engine, migration: Migration):
+    logger.info("Applying migration %d: %s", migration.version, migration.description)
+    started = time.perf_counter()
+    if migration.transactional:
+        with engine.begin() as connection:
+            migration.upgrade(connection)
+    else:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            migration.upgrade(connection)
+    _record(engine, migration, time.perf_counter() - started)
+
+def upgrade(engine: Engine, target: Optional[int] = None, startup: bool = False) -> List[Migration]:
+    """Apply pending migrations up to target (default: all), returning the ones applied.
+
+    With startup, steps marked startup=False are skipped and stay pending.
+    """
+    models.Base.metadata.create_all(bind=engine, tables=[models.SchemaMigration.__table__])
+
+    lock = None
+    if engine.dialect.name == "postgresql":
+        lock = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock.execute(text("SELECT pg_advisory_lock(:key)"), {"key": LOCK_KEY})
+    try:
+        # Checked under the lock, so a worker that waited skips what another applied
+        applied = []
+        for migration in pending(engine):
+            if target is not None and migration.version > target:
+                break
+            if startup and not migration.startup:
+                logger.warning(
+                    "Skipping migration %d on startup (%s); run `python migrate.py` to apply it",
+                    migration.version, migration.description
+                )
+                continue
+            _apply(engine, migration)
+            applied.append(migration)
+        return applied
+    finally:
+        if lock is not None:
+            lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LOCK_KEY})
+            lock.close()
@@ -1,54 +1,622 @@
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from __future__ import annotations  # pd/np annotations must not trigger the lazy imports
+
+import inspect
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta, timezone
+from functools import wraps
+from types import SimpleNamespace
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+from sqlalchemy import func, insert, or_
 from sqlalchemy.orm import Session
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics import mean_absolute_error, r2_score
+from . import events, forecasting, retention, smoothing
+from .config import settings
+from .lazy_imports import lazy_import
 import warnings
 warnings.filterwarnings('ignore')
 
+# Loaded on first analytics use, see lazy_imports
+pd = lazy_import("pandas")
+np = lazy_import("numpy")
+preprocessing = lazy_import("sklearn.preprocessing")
+
+def memoized(method):
+    """Cache a per-item method on the instance, keyed by (method, item_id, window).
+    
+    The window is whatever arguments follow item_id (e.g. ``days``), with
+    defaults applied so ``f(1)`` and ``f(1, days=30)`` share an entry.
+    """
+    signature = inspect.signature(method)
+    
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        _, item_id, *window = bound.arguments.values()
+        key = (method.__name__, item_id, tuple(window) or None)
+        
+        if key in self._memo:
+            self._memo_hits += 1
+            return self._memo[key]
+        
+        self._memo_misses += 1
+        value = method(self, *args, **kwargs)
+        self._memo[key] = value
+        return value
+    
+    return wrapper
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Drop tzinfo after converting to UTC, to compare with values read back from the DB"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
 class InventoryAnalytics:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, use_rollups: Optional[bool] = None, use_forecasts: bool = True):
         self.db = db
-        self.scaler = StandardScaler()
+        self._scaler = None
+        # Read item_daily_rollups (O(days)) instead of raw history (O(events))
+        self.use_rollups = settings.USE_DAILY_ROLLUPS if use_rollups is None else use_rollups
+        # Predict from trained demand models where available (see forecasting.py)
+        self.use_forecasts = use_forecasts
+        # Per-request memo of computed facts, see memoized()
+        self._memo: Dict[Tuple, object] = {}
+        self._memo_hits = 0
+        self._memo_misses = 0
+        self._archive_horizon: Optional[Tuple[Optional[date]]] = None
+    
+    @property
+    def scaler(self):
+        if self._scaler is None:
+            self._scaler = preprocessing.StandardScaler()
+        return self._scaler
+    
+    @property
+    def archive_horizon(self) -> Optional[date]:
+        """First day of raw history; earlier days survive only as rollups (see retention)"""
+        if self._archive_horizon is None:
+            self._archive_horizon = (retention.archive_horizon(self.db),)
+        return self._archive_horizon[0]
+    
+    def _archived_rollups(self, item_ids: Optional[List[int]], since: Optional[datetime], *columns):
+        """Query of (item_id, day, *columns) rollups of archived days from since on, or None if there are none"""
+        from . import models
         
+        horizon = self.archive_horizon
+        if horizon is None or (since is not None and since.date() >= horizon):
+            return None
+        query = self.db.query(
+            models.ItemDailyRollup.item_id, models.ItemDailyRollup.day, *columns
+        ).filter(models.ItemDailyRollup.day < horizon)
+        if since is not None:
+            query = query.filter(models.ItemDailyRollup.day >= since.date())
+        if item_ids is not None:
+            query = query.filter(models.ItemDailyRollup.item_id.in_(item_ids))
+        return query
+    
+    def _prime(self, method: str, item_id: int, value, window: Optional[Tuple] = None):
+        """Store a value computed in bulk so the per-item method returns it"""
+        self._memo[(method, item_id, window)] = value
+    
+    def prime_items(self, items: List) -> None:
+        """Seed the memo with already loaded Item rows"""
+        for item in items:
+            self._prime("get_item", item.id, item)
+    
+    def memo_stats(self) -> Dict:
+        """Memo hit/miss counts for this instance"""
+        return {
+            "hits": self._memo_hits,
+            "misses": self._memo_misses,
+            "entries": len(self._memo)
+        }
+    
+    def clear_memo(self) -> None:
+        """Forget memoized facts, e.g. after writing new history"""
+        self._memo.clear()
+        self._memo_hits = 0
+        self._memo_misses = 0
+    
+    @memoized
+    def get_item(self, item_id: int):
+        """Fetch an item row"""
+        from . import models
+        
+        return self.db.query(models.Item).filter(models.Item.id == item_id).first()
+    
+    @memoized
     def calculate_daily_consumption(self, item_id: int, days: int = 30) -> float:
         """Calculate average daily consumption for an item"""
+        return self.calculate_daily_consumption_bulk([item_id], days)[item_id]
+    
+    def calculate_daily_consumption_bulk(self, item_ids: Optional[List[int]] = None, days: int = 30) -> Dict[int, float]:
+        """Calculate average daily consumption for many items in one pass over their history.
+        
+        Sums the stock used over the usage intervals (see events) that start
+        in the window: between consecutive counts, the opening count plus
+        restocks minus the closing count, plus the rollups of archived days.
+        Results are primed into the memo so later per-item calls don't hit the
+        database. In rollup mode the pre-aggregated daily consumption is
+        summed instead.
+        """
         from . import models
         
-        # Get stock history for the last N days
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
+        if item_ids is not None and not item_ids:
+            return {}
         
-        stock_records = self.db.query(models.StockHistory).filter(
-            models.StockHistory.item_id == item_id,
-            models.StockHistory.date >= start_date
-        ).order_by(models.StockHistory.date).all()
+        start_date = datetime.now() - timedelta(days=days)
         
-        if len(stock_records) < 2:
-            return 0.0
+        if self.use_rollups:
+            rows = self.db.query(
+                models.ItemDailyRollup.item_id,
+                func.sum(models.ItemDailyRollup.consumption)
+            ).filter(models.ItemDailyRollup.day >= start_date.date())
+            if item_ids is not None:
+                rows = rows.filter(models.ItemDailyRollup.item_id.in_(item_ids))
+            rows = rows.group_by(models.ItemDailyRollup.item_id).all()
+            return self._prime_consumption(item_ids, rows, days)
+        
+        totals: Dict[int, float] = {}
+        for item_id, _, consumed in self.daily_usage(item_ids, start_date):
+            totals[item_id] = totals.get(item_id, 0.0) + consumed
+        
+        return self._prime_consumption(item_ids, list(totals.items()), days)
+    
+    def usage_intervals(self, item_ids: Optional[List[int]], since: datetime):
+        """Usage intervals between counts dated since, streamed from stock and restock history"""
+        return events.usage_intervals(
+            events.merged_events(self.db, item_ids, since=since, kinds=(events.RESTOCK, events.COUNT))
+        )
+    
+    def daily_usage(self, item_ids: Optional[List[int]], since: datetime) -> Iterator[Tuple[int, datetime, float]]:
+        """(item_id, date, consumption) from since on: archived days' rollups, then raw usage intervals (by closing count)"""
+        from . import models
+        
+        archived = self._archived_rollups(item_ids, since, models.ItemDailyRollup.consumption)
+        if archived is not None:
+            for item_id, day, consumption in archived.filter(models.ItemDailyRollup.consumption > 0):
+                yield item_id, datetime.combine(day, time.min), consumption
+        for interval in self.usage_intervals(item_ids, since):
+            yield interval.item_id, interval.end, interval.consumed
+    
+    def _prime_consumption(self, item_ids: Optional[List[int]], rows: List, days: int) -> Dict[int, float]:
+        """Turn (item_id, total consumption) rows into daily averages and prime the memo"""
+        result = {item_id: 0.0 for item_id in (item_ids or [])}
+        for item_id, total_consumption in rows:
+            result[item_id] = (total_consumption or 0) / days
+        
+        for item_id, value in result.items():
+            self._prime("calculate_daily_consumption", item_id, value, (days,))
+        return result
+    
+    def load_history_frames(self, item_ids: Optional[List[int]] = None, days: int = 30,
+                            now: Optional[datetime] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Load usage over the last N days (see load_usage_frame) and all sales as columnar frames.
+        
+        Sales of archived days come from their rollups, one row per day at midnight.
+        """
+        from . import models
+        
+        now = now or datetime.now()
+        
+        sales_query = self.db.query(
+            models.SalesHistory.item_id,
+            models.SalesHistory.quantity_sold,
+            models.SalesHistory.date
+        )
+        if item_ids is not None:
+            sales_query = sales_query.filter(models.SalesHistory.item_id.in_(item_ids))
+        
+        usage = self.load_usage_frame(item_ids, now - timedelta(days=days))
+        sales = pd.read_sql(sales_query.statement, self.db.connection())
+        archived = self._archived_rollups(item_ids, None, models.ItemDailyRollup.units_sold.label("quantity_sold"))
+        if archived is not None:
+            archived = pd.read_sql(
+                archived.filter(models.ItemDailyRollup.sales_count > 0).statement, self.db.connection()
+            ).rename(columns={"day": "date"})
+            sales = pd.concat([archived[sales.columns], sales], ignore_index=True)
+        sales["date"] = pd.to_datetime(sales["date"])
+        
+        return usage, sales
+    
+    def load_usage_frame(self, item_ids: Optional[List[int]], since: datetime) -> pd.DataFrame:
+        """Usage since as a columnar frame (see daily_usage): item_id, date (closing count), consumption"""
+        usage = pd.DataFrame(list(self.daily_usage(item_ids, since)), columns=["item_id", "date", "consumption"])
+        usage["date"] = pd.to_datetime(usage["date"])
+        return usage
+    
+    def load_rollup_frame(self, item_ids: Optional[List[int]] = None) -> pd.DataFrame:
+        """Load daily rollup rows as a columnar frame"""
+        from . import models
+        
+        query = self.db.query(
+            models.ItemDailyRollup.item_id,
+            models.ItemDailyRollup.day,
+            models.ItemDailyRollup.consumption,
+            models.ItemDailyRollup.units_sold,
+            models.ItemDailyRollup.sales_count
+        )
+        if item_ids is not None:
+            query = query.filter(models.ItemDailyRollup.item_id.in_(item_ids))
+        
+        rollups = pd.read_sql(query.statement, self.db.connection())
+        rollups["day"] = pd.to_datetime(rollups["day"])
+        return rollups
+    
+    def run_columnar_analytics(self, item_ids: List[int], days: int = 30) -> Dict[int, Dict]:
+        """Compute consumption, sales performance and confidence for many items in bulk.
+        
+        History is loaded once and processed with groupby operations, so cost
+        grows with the number of items rather than the number of history rows.
+        Results are primed into the memo, so the regular methods return them
+        without querying history again.
+        """
+        if not item_ids:
+            return {}
+        
+        now = datetime.now()
+        timestamp = pd.Timestamp(now)
+        # Holt-Winters forecasts come from the item states, not the history matrix
+        smoothed = settings.FORECAST_MODE == "smoothing"
+        
+        if self.use_rollups:
+            # Day-granular: each rollup row acts as one sale at midnight
+            rollups = self.load_rollup_frame(item_ids)
+            window = rollups[rollups["day"] >= pd.Timestamp((now - timedelta(days=days)).date())]
+            consumption = window.groupby("item_id")["consumption"].sum() / days
+            sales = rollups[rollups["sales_count"] > 0].rename(
+                columns={"units_sold": "quantity_sold", "day": "date"}
+            )
+            if not smoothed:
+                self._prime_forecasts(item_ids, *forecasting.rollup_consumption_matrix(window, *self._lookback(now)))
+        else:
+            usage, sales = self.load_history_frames(item_ids, days, now)
             
-        # Calculate consumption from stock changes
-        total_consumption = 0
-        for i in range(1, len(stock_records)):
-            consumption = stock_records[i-1].quantity - stock_records[i].quantity
-            if consumption > 0:  # Only count positive consumption
-                total_consumption += consumption
-                
-        return total_consumption / days
+            # Consumption: stock used over the usage intervals in the window
+            consumption = usage.groupby("item_id")["consumption"].sum() / days
+            if not smoothed:
+                self._prime_forecasts(item_ids, *forecasting.daily_consumption_matrix(usage, *self._lookback(now)))
+        if smoothed:
+            self._prime_smoothed_forecasts(item_ids)
+        self.calculate_prediction_confidence_bulk(item_ids)
+        
+        # Sales velocity and 30-day trend
+        sales_by_item = sales.groupby("item_id")
+        total_sales = sales_by_item["quantity_sold"].sum()
+        first_sale = sales_by_item["date"].min()
+        last_sale = sales_by_item["date"].max()
+        days_since_first_sale = (timestamp - first_sale).dt.days
+        sales_velocity = total_sales / days_since_first_sale.clip(lower=1)
+        
+        recent_mask = sales["date"] >= timestamp - timedelta(days=30)
+        previous_mask = (sales["date"] >= timestamp - timedelta(days=60)) & ~recent_mask
+        recent_sales = sales["quantity_sold"].where(recent_mask, 0).groupby(sales["item_id"]).sum()
+        previous_sales = sales["quantity_sold"].where(previous_mask, 0).groupby(sales["item_id"]).sum()
+        
+        results = {}
+        for item_id in item_ids:
+            daily_consumption = float(consumption.get(item_id, 0.0))
+            
+            if item_id in total_sales.index:
+                recent = float(recent_sales[item_id])
+                previous = float(previous_sales[item_id])
+                sales_data = {
+                    "sales_velocity": float(sales_velocity[item_id]),
+                    "trend": "increasing" if recent > previous else "decreasing",
+                    "total_sales": float(total_sales[item_id]),
+                    "recent_sales": recent,
+                    "previous_sales": previous
+                }
+                last_sale_date = last_sale[item_id].to_pydatetime()
+            else:
+                sales_data = {"sales_velocity": 0, "trend": "no_data"}
+                last_sale_date = None
+            
+            self._prime("calculate_daily_consumption", item_id, daily_consumption, (days,))
+            self._prime("analyze_sales_performance", item_id, sales_data)
+            self._prime("get_last_sale_date", item_id, last_sale_date)
+            
+            results[item_id] = {
+                "daily_consumption": daily_consumption,
+                "sales_performance": sales_data,
+                "last_sale_date": last_sale_date
+            }
+        
+        return results
     
-    def predict_restock_date(self, item_id: int) -> Tuple[datetime, float]:
-        """Predict when an item will need restocking"""
+    def load_latest_snapshots(self, item_ids: Optional[List[int]] = None) -> Dict[int, Tuple]:
+        """Latest (ItemAnalytics, MenuOptimization) rows per item, in one query"""
         from . import models
         
-        item = self.db.query(models.Item).filter(models.Item.id == item_id).first()
+        latest_analytics = self.db.query(
+            func.max(models.ItemAnalytics.id).label("id")
+        ).group_by(models.ItemAnalytics.item_id).subquery()
+        latest_menu = self.db.query(
+            models.MenuOptimization.item_id.label("item_id"),
+            func.max(models.MenuOptimization.id).label("id")
+        ).group_by(models.MenuOptimization.item_id).subquery()
+        
+        query = self.db.query(models.ItemAnalytics, models.MenuOptimization).join(
+            latest_analytics, models.ItemAnalytics.id == latest_analytics.c.id
+        ).outerjoin(
+            latest_menu, latest_menu.c.item_id == models.ItemAnalytics.item_id
+        ).outerjoin(
+            models.MenuOptimization, models.MenuOptimization.id == latest_menu.c.id
+        )
+        if item_ids is not None:
+            query = query.filter(models.ItemAnalytics.item_id.in_(item_ids))
+        
+        return {snapshot.item_id: (snapshot, menu) for snapshot, menu in query}
+    
+    def prime_from_snapshots(self, items: List, max_staleness: float) -> List:
+        """Prime the memo from snapshots at most max_staleness seconds old.
+        
+        A snapshot is also stale when the item changed after it was taken.
+        Returns the items that still need live computation.
+        """
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        oldest = now - timedelta(seconds=max_staleness)
+        snapshots = self.load_latest_snapshots([item.id for item in items])
+        
+        live_items = []
+        for item in items:
+            snapshot, menu = snapshots.get(item.id, (None, None))
+            snapshot_at = _naive_utc(snapshot.date) if snapshot else None
+            updated_at = _naive_utc(item.updated_at)
+            
+            if (menu is None or snapshot_at is None or snapshot_at < oldest
+                    or (updated_at is not None and updated_at > snapshot_at)):
+                live_items.append(item)
+                continue
+            
+            confidence = snapshot.confidence_score if snapshot.predicted_restock_date else 0.0
+            self._prime("predict_restock_date", item.id, (snapshot.predicted_restock_date, confidence))
+            self._prime("predict_stock_life", item.id, snapshot.predicted_stock_life_days)
+            self._prime("predict_optimal_restock_quantity", item.id, snapshot.predicted_restock_quantity)
+            self._prime("calculate_daily_consumption", item.id, snapshot.avg_daily_consumption, (30,))
+            self._prime("generate_menu_recommendations", item.id, {
+                "recommendation": menu.recommendation,
+                "confidence": menu.confidence,
+                "reasoning": menu.reasoning,
+                "days_since_last_sale": menu.days_since_last_sale,
+                "sales_velocity": snapshot.sales_velocity
+            })
+        
+        return live_items
+    
+    def train_forecast_models(self, force: bool = False) -> Dict:
+        """Train the demand model of each category with active items, when due.
+        
+        With FORECAST_MODE=global there is one model over all active items;
+        with FORECAST_MODE=smoothing nothing is trained.
+        A model is kept unless it doesn't exist, its features or age are out
+        of date, or enough stock counts were added since it was trained
+        (forecasting.needs_training). Models with fewer than
+        forecasting.MIN_TRAINING_DAYS days of consumption are skipped.
+        Returns counts of trained, kept and skipped models.
+        """
+        from . import models
+        
+        summary = {"trained": 0, "kept": 0, "skipped": 0}
+        if settings.FORECAST_MODE == "smoothing":
+            # Holt-Winters states are updated as history is written
+            return summary
+        
+        now = datetime.now()
+        end = now.date() - timedelta(days=1)
+        start = end - timedelta(days=settings.FORECAST_TRAINING_DAYS - 1)
+        since = datetime.combine(start, time.min)
+        
+        items = self.db.query(models.Item).filter(models.Item.is_active == True).all()
+        items_by_id = {item.id: item for item in items}
+        groups: Dict[str, List[int]] = {}
+        for item in items:
+            groups.setdefault(forecasting.model_key(item.category_id), []).append(item.id)
+        
+        for key, item_ids in groups.items():
+            metadata = forecasting.model_store.latest(key)
+            
+            new_rows = 0
+            if metadata is not None:
+                new_rows = self.db.query(func.count(models.StockHistory.id)).filter(
+                    models.StockHistory.item_id.in_(item_ids),
+                    models.StockHistory.id > metadata["max_stock_id"]
+                ).scalar()
+            if not force and not forecasting.needs_training(metadata, new_rows):
+                summary["kept"] += 1
+                continue
+            
+            history_rows, max_stock_id = self.db.query(
+                func.count(models.StockHistory.id), func.max(models.StockHistory.id)
+            ).filter(models.StockHistory.item_id.in_(item_ids), models.StockHistory.date >= since).one()
+            
+            if self.use_rollups:
+                rollups = self.load_rollup_frame(item_ids)
+                matrix_item_ids, matrix = forecasting.rollup_consumption_matrix(rollups, start, end)
+            else:
+                usage = self.load_usage_frame(item_ids, since)
+                matrix_item_ids, matrix = forecasting.daily_consumption_matrix(usage, start, end)
+            
+            if (matrix.sum(axis=0) > 0).sum() < forecasting.MIN_TRAINING_DAYS:
+                summary["skipped"] += 1
+                continue
+            
+            if key == forecasting.GLOBAL_MODEL_KEY:
+                model = forecasting.GlobalDemandModel(settings.FORECAST_HORIZON_DAYS)
+                accuracy, training_rows = model.fit(matrix, start, [items_by_id[item_id] for item_id in matrix_item_ids])
+                model_name = f"{type(model).__name__}(RandomForestRegressor)"
+            else:
+                model, accuracy, training_rows = forecasting.train(matrix, start)
+                model_name = type(model).__name__
+            
+            metadata = forecasting.model_store.save(key, model, {
+                "model": model_name,
+                "horizon": settings.FORECAST_HORIZON_DAYS,
+                "feature_version": forecasting.FEATURE_VERSION,
+                "trained_at": datetime.now(timezone.utc).isoformat(),
+                "training_start": start.isoformat(),
+                "training_end": end.isoformat(),
+                "accuracy": accuracy,
+                "training_rows": training_rows,
+                "history_rows": history_rows,
+                "max_stock_id": max_stock_id or 0,
+                "items": len(item_ids)
+            })
+            forecasting.model_cache.put(key, metadata["version"], model)
+            summary["trained"] += 1
+        
+        return summary
+    
+    def _lookback(self, now: datetime) -> Tuple:
+        """(first, last) day of the history a forecast made at now reads"""
+        end = now.date() - timedelta(days=1)
+        return end - timedelta(days=forecasting.LOOKBACK_DAYS - 1), end
+    
+    def _prime_forecasts(self, item_ids: List[int], matrix_item_ids: List[int], matrix) -> Dict[int, Optional[float]]:
+        """Forecast every item with a model and history in matrix.
+        
+        Category models take one predict call per category per horizon day,
+        the global model one call for all items. Primes forecast_demand and
+        forecast_daily_consumption (the mean over the horizon).
+        """
+        rows = {item_id: row for row, item_id in enumerate(matrix_item_ids)} if self.use_forecasts else {}
+        by_model: Dict[str, List[int]] = {}
+        forecasts: Dict[int, Optional[float]] = {}
+        for item_id in item_ids:
+            item = self.get_item(item_id)
+            forecasts[item_id] = None
+            if item is not None and item_id in rows:
+                by_model.setdefault(forecasting.model_key(item.category_id), []).append(item_id)
+        
+        first_day = datetime.now().date()
+        demand_by_item: Dict[int, List[float]] = {}
+        for key, model_item_ids in by_model.items():
+            model, _ = forecasting.model_cache.get(key)
+            if model is None:
+                continue
+            history = matrix[[rows[item_id] for item_id in model_item_ids]]
+            if isinstance(model, forecasting.GlobalDemandModel):
+                items = [self.get_item(item_id) for item_id in model_item_ids]
+                demand = model.predict_demand(history, items, first_day)
+            else:
+                demand = forecasting.forecast(model, history, first_day, settings.FORECAST_HORIZON_DAYS)
+            for item_id, days in zip(model_item_ids, demand):
+                demand_by_item[item_id] = [float(value) for value in days]
+                forecasts[item_id] = float(days.mean())
+        
+        for item_id, value in forecasts.items():
+            self._prime("forecast_daily_consumption", item_id, value)
+            self._prime("forecast_demand", item_id, demand_by_item.get(item_id))
+        return forecasts
+    
+    @memoized
+    def get_forecast_state(self, item_id: int):
+        """The item's Holt-Winters state (see smoothing), or None before its first event"""
+        from . import models
+        return self.db.query(models.ItemForecastState).filter(
+            models.ItemForecastState.item_id == item_id
+        ).first()
+    
+    def load_forecast_states(self, item_ids: List[int]) -> Dict:
+        """Holt-Winters states of many items in one query, primed into the memo"""
+        from . import models
+        
+        states = {item_id: None for item_id in item_ids}
+        if item_ids:
+            for state in self.db.query(models.ItemForecastState).filter(
+                models.ItemForecastState.item_id.in_(item_ids)
+            ):
+                states[state.item_id] = state
+        for item_id, state in states.items():
+            self._prime("get_forecast_state", item_id, state)
+        return states
+    
+    def _prime_smoothed_forecasts(self, item_ids: List[int]) -> Dict[int, Optional[float]]:
+        """Forecast items from their Holt-Winters states, priming the same memo entries as _prime_forecasts"""
+        states = self.load_forecast_states(item_ids) if self.use_forecasts else {}
+        today = datetime.now().date()
+        forecasts: Dict[int, Optional[float]] = {}
+        for item_id in item_ids:
+            demand = smoothing.forecast(states.get(item_id), today, settings.FORECAST_HORIZON_DAYS)
+            forecasts[item_id] = sum(demand) / len(demand) if demand else None
+            self._prime("forecast_daily_consumption", item_id, forecasts[item_id])
+            self._prime("forecast_demand", item_id, demand)
+        return forecasts
+    
+    @memoized
+    def forecast_daily_consumption(self, item_id: int) -> Optional[float]:
+        """Mean daily consumption over the next FORECAST_HORIZON_DAYS from the item's trained model.
+        
+        None when the item's category has no model or the item has no recent
+        history; callers then fall back to calculate_daily_consumption.
+        """
+        return self.forecast_daily_consumption_bulk([item_id])[item_id]
+    
+    @memoized
+    def forecast_demand(self, item_id: int) -> Optional[List[float]]:
+        """Forecast consumption for each of the next FORECAST_HORIZON_DAYS days, or None"""
+        self.forecast_daily_consumption_bulk([item_id])
+        return self._memo[("forecast_demand", item_id, None)]
+    
+    def forecast_daily_consumption_bulk(self, item_ids: List[int]) -> Dict[int, Optional[float]]:
+        """Forecasts for many items, reading their recent history in one query"""
+        if not self.use_forecasts:
+            return self._prime_forecasts(item_ids, [], None)
+        if settings.FORECAST_MODE == "smoothing":
+            return self._prime_smoothed_forecasts(item_ids)
+        
+        has_model: Dict[str, bool] = {}
+        modelled = []
+        for item_id in item_ids:
+            item = self.get_item(item_id)
+            if item is None:
+                continue
+            key = forecasting.model_key(item.category_id)
+            if key not in has_model:
+                has_model[key] = forecasting.model_store.latest(key) is not None
+            if has_model[key]:
+                modelled.append(item_id)
+        
+        first, last = self._lookback(datetime.now())
+        if not modelled:
+            return self._prime_forecasts(item_ids, [], None)
+        if self.use_rollups:
+            matrix_item_ids, matrix = forecasting.rollup_consumption_matrix(self.load_rollup_frame(modelled), first, last)
+        else:
+            # From the day before, so the first day's usage has an opening count
+            day_before = first - timedelta(days=1)
+            usage = self.load_usage_frame(modelled, datetime.combine(day_before, time.min))
+            matrix_item_ids, matrix = forecasting.daily_consumption_matrix(usage, day_before, last)
+        return self._prime_forecasts(item_ids, matrix_item_ids, matrix)
+    
+    def forecast_model(self, item_id: int) -> Optional[Dict]:
+        """Metadata of the model forecasting item_id, if its forecast came from one"""
+        if self.forecast_daily_consumption(item_id) is None:
+            return None
+        if settings.FORECAST_MODE == "smoothing":
+            state = self.get_forecast_state(item_id)
+            return {
+                "key": "holt-winters",
+                "version": smoothing.STATE_VERSION,
+                "trained_at": _naive_utc(state.updated_at).isoformat(),
+                "accuracy": smoothing.accuracy(state)
+            }
+        return forecasting.model_store.latest(forecasting.model_key(self.get_item(item_id).category_id))
+    
+    def _daily_demand(self, item_id: int) -> float:
+        """Forecast daily consumption, or the 30-day average without a trained model"""
+        forecast = self.forecast_daily_consumption(item_id)
+        return forecast if forecast is not None else self.calculate_daily_consumption(item_id)
+    
+    @memoized
+    def predict_restock_date(self, item_id: int) -> Tuple[datetime, float]:
+        """Predict when an item will need restocking"""
+        item = self.get_item(item_id)
         if not item:
             return None, 0.0
             
-        daily_consumption = self.calculate_daily_consumption(item_id)
+        daily_consumption = self._daily_demand(item_id)
         if daily_consumption <= 0:
             return None, 0.0
             
@@ -56,34 +624,36 @@ class InventoryAnalytics:
         days_until_restock = (item.quantity - item.restock_threshold) / daily_consumption
         predicted_date = datetime.now() + timedelta(days=days_until_restock)
         
-        # Calculate confidence based on data consistency
-        confidence = min(0.95, max(0.1, self._calculate_prediction_confidence(item_id)))
+        # Model holdout accuracy when forecast by a model, else data consistency
+        model = self.forecast_model(item_id)
+        if model and model.get("accuracy") is not None:
+            confidence = min(0.95, max(0.1, model["accuracy"]))
+        else:
+            confidence = min(0.95, max(0.1, self._calculate_prediction_confidence(item_id)))
         
         return predicted_date, confidence
     
+    @memoized
     def predict_stock_life(self, item_id: int) -> float:
         """Predict how many days current stock will last"""
-        from . import models
-        
-        item = self.db.query(models.Item).filter(models.Item.id == item_id).first()
+        item = self.get_item(item_id)
         if not item:
             return 0.0
             
-        daily_consumption = self.calculate_daily_consumption(item_id)
+        daily_consumption = self._daily_demand(item_id)
         if daily_consumption <= 0:
             return 999.0  # Large number instead of infinity
             
         return item.quantity / daily_consumption
     
+    @memoized
     def predict_optimal_restock_quantity(self, item_id: int) -> float:
         """Predict optimal restock quantity to minimize waste and stockouts"""
-        from . import models
-        
-        item = self.db.query(models.Item).filter(models.Item.id == item_id).first()
+        item = self.get_item(item_id)
         if not item:
             return 0.0
             
-        daily_consumption = self.calculate_daily_consumption(item_id)
+        daily_consumption = self._daily_demand(item_id)
         if daily_consumption <= 0:
             return item.restock_threshold
             
@@ -95,11 +665,10 @@ class InventoryAnalytics:
         # Ensure it's at least the restock threshold
         return max(optimal_quantity, item.restock_threshold)
     
+    @memoized
     def calculate_cost_optimization(self, item_id: int) -> Dict:
         """Calculate cost optimization metrics"""
-        from . import models
-        
-        item = self.db.query(models.Item).filter(models.Item.id == item_id).first()
+        item = self.get_item(item_id)
         if not item or not item.cost_per_unit:
             return {}
             
@@ -124,14 +693,20 @@ class InventoryAnalytics:
             "optimal_restock_frequency": 21  # 3 weeks
         }
     
+    @memoized
     def analyze_sales_performance(self, item_id: int) -> Dict:
         """Analyze sales performance and trends"""
         from . import models
         
         # Get sales data
-        sales_records = self.db.query(models.SalesHistory).filter(
-            models.SalesHistory.item_id == item_id
-        ).order_by(models.SalesHistory.date.desc()).all()
+        if self.use_rollups:
+            sales_records = self._rollup_sales_records(item_id)
+        else:
+            sales_records = self.db.query(models.SalesHistory).filter(
+                models.SalesHistory.item_id == item_id
+            ).order_by(models.SalesHistory.date.desc()).all()
+            if self.archive_horizon is not None:
+                sales_records += self._rollup_sales_records(item_id, self.archive_horizon)
         
         if not sales_records:
             return {"sales_velocity": 0, "trend": "no_data"}
@@ -160,11 +735,49 @@ class InventoryAnalytics:
             "previous_sales": previous_sales
         }
     
-    def generate_menu_recommendations(self, item_id: int) -> Dict:
-        """Generate menu optimization recommendations"""
+    @memoized
+    def get_last_sale_date(self, item_id: int) -> Optional[datetime]:
+        """Get the date of the most recent sale for an item"""
+        from . import models
+        
+        if self.use_rollups:
+            sales_records = self._rollup_sales_records(item_id)
+            return sales_records[0].date if sales_records else None
+        
+        last_sale = self.db.query(models.SalesHistory).filter(
+            models.SalesHistory.item_id == item_id
+        ).order_by(models.SalesHistory.date.desc()).first()
+        if last_sale is None and self.archive_horizon is not None:
+            archived = self._rollup_sales_records(item_id, self.archive_horizon)
+            return archived[0].date if archived else None
+        
+        return last_sale.date if last_sale else None
+    
+    @memoized
+    def _rollup_sales_records(self, item_id: int, before: Optional[date] = None) -> List[SimpleNamespace]:
+        """Days (before a day, if given) with sales for an item, newest first, shaped like SalesHistory rows"""
         from . import models
         
-        item = self.db.query(models.Item).filter(models.Item.id == item_id).first()
+        query = self.db.query(
+            models.ItemDailyRollup.day,
+            models.ItemDailyRollup.units_sold
+        ).filter(
+            models.ItemDailyRollup.item_id == item_id,
+            models.ItemDailyRollup.sales_count > 0
+        )
+        if before is not None:
+            query = query.filter(models.ItemDailyRollup.day < before)
+        rows = query.order_by(models.ItemDailyRollup.day.desc()).all()
+        
+        return [
+            SimpleNamespace(date=datetime.combine(day, time.min), quantity_sold=units_sold)
+            for day, units_sold in rows
+        ]
+    
+    @memoized
+    def generate_menu_recommendations(self, item_id: int) -> Dict:
+        """Generate menu optimization recommendations"""
+        item = self.get_item(item_id)
         if not item:
             return {}
             
@@ -172,11 +785,8 @@ class InventoryAnalytics:
         sales_data = self.analyze_sales_performance(item_id)
         
         # Get days since last sale
-        last_sale = self.db.query(models.SalesHistory).filter(
-            models.SalesHistory.item_id == item_id
-        ).order_by(models.SalesHistory.date.desc()).first()
-        
-        days_since_last_sale = (datetime.now() - last_sale.date).days if last_sale else 999
+        last_sale_date = self.get_last_sale_date(item_id)
+        days_since_last_sale = (datetime.now() - last_sale_date).days if last_sale_date else 999
         
         # Generate recommendation
         recommendation = "keep"
@@ -208,11 +818,19 @@ class InventoryAnalytics:
             "sales_velocity": sales_data["sales_velocity"]
         }
     
+    @memoized
     def _calculate_prediction_confidence(self, item_id: int) -> float:
         """Calculate confidence score for predictions based on data quality"""
         from . import models
         
         # Count data points
+        if self.use_rollups:
+            stock_records, sales_records = self.db.query(
+                func.coalesce(func.sum(models.ItemDailyRollup.stock_count), 0),
+                func.coalesce(func.sum(models.ItemDailyRollup.sales_count), 0)
+            ).filter(models.ItemDailyRollup.item_id == item_id).one()
+            return self._confidence_from_count(stock_records + sales_records)
+        
         stock_records = self.db.query(models.StockHistory).filter(
             models.StockHistory.item_id == item_id
         ).count()
@@ -221,8 +839,42 @@ class InventoryAnalytics:
             models.SalesHistory.item_id == item_id
         ).count()
         
-        # More data = higher confidence
-        total_records = stock_records + sales_records
+        Rollup = models.ItemDailyRollup
+        archived = self._archived_rollups([item_id], None, Rollup.stock_count + Rollup.sales_count)
+        archived_records = sum(count for _, _, count in archived) if archived is not None else 0
+        
+        return self._confidence_from_count(stock_records + sales_records + archived_records)
+    
+    def calculate_prediction_confidence_bulk(self, item_ids: List[int]) -> Dict[int, float]:
+        """Data-quality confidence for many items from grouped counts, primed into the memo"""
+        from . import models
+        
+        totals = {item_id: 0 for item_id in item_ids}
+        if item_ids and self.use_rollups:
+            rows = self.db.query(
+                models.ItemDailyRollup.item_id,
+                func.coalesce(func.sum(models.ItemDailyRollup.stock_count), 0)
+                + func.coalesce(func.sum(models.ItemDailyRollup.sales_count), 0)
+            ).filter(models.ItemDailyRollup.item_id.in_(item_ids)).group_by(models.ItemDailyRollup.item_id)
+            totals.update(rows)
+        elif item_ids:
+            for history in (models.StockHistory, models.SalesHistory):
+                for item_id, count in self.db.query(history.item_id, func.count(history.id)).filter(
+                    history.item_id.in_(item_ids)
+                ).group_by(history.item_id):
+                    totals[item_id] += count
+            Rollup = models.ItemDailyRollup
+            archived = self._archived_rollups(item_ids, None, Rollup.stock_count + Rollup.sales_count)
+            for item_id, _, count in archived if archived is not None else ():
+                totals[item_id] += count
+        
+        confidence = {item_id: self._confidence_from_count(total) for item_id, total in totals.items()}
+        for item_id, value in confidence.items():
+            self._prime("_calculate_prediction_confidence", item_id, value)
+        return confidence
+    
+    def _confidence_from_count(self, total_records: int) -> float:
+        """More data = higher confidence"""
         if total_records < 5:
             return 0.1
         elif total_records < 10:
@@ -280,38 +932,194 @@ class InventoryAnalytics:
         # Clean the result to ensure JSON compatibility
         return self._clean_json_values(result)
     
-    def update_analytics_for_all_items(self):
-        """Update analytics for all items"""
+    def find_dirty_items(self) -> Tuple[List, int]:
+        """Active items whose inputs changed since their latest snapshot.
+        
+        An item is dirty when it has no snapshot, when the item row was
+        updated after its latest snapshot date, or when any stock, sales or
+        restock row is dated after it. Returns (dirty items, skipped count).
+        """
         from . import models
         
-        items = self.db.query(models.Item).filter(models.Item.is_active == True).all()
+        snapshots = self.db.query(
+            models.ItemAnalytics.item_id.label("item_id"),
+            func.max(models.ItemAnalytics.date).label("snapshot_at")
+        ).group_by(models.ItemAnalytics.item_id).subquery()
         
-        for item in items:
-            analytics_data = self.run_full_analytics(item.id)
-            
-            # Save to ItemAnalytics table
-            analytics_record = models.ItemAnalytics(
-                item_id=item.id,
-                predicted_restock_date=analytics_data["predictions"]["restock_date"],
-                predicted_stock_life_days=analytics_data["predictions"]["stock_life_days"],
-                predicted_restock_quantity=analytics_data["predictions"]["optimal_restock_quantity"],
-                confidence_score=analytics_data["predictions"]["confidence"],
-                avg_daily_consumption=self.calculate_daily_consumption(item.id),
-                sales_velocity=analytics_data["sales_performance"]["sales_velocity"],
-                model_version="1.0",
-                last_training_date=datetime.now()
-            )
-            
-            # Save to MenuOptimization table
-            menu_record = models.MenuOptimization(
-                item_id=item.id,
-                recommendation=analytics_data["menu_recommendations"]["recommendation"],
-                confidence=analytics_data["menu_recommendations"]["confidence"],
-                reasoning=analytics_data["menu_recommendations"]["reasoning"],
-                days_since_last_sale=analytics_data["menu_recommendations"]["days_since_last_sale"]
+        def history_since_snapshot(history):
+            return self.db.query(history.id).filter(
+                history.item_id == models.Item.id,
+                history.date > snapshots.c.snapshot_at
+            ).exists()
+        
+        dirty = or_(
+            snapshots.c.snapshot_at.is_(None),
+            models.Item.updated_at > snapshots.c.snapshot_at,
+            history_since_snapshot(models.StockHistory),
+            history_since_snapshot(models.SalesHistory),
+            history_since_snapshot(models.RestockHistory)
+        )
+        
+        active = self.db.query(models.Item).filter(models.Item.is_active == True)
+        items = active.outerjoin(snapshots, snapshots.c.item_id == models.Item.id).filter(dirty).all()
+        skipped = active.count() - len(items)
+        
+        return items, skipped
+    
+    def _snapshot_rows(self, item_id: int, analytics_data: Dict, snapshot_at: datetime) -> Tuple[Dict, Dict]:
+        """Build ItemAnalytics and MenuOptimization rows from run_full_analytics output"""
+        model = self.forecast_model(item_id)
+        # States are only kept up to date in smoothing mode
+        state = self.get_forecast_state(item_id) if smoothing.enabled() else None
+        analytics_row = {
+            "item_id": item_id,
+            "predicted_restock_date": analytics_data["predictions"]["restock_date"],
+            "predicted_stock_life_days": analytics_data["predictions"]["stock_life_days"],
+            "predicted_restock_quantity": analytics_data["predictions"]["optimal_restock_quantity"],
+            "confidence_score": analytics_data["predictions"]["confidence"],
+            "avg_daily_consumption": self.calculate_daily_consumption(item_id),
+            "sales_velocity": analytics_data["sales_performance"]["sales_velocity"],
+            "consumption_trend": state.trend if state else None,
+            "seasonality_factor": smoothing.seasonality_factor(state, snapshot_at.date()) if state else None,
+            "model_version": f"{model['key']}.v{model['version']}" if model else "heuristic",
+            "last_training_date": datetime.fromisoformat(model["trained_at"]) if model else None,
+            "model_accuracy": model["accuracy"] if model else None,
+            "date": snapshot_at
+        }
+        menu_row = {
+            "item_id": item_id,
+            "date": snapshot_at,
+            "recommendation": analytics_data["menu_recommendations"]["recommendation"],
+            "confidence": analytics_data["menu_recommendations"]["confidence"],
+            "reasoning": analytics_data["menu_recommendations"]["reasoning"],
+            "days_since_last_sale": analytics_data["menu_recommendations"]["days_since_last_sale"]
+        }
+        return analytics_row, menu_row
+    
+    def update_analytics_for_all_items(self, incremental: bool = False, batch_size: int = 500,
+                                       progress: Optional[Callable[[int, int], None]] = None,
+                                       workers: Optional[int] = None) -> Dict:
+        """Update analytics for all items.
+        
+        With incremental=True only items from find_dirty_items() are
+        recomputed. With workers > 1 the items are partitioned across a
+        process pool (see compute_snapshot_partition). Snapshot rows are bulk
+        inserted batch_size items at a time and committed once at the end.
+        progress(done, total) is called as items complete.
+        """
+        from . import models
+        
+        workers = settings.ANALYTICS_WORKERS if workers is None else workers
+        
+        # Anything written after this point makes the item dirty for the next run
+        snapshot_at = datetime.now(timezone.utc)
+        
+        if incremental:
+            items, skipped = self.find_dirty_items()
+        else:
+            items = self.db.query(models.Item).filter(models.Item.is_active == True).all()
+            skipped = 0
+        
+        # Before the snapshots, so they forecast with current models
+        forecast_models = self.train_forecast_models() if items else None
+        
+        if progress:
+            progress(0, len(items))
+        
+        if workers > 1 and len(items) > workers:
+            rows, memo_stats = self._compute_snapshots_parallel(items, snapshot_at, workers, progress)
+        else:
+            rows = self._compute_snapshots(items, snapshot_at, progress)
+            memo_stats = self.memo_stats()
+        
+        written = 0
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            written += self._write_snapshot_batch(
+                [analytics_row for analytics_row, _ in batch],
+                [menu_row for _, menu_row in batch]
             )
-            
-            self.db.add(analytics_record)
-            self.db.add(menu_record)
-            
-        self.db.commit() 
\ No newline at end of file
+        
+        self.db.commit()
+        
+        return {
+            "incremental": incremental,
+            "workers": workers,
+            "skipped": skipped,
+            "recomputed": len(items),
+            "written": written,
+            "forecast_models": forecast_models,
+            "memo_stats": memo_stats
+        }
+    
+    def _compute_snapshots(self, items: List, snapshot_at: datetime,
+                           progress: Optional[Callable[[int, int], None]] = None) -> List[Tuple[Dict, Dict]]:
+        """Run full analytics for items in this process, returning snapshot rows"""
+        self.prime_items(items)
+        if smoothing.enabled():
+            self.load_forecast_states([item.id for item in items])
+        self.run_columnar_analytics([item.id for item in items])
+        
+        rows = []
+        for done, item in enumerate(items, start=1):
+            analytics_data = self.run_full_analytics(item.id)
+            rows.append(self._snapshot_rows(item.id, analytics_data, snapshot_at))
+            if progress:
+                progress(done, len(items))
+        return rows
+    
+    def _compute_snapshots_parallel(self, items: List, snapshot_at: datetime, workers: int,
+                                    progress: Optional[Callable[[int, int], None]] = None) -> Tuple[List, Dict]:
+        """Partition items across a process pool and gather their snapshot rows.
+        
+        Partitions are smaller than items/workers so slow partitions don't
+        leave cores idle and progress is reported more often.
+        """
+        item_ids = [item.id for item in items]
+        partition_size = max(1, -(-len(item_ids) // (workers * 4)))
+        partitions = [item_ids[i:i + partition_size] for i in range(0, len(item_ids), partition_size)]
+        
+        rows = []
+        memo_stats = {"hits": 0, "misses": 0, "entries": 0}
+        # spawn, not fork: the caller may be a job thread inside a server process
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(compute_snapshot_partition, partition, self.use_rollups, snapshot_at)
+                for partition in partitions
+            ]
+            for future in as_completed(futures):
+                partition_rows, partition_stats = future.result()
+                rows.extend(partition_rows)
+                for key in memo_stats:
+                    memo_stats[key] += partition_stats[key]
+                if progress:
+                    progress(len(rows), len(item_ids))
+        
+        return rows, memo_stats
+    
+    def _write_snapshot_batch(self, analytics_rows: List[Dict], menu_rows: List[Dict]) -> int:
+        """Insert one batch of snapshot rows with executemany, returning items written"""
+        from . import models
+        
+        self.db.execute(insert(models.ItemAnalytics), analytics_rows)
+        self.db.execute(insert(models.MenuOptimization), menu_rows)
+        return len(analytics_rows)
+
+def compute_snapshot_partition(item_ids: List[int], use_rollups: bool, snapshot_at: datetime) -> Tuple[List, Dict]:
+    """Process-pool entry point: snapshot rows for one partition of items.
+    
+    Runs in a worker process with its own session (and engine connections),
+    and returns the rows to the parent for a single batched write.
+    """
+    from . import models
+    from .database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        analytics = InventoryAnalytics(db, use_rollups=use_rollups)
+        items = db.query(models.Item).filter(models.Item.id.in_(item_ids)).all()
+        rows = analytics._compute_snapshots(items, snapshot_at)
+        return rows, analytics.memo_stats()
+    finally:
+        db.close()
\ No newline at end of file
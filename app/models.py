@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean, JSON
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Boolean, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 from .database import Base
@@ -15,6 +15,11 @@ class Item(Base):
     is_active = Column(Boolean, default=True)  # For menu optimization
     cost_per_unit = Column(Float, nullable=True)  # For cost analysis
     last_sale_date = Column(DateTime, nullable=True)  # For performance tracking
+    updated_at = Column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )  # Last change to the item or its history, for incremental analytics (migration 5)
     
     category = relationship("Category", back_populates="items")
     stock_history = relationship("StockHistory", back_populates="item")
@@ -22,6 +27,9 @@ class Item(Base):
     sales_history = relationship("SalesHistory", back_populates="item")
     analytics = relationship("ItemAnalytics", back_populates="item")
     menu_optimization = relationship("MenuOptimization", back_populates="item")
+    daily_rollups = relationship("ItemDailyRollup", back_populates="item")
+    forecast_state = relationship("ItemForecastState", back_populates="item", uselist=False)
+    stock_carryover = relationship("StockCarryover", back_populates="item", uselist=False)
 
 class Category(Base):
     __tablename__ = "categories"
@@ -33,7 +41,15 @@ class Category(Base):
 
 class StockHistory(Base):
     __tablename__ = "stock_history"
+    __table_args__ = (
+        # Per-item history in date order, and date-ordered pages across items (see app/migrations.py)
+        Index("ix_stock_history_item_date", "item_id", "date", "id"),
+        Index("ix_stock_history_date", "date", "id"),
+    )
 
+    # Once migrate.py partitions history by month on PostgreSQL (see app/retention.py),
+    # the table's primary key is (id, date). ids stay unique from their sequence, so the
+    # history models keep declaring id alone, which is what the ORM identifies rows by.
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
     quantity = Column(Float, nullable=False)  # Current stock level
@@ -45,6 +61,10 @@ class StockHistory(Base):
 
 class RestockHistory(Base):
     __tablename__ = "restock_history"
+    __table_args__ = (
+        Index("ix_restock_history_item_date", "item_id", "date", "id"),
+        Index("ix_restock_history_date", "date", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
@@ -58,6 +78,10 @@ class RestockHistory(Base):
 
 class SalesHistory(Base):
     __tablename__ = "sales_history"
+    __table_args__ = (
+        Index("ix_sales_history_item_date", "item_id", "date", "id"),
+        Index("ix_sales_history_date", "date", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
@@ -68,8 +92,66 @@ class SalesHistory(Base):
     
     item = relationship("Item", back_populates="sales_history")
 
+class ItemDailyRollup(Base):
+    __tablename__ = "item_daily_rollups"
+    __table_args__ = (UniqueConstraint("item_id", "day", name="uq_item_daily_rollups_item_day"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    
+    # Stock counts
+    consumption = Column(Float, default=0)  # Positive drops between consecutive counts
+    stock_count = Column(Integer, default=0)  # Number of stock counts logged
+    closing_quantity = Column(Float, nullable=True)  # Last count of the day
+    
+    # Sales
+    units_sold = Column(Float, default=0)
+    revenue = Column(Float, default=0)
+    sales_count = Column(Integer, default=0)
+    
+    # Restocks
+    restocked_amount = Column(Float, default=0)
+    restock_count = Column(Integer, default=0)
+    
+    item = relationship("Item", back_populates="daily_rollups")
+
+class ItemForecastState(Base):
+    """Holt-Winters smoothing state of an item's daily demand (see app/smoothing.py)"""
+    __tablename__ = "item_forecast_states"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False, unique=True)
+    
+    # Smoothed components of daily demand
+    level = Column(Float, default=0)
+    trend = Column(Float, default=0)
+    season = Column(JSON)  # Additive offsets by weekday, Monday first
+    observations = Column(Integer, default=0)  # Days folded into the state
+    
+    # Demand of the day still in progress
+    day = Column(Date, nullable=True)
+    day_demand = Column(Float, default=0)
+    
+    # Since the last stock count, to split its drop into sales and other use
+    last_count_quantity = Column(Float, nullable=True)
+    sold_since_count = Column(Float, default=0)
+    restocked_since_count = Column(Float, default=0)
+    
+    # One-day-ahead forecast error, for accuracy
+    absolute_error = Column(Float, default=0)
+    actual_demand = Column(Float, default=0)
+    
+    # History was edited or deleted; the next analytics refresh rebuilds the state
+    stale = Column(Boolean, default=False)
+    
+    updated_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    item = relationship("Item", back_populates="forecast_state")
+
 class ItemAnalytics(Base):
     __tablename__ = "item_analytics"
+    __table_args__ = (Index("ix_item_analytics_item_date", "item_id", "date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
@@ -105,6 +187,7 @@ class ItemAnalytics(Base):
 
 class MenuOptimization(Base):
     __tablename__ = "menu_optimization"
+    __table_args__ = (Index("ix_menu_optimization_item_date", "item_id", "date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("items.id"))
@@ -128,6 +211,68 @@ class MenuOptimization(Base):
     
     item = relationship("Item", back_populates="menu_optimization")
 
+class AnalyticsJob(Base):
+    __tablename__ = "analytics_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, default="refresh")
+    trigger = Column(String, nullable=True)  # "manual" or "scheduled"
+    incremental = Column(Boolean, default=False)
+    status = Column(String, default="running")  # "running", "succeeded", "failed"
+    
+    # Progress
+    items_done = Column(Integer, default=0)
+    items_total = Column(Integer, nullable=True)
+    
+    created_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    finished_at = Column(DateTime, nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    
+    result = Column(JSON, nullable=True)  # Run stats from update_analytics_for_all_items
+    error = Column(String, nullable=True)
+
+class SalesSpoolSegment(Base):
+    """Spool segment whose buffered sales were committed (see app/sales_buffer.py)"""
+    __tablename__ = "sales_spool_segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False, unique=True)  # File name, unique per worker and segment
+    rows = Column(Integer, default=0)
+    committed_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class HistoryArchive(Base):
+    """Archive run that replaced raw history before a day with daily rollups (see app/retention.py)"""
+    __tablename__ = "history_archives"
+
+    id = Column(Integer, primary_key=True, index=True)
+    archived_before = Column(Date, nullable=False)  # First day whose raw history is kept
+    archived_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    
+    # Raw rows removed
+    stock_rows = Column(Integer, default=0)
+    sales_rows = Column(Integer, default=0)
+    restock_rows = Column(Integer, default=0)
+
+class StockCarryover(Base):
+    """An item's stock going into the retained history: its last archived count plus later archived restocks"""
+    __tablename__ = "stock_carryovers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("items.id"), nullable=False, unique=True)
+    date = Column(DateTime, nullable=False)  # Date of the archived count
+    quantity = Column(Float, nullable=False)
+    
+    item = relationship("Item", back_populates="stock_carryover")
+
+class SchemaMigration(Base):
+    """Applied schema migration (see app/migrations.py)"""
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=True)
+    applied_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+    duration_seconds = Column(Float, nullable=True)
+
 class User(Base):
     __tablename__ = "users"
 
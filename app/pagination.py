@@ -0,0 +1,156 @@
+"""
+Keyset pagination and date-range filters for list endpoints.
+
+Pages are ordered by a unique key such as (date, id) and the cursor encodes
+the key of the last row served, so the next page is an index range scan that
+starts where the previous one stopped instead of an OFFSET that rereads every
+earlier row. Response bodies stay plain JSON lists; the next page's cursor is
+sent in the X-Next-Cursor header (and a Link: rel="next" header) and is
+absent on the last page. Lists that are small and were never capped, such as
+items and categories, use OptionalPage and are only paginated when the client
+passes a limit.
+
+History listings continue past the raw rows into the daily summaries of
+archived history (see retention), with cursors marked ARCHIVED_CURSOR_PREFIX.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional, Sequence
+from fastapi import HTTPException, Query, Request, Response
+from sqlalchemy import Date, DateTime, and_, or_
+from .config import settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Not in the base64url alphabet, so it can't start a raw-history cursor
+ARCHIVED_CURSOR_PREFIX = "a."
+
+def encode_cursor(values: Sequence) -> str:
+    """Opaque cursor for a row's key values"""
+    raw = json.dumps([value.isoformat() if isinstance(value, date) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, keys: Sequence) -> List:
+    """Key values from a cursor made by encode_cursor for the same key columns"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise ValueError("wrong number of key values")
+        return [
+            datetime.fromisoformat(value) if isinstance(key.type, DateTime)
+            else date.fromisoformat(value) if isinstance(key.type, Date)
+            else int(value)
+            for key, value in zip(keys, values)
+        ]
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _after(keys: Sequence, values: Sequence, descending: bool):
+    """Rows that sort after values: (k1, k2) > (v1, v2) spelled out for every dialect"""
+    key, value = keys[0], values[0]
+    beyond = key < value if descending else key > value
+    if len(keys) == 1:
+        return beyond
+    return or_(beyond, and_(key == value, _after(keys[1:], values[1:], descending)))
+
+class Page:
+    """limit and after query parameters of a paginated route (use with Depends())"""
+    def __init__(
+        self,
+        request: Request,
+        response: Response,
+        limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None, description="X-Next-Cursor of the previous page")
+    ):
+        self.request = request
+        self.response = response
+        self.limit = limit
+        self.after = after
+
+    def fetch(self, query, *keys, descending: bool = False) -> List:
+        """One page of query ordered by keys (the last one unique), setting the next-page headers"""
+        if self.after:
+            query = query.filter(_after(keys, decode_cursor(self.after, keys), descending))
+        query = query.order_by(*(key.desc() if descending else key for key in keys))
+        if self.limit is None:
+            return query.all()
+        rows = query.limit(self.limit + 1).all()
+
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            self._next(encode_cursor([getattr(rows[-1], key.key) for key in keys]))
+        return rows
+
+    def fetch_history(self, query, keys: Sequence, archived=None, archived_keys: Sequence = ()) -> List:
+        """Newest-first page of raw history that continues into archived daily summaries once it runs out.
+
+        archived is the summaries' query, ordered by archived_keys (the last
+        one unique per day), or None when nothing is archived.
+        """
+        if archived is None:
+            return self.fetch(query, *keys, descending=True)
+
+        after = None
+        if self.after and self.after.startswith(ARCHIVED_CURSOR_PREFIX):
+            rows = []
+            after = self.after[len(ARCHIVED_CURSOR_PREFIX):]
+        else:
+            rows = self.fetch(query, *keys, descending=True)
+            if NEXT_CURSOR_HEADER in self.response.headers:
+                return rows
+
+        remaining = self.limit - len(rows)
+        if after:
+            archived = archived.filter(_after(archived_keys, decode_cursor(after, archived_keys), True))
+        summaries = archived.order_by(*(key.desc() for key in archived_keys)).limit(remaining + 1).all()
+        if len(summaries) > remaining:
+            summaries = summaries[:remaining]
+            # Empty after the prefix when the raw rows filled this page
+            last = encode_cursor([getattr(summaries[-1], key.key) for key in archived_keys]) if summaries else ""
+            self._next(ARCHIVED_CURSOR_PREFIX + last)
+        return rows + summaries
+
+    def _next(self, cursor: str):
+        self.response.headers[NEXT_CURSOR_HEADER] = cursor
+        self.response.headers["Link"] = f'<{self.request.url.include_query_params(after=cursor)}>; rel="next"'
+
+class OptionalPage(Page):
+    """Page whose limit is optional: without one, every row after the cursor is returned"""
+    def __init__(
+        self,
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE),
+        after: Optional[str] = Query(None, description="X-Next-Cursor of the previous page")
+    ):
+        super().__init__(request, response, limit, after)
+
+class DateRange:
+    """from (inclusive) and to (exclusive) query parameters (use with Depends())"""
+    def __init__(
+        self,
+        from_: Optional[datetime] = Query(None, alias="from"),
+        to: Optional[datetime] = Query(None)
+    ):
+        self.start = from_
+        self.end = to
+
+    def apply(self, query, column):
+        if self.start is not None:
+            query = query.filter(column >= self.start)
+        if self.end is not None:
+            query = query.filter(column < self.end)
+        return query
+
+    def apply_days(self, query, column):
+        """Filter a Date column, counting each day as its midnight"""
+        def first_day(moment: datetime) -> date:
+            return moment.date() if moment.time() == time.min else moment.date() + timedelta(days=1)
+
+        if self.start is not None:
+            query = query.filter(column >= first_day(self.start))
+        if self.end is not None:
+            query = query.filter(column < first_day(self.end))
+        return query
@@ -0,0 +1,103 @@
+"""
+Read-only projections behind the list endpoints.
+
+List views return a handful of columns per row. Loading ORM objects for them
+costs identity-map bookkeeping per row, and reading entry.item or
+item.category lazily costs a SELECT per row. These queries select just the
+columns a view returns, with item and category names joined in, so a page is
+one statement; rows() turns the result tuples into response dicts.
+
+History archived before a day (see retention) is listed from its daily
+rollups: one row per item and day, with "summary": true, the day as its date,
+the number of raw rows it stands for in "count", and no id.
+"""
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional
+from sqlalchemy import null, true
+from sqlalchemy.orm import Query, Session
+from . import retention
+from .models import Category, Item, ItemDailyRollup, RestockHistory, StockHistory
+
+# Order of archived summaries, newest first (see Page.fetch_history)
+SUMMARY_DATE = ItemDailyRollup.day.label("date")
+SUMMARY_KEYS = (SUMMARY_DATE, ItemDailyRollup.item_id)
+
+def stock_history(db: Session) -> Query:
+    return db.query(
+        StockHistory.id,
+        StockHistory.item_id,
+        Item.name.label("item_name"),
+        StockHistory.quantity,
+        StockHistory.date,
+        StockHistory.notes,
+        StockHistory.staff_name
+    ).outerjoin(Item, Item.id == StockHistory.item_id)
+
+def restock_history(db: Session) -> Query:
+    return db.query(
+        RestockHistory.id,
+        RestockHistory.item_id,
+        Item.name.label("item_name"),
+        RestockHistory.restock_amount,
+        RestockHistory.date,
+        RestockHistory.supplier,
+        RestockHistory.notes
+    ).outerjoin(Item, Item.id == RestockHistory.item_id)
+
+def stock_summaries(db: Session, before: date) -> Query:
+    """Archived days' last stock count per item, shaped like stock_history()"""
+    return db.query(
+        null().label("id"),
+        ItemDailyRollup.item_id,
+        Item.name.label("item_name"),
+        ItemDailyRollup.closing_quantity.label("quantity"),
+        SUMMARY_DATE,
+        null().label("notes"),
+        null().label("staff_name"),
+        true().label("summary"),
+        ItemDailyRollup.stock_count.label("count")
+    ).outerjoin(Item, Item.id == ItemDailyRollup.item_id).filter(
+        ItemDailyRollup.day < before, ItemDailyRollup.stock_count > 0
+    )
+
+def restock_summaries(db: Session, before: date) -> Query:
+    """Archived days' restocked amount per item, shaped like restock_history()"""
+    return db.query(
+        null().label("id"),
+        ItemDailyRollup.item_id,
+        Item.name.label("item_name"),
+        ItemDailyRollup.restocked_amount.label("restock_amount"),
+        SUMMARY_DATE,
+        null().label("supplier"),
+        null().label("notes"),
+        true().label("summary"),
+        ItemDailyRollup.restock_count.label("count")
+    ).outerjoin(Item, Item.id == ItemDailyRollup.item_id).filter(
+        ItemDailyRollup.day < before, ItemDailyRollup.restock_count > 0
+    )
+
+def archived(db: Session, summaries: Callable[[Session, date], Query], period,
+             item_id: Optional[int] = None) -> Optional[Query]:
+    """Archived summaries (stock_summaries or restock_summaries) in a DateRange, or None if nothing is archived"""
+    horizon = retention.archive_horizon(db)
+    if horizon is None:
+        return None
+    query = period.apply_days(summaries(db, horizon), ItemDailyRollup.day)
+    if item_id is not None:
+        query = query.filter(ItemDailyRollup.item_id == item_id)
+    return query
+
+def items(db: Session) -> Query:
+    return db.query(
+        Item.id,
+        Item.name,
+        Item.quantity,
+        Item.unit,
+        Item.restock_threshold,
+        Item.category_id,
+        Category.name.label("category_name")
+    ).outerjoin(Category, Category.id == Item.category_id)
+
+def rows(result: Iterable) -> List[Dict]:
+    """Response dicts keyed by the projected column labels"""
+    return [dict(row._mapping) for row in result]
@@ -0,0 +1,230 @@
+"""
+History retention, and monthly partitioning of history on PostgreSQL.
+
+Raw stock, sales and restock history older than HISTORY_RETENTION_MONTHS
+whole months is archived by archive_history.py, run on a schedule (cron); the
+API itself never removes history. Its per-day summaries already exist as daily
+rollups, so archiving checks them against the raw rows (rebuilding them if
+they drifted), records each item's carryover, and removes the raw rows. The
+carryover is the item's last archived count plus the archived restocks after
+it, i.e. its stock going into the retained history (see events). Readers then
+combine the two sides of the archive horizon, the first day still held raw:
+rollups before it, raw rows from it on.
+
+On PostgreSQL, migration 4 (applied by `python migrate.py`, not on API
+startup) turns the history tables into tables partitioned by month of date, with a default partition for rows outside the monthly ones.
+Archiving then detaches and drops whole monthly partitions instead of
+deleting their rows. ensure_partitions() keeps partitions created
+HISTORY_PARTITION_MONTHS_AHEAD months ahead. On other databases the tables
+stay plain and archiving deletes rows.
+"""
+import logging
+import re
+from datetime import date, datetime, time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, insert, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from . import events, models, rollups
+from .config import settings
+
+logger = logging.getLogger("stocker.retention")
+
+# Archived together; partitioned by month on PostgreSQL
+HISTORY_MODELS = (models.StockHistory, models.SalesHistory, models.RestockHistory)
+
+def archive_horizon(db: Session) -> Optional[date]:
+    """First day whose raw history is kept, or None if nothing was archived"""
+    return db.query(func.max(models.HistoryArchive.archived_before)).scalar()
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month months after month's"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def retention_cutoff(today: Optional[date] = None) -> Optional[date]:
+    """First day of the oldest month to keep raw, or None if retention is off"""
+    if settings.HISTORY_RETENTION_MONTHS <= 0:
+        return None
+    today = today or date.today()
+    return add_months(today.replace(day=1), -settings.HISTORY_RETENTION_MONTHS)
+
+# Partitioning (PostgreSQL)
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM pg_class WHERE relname = :table AND relkind = 'p'"), {"table": table}
+    ).first() is not None
+
+def _partitions(connection: Connection, table: str) -> List[Tuple[str, date]]:
+    """(name, month) of table's monthly partitions, oldest first"""
+    names = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table}).scalars()
+    months = []
+    for name in names:
+        match = re.fullmatch(rf"{table}_p(\d{{4}})(\d{{2}})", name)
+        if match:
+            months.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(months, key=lambda partition: partition[1])
+
+def _create_partition(connection: Connection, table: str, month: date):
+    """Attach month's partition to table, moving its rows out of the default partition"""
+    name = f"{table}_p{month:%Y%m}"
+    end = add_months(month, 1)
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {table}_default WHERE date >= :start AND date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": month, "end": end})
+    connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{month}') TO ('{end}')"))
+
+def ensure_partitions(connection: Connection, through: Optional[date] = None) -> List[str]:
+    """Create missing monthly partitions from this month through HISTORY_PARTITION_MONTHS_AHEAD ahead"""
+    this_month = date.today().replace(day=1)
+    through = through or add_months(this_month, settings.HISTORY_PARTITION_MONTHS_AHEAD)
+    created = []
+    for model in HISTORY_MODELS:
+        table = model.__tablename__
+        if not is_partitioned(connection, table):
+            continue
+        existing = {month for _, month in _partitions(connection, table)}
+        month = this_month
+        while month <= through:
+            if month not in existing:
+                _create_partition(connection, table, month)
+                created.append(f"{table}_p{month:%Y%m}")
+            month = add_months(month, 1)
+    return created
+
+def maintain_partitions(engine: Engine) -> List[str]:
+    """Run ensure_partitions in its own transaction (a no-op off PostgreSQL)"""
+    if engine.dialect.name != "postgresql":
+        return []
+    with engine.begin() as connection:
+        created = ensure_partitions(connection)
+    if created:
+        logger.info("Created history partitions %s", ", ".join(created))
+    return created
+
+def partition_history(connection: Connection):
+    """Migrate each plain history table to one partitioned by month of date (PostgreSQL only).
+
+    Copies the rows into a partitioned table built LIKE the old one, which
+    keeps the id sequence, then swaps it in. The primary key becomes
+    (id, date) since PostgreSQL requires it to include the partition key.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    this_month = date.today().replace(day=1)
+    for model in HISTORY_MODELS:
+        table = model.__tablename__
+        if is_partitioned(connection, table):
+            continue
+        staging = f"{table}_partitioned"
+        sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+        first = connection.execute(text(f"SELECT min(date) FROM {table}")).scalar()
+
+        connection.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        connection.execute(text(f"CREATE TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) PARTITION BY RANGE (date)"))
+        connection.execute(text(f"ALTER TABLE {staging} ALTER COLUMN date SET NOT NULL"))
+        connection.execute(text(f"CREATE TABLE {table}_default PARTITION OF {staging} DEFAULT"))
+        month = first.date().replace(day=1) if first else this_month
+        while month <= add_months(this_month, settings.HISTORY_PARTITION_MONTHS_AHEAD):
+            connection.execute(text(
+                f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {staging} "
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            ))
+            month = add_months(month, 1)
+        connection.execute(text(f"INSERT INTO {staging} SELECT * FROM {table}"))
+
+        if sequence:
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {staging}.id"))
+        connection.execute(text(f"DROP TABLE {table}"))
+        connection.execute(text(f"ALTER TABLE {staging} RENAME TO {table}"))
+        connection.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, date)"))
+        connection.execute(text(f"ALTER TABLE {table} ADD FOREIGN KEY (item_id) REFERENCES items (id)"))
+        for index in model.__table__.indexes:
+            index.create(connection)
+        connection.execute(text(f"ANALYZE {table}"))
+
+# Archiving
+
+def _check_rollups(db: Session, horizon: Optional[date], before: date, cutoff: datetime):
+    """Rebuild rollups if their counts for the days to archive disagree with the raw rows"""
+    Rollup = models.ItemDailyRollup
+    query = db.query(
+        func.coalesce(func.sum(Rollup.stock_count), 0),
+        func.coalesce(func.sum(Rollup.sales_count), 0),
+        func.coalesce(func.sum(Rollup.restock_count), 0)
+    ).filter(Rollup.day < before)
+    if horizon is not None:
+        query = query.filter(Rollup.day >= horizon)
+    rolled = tuple(query.one())
+    raw = tuple(db.query(func.count(model.id)).filter(model.date < cutoff).scalar() for model in HISTORY_MODELS)
+    if rolled != raw:
+        logger.warning("Daily rollups out of step with history to archive (%s vs %s rows), rebuilding", rolled, raw)
+        rollups.rebuild_rollups(db)
+
+def _carry_over(db: Session, cutoff: datetime):
+    """Replace the carryovers with each item's stock going into history kept from cutoff"""
+    openings: Dict[int, Tuple[datetime, float]] = {}
+    # Includes the current carryovers, as counts dated before any raw history
+    for event in events.merged_events(db, until=cutoff, kinds=(events.RESTOCK, events.COUNT)):
+        if event.kind == events.COUNT:
+            openings[event.item_id] = (event.date, event.value)
+        elif event.item_id in openings:
+            when, quantity = openings[event.item_id]
+            openings[event.item_id] = (when, quantity + event.value)
+
+    db.query(models.StockCarryover).delete(synchronize_session=False)
+    if openings:
+        db.execute(insert(models.StockCarryover), [
+            {"item_id": item_id, "date": when, "quantity": quantity}
+            for item_id, (when, quantity) in openings.items()
+        ])
+
+def _remove_history(db: Session, model, cutoff: datetime) -> int:
+    """Remove model's rows dated before cutoff, dropping whole partitions where possible"""
+    table = model.__tablename__
+    connection = db.connection()
+    removed = 0
+    if is_partitioned(connection, table):
+        for name, month in _partitions(connection, table):
+            if add_months(month, 1) > cutoff.date():
+                break
+            removed += connection.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            connection.execute(text(f"DROP TABLE {name}"))
+    # Plain tables, the default partition, and a cutoff within a month
+    removed += db.query(model).filter(model.date < cutoff).delete(synchronize_session=False)
+    return removed
+
+def archive_history(db: Session, before: date) -> Optional[Dict]:
+    """Replace raw history dated before a day with its daily rollups. The caller commits.
+
+    Returns the rows removed per table, or None if history before that day
+    was already archived.
+    """
+    horizon = archive_horizon(db)
+    if horizon is not None and before <= horizon:
+        return None
+    cutoff = datetime.combine(before, time.min)
+
+    _check_rollups(db, horizon, before, cutoff)
+    _carry_over(db, cutoff)
+    removed = {model.__tablename__: _remove_history(db, model, cutoff) for model in HISTORY_MODELS}
+    db.add(models.HistoryArchive(
+        archived_before=before,
+        stock_rows=removed["stock_history"],
+        sales_rows=removed["sales_history"],
+        restock_rows=removed["restock_history"]
+    ))
+    # Bulk deletes and DDL bypass the ORM, so flag the write for the analytics cache (see cache)
+    db.info["analytics_changed"] = True
+    return {"archived_before": before.isoformat(), **removed}
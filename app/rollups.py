@@ -0,0 +1,381 @@
+"""
+Per-item, per-day rollups of stock, sales and restock history.
+
+Write routes call the record_* helpers inside their own transaction so the
+rollups stay in step with the raw history tables. rebuild_rollups() backfills
+them from scratch. A day's consumption is the stock used over the usage
+intervals (see events) that end on it, so it depends on the restocks between
+counts as well as the counts themselves.
+
+Rollups of days before the archive horizon (see retention) are all that is
+left of that history, so rebuilds never touch them.
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy import and_, func, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import events, models, retention
+
+ROLLUP_FIELDS = (
+    "consumption",
+    "stock_count",
+    "units_sold",
+    "revenue",
+    "sales_count",
+    "restocked_amount",
+    "restock_count",
+)
+
+def day_of(value) -> date:
+    """Normalize a datetime (or SQLite date string) to a calendar day"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+def _upsert(db: Session, item_id: int, day: date, increments: Optional[Dict] = None, values: Optional[Dict] = None):
+    """Add increments to, and overwrite values on, the (item_id, day) rollup row"""
+    increments = increments or {}
+    values = values or {}
+    table = models.ItemDailyRollup.__table__
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        row = {field: 0 for field in ROLLUP_FIELDS}
+        row.update(increments)
+        row.update(values)
+
+        statement = dialect_insert(table).values(item_id=item_id, day=day, **row)
+        set_ = {field: table.c[field] + statement.excluded[field] for field in increments}
+        set_.update({field: statement.excluded[field] for field in values})
+        db.execute(statement.on_conflict_do_update(index_elements=["item_id", "day"], set_=set_))
+        return
+
+    # Generic fallback: lock the row, then create or update it
+    rollup = db.query(models.ItemDailyRollup).filter(
+        models.ItemDailyRollup.item_id == item_id,
+        models.ItemDailyRollup.day == day
+    ).with_for_update().first()
+    if not rollup:
+        rollup = models.ItemDailyRollup(item_id=item_id, day=day, **{field: 0 for field in ROLLUP_FIELDS})
+        db.add(rollup)
+    for field, delta in increments.items():
+        setattr(rollup, field, (getattr(rollup, field) or 0) + delta)
+    for field, value in values.items():
+        setattr(rollup, field, value)
+    db.flush()
+
+def _upsert_many(db: Session, day: date, increments: Dict[int, Dict], values: Optional[Dict[int, Dict]] = None):
+    """Add each item's increments to, and overwrite its values on, its rollup row for day.
+
+    Every item has the same increment fields, and the same value fields.
+    """
+    if not increments:
+        return
+    values = values or {}
+    table = models.ItemDailyRollup.__table__
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        fields = list(next(iter(increments.values())))
+        value_fields = list(next(iter(values.values()), {}))
+        rows = [
+            {
+                "item_id": item_id, "day": day, **{field: 0 for field in ROLLUP_FIELDS},
+                **totals, **values.get(item_id, {})
+            }
+            for item_id, totals in increments.items()
+        ]
+        statement = dialect_insert(table)
+        set_ = {field: table.c[field] + statement.excluded[field] for field in fields}
+        set_.update({field: statement.excluded[field] for field in value_fields})
+        statement = statement.on_conflict_do_update(index_elements=["item_id", "day"], set_=set_)
+        db.execute(statement, rows)
+        return
+
+    for item_id, totals in increments.items():
+        _upsert(db, item_id, day, increments=totals, values=values.get(item_id))
+
+def _adjacent_count(db: Session, entry: models.StockHistory, following: bool) -> Optional[models.StockHistory]:
+    """Get the stock count right before (or after) an entry for the same item"""
+    StockHistory = models.StockHistory
+    query = db.query(StockHistory).filter(
+        StockHistory.item_id == entry.item_id,
+        StockHistory.id != entry.id
+    )
+    if following:
+        query = query.filter(or_(
+            StockHistory.date > entry.date,
+            and_(StockHistory.date == entry.date, StockHistory.id > entry.id)
+        )).order_by(StockHistory.date, StockHistory.id)
+    else:
+        query = query.filter(or_(
+            StockHistory.date < entry.date,
+            and_(StockHistory.date == entry.date, StockHistory.id < entry.id)
+        )).order_by(StockHistory.date.desc(), StockHistory.id.desc())
+    adjacent = query.first()
+    if adjacent is None and not following:
+        return _carryover(db, entry.item_id, entry.date)
+    return adjacent
+
+def _carryover(db: Session, item_id: int, before: datetime) -> Optional[models.StockCarryover]:
+    """The item's carryover if dated before, standing in for its last archived count"""
+    return db.query(models.StockCarryover).filter(
+        models.StockCarryover.item_id == item_id,
+        models.StockCarryover.date < before
+    ).first()
+
+def stock_days_affected(db: Session, entry: models.StockHistory) -> Set[date]:
+    """Days whose consumption depends on this count: its own and the next count's"""
+    days = {day_of(entry.date)}
+    following = _adjacent_count(db, entry, following=True)
+    if following:
+        days.add(day_of(following.date))
+    return days
+
+def restock_days_affected(db: Session, entry: models.RestockHistory) -> Set[date]:
+    """Days whose consumption depends on this restock: the day of the first count after it"""
+    StockHistory = models.StockHistory
+    following = db.query(StockHistory).filter(
+        StockHistory.item_id == entry.item_id,
+        StockHistory.date >= entry.date
+    ).order_by(StockHistory.date, StockHistory.id).first()
+    return {day_of(following.date)} if following else set()
+
+def refresh_stock_days(db: Session, item_id: int, days: Iterable[date]):
+    """Recompute consumption and count for the given days from raw stock and restock history"""
+    StockHistory = models.StockHistory
+
+    for day in days:
+        start = datetime.combine(day, time.min)
+        end = start + timedelta(days=1)
+
+        previous = db.query(StockHistory).filter(
+            StockHistory.item_id == item_id,
+            StockHistory.date < start
+        ).order_by(StockHistory.date.desc(), StockHistory.id.desc()).first() or _carryover(db, item_id, start)
+
+        # From the previous count, so the day's first interval has its opening count
+        stream = list(events.merged_events(
+            db, [item_id], since=previous.date if previous else start, until=end,
+            kinds=(events.RESTOCK, events.COUNT)
+        ))
+        counts = [event for event in stream if event.kind == events.COUNT and day_of(event.date) == day]
+        consumption = sum(
+            interval.consumed for interval in events.usage_intervals(stream) if day_of(interval.end) == day
+        )
+
+        _upsert(db, item_id, day, values={
+            "consumption": consumption,
+            "stock_count": len(counts),
+            "closing_quantity": counts[-1].value if counts else None
+        })
+
+def record_stock_count(db: Session, entry: models.StockHistory):
+    """Account for a newly inserted (and flushed) stock count"""
+    if _adjacent_count(db, entry, following=True):
+        # Backdated count: it also changes the next count's consumption
+        refresh_stock_days(db, entry.item_id, stock_days_affected(db, entry))
+        return
+
+    previous = _adjacent_count(db, entry, following=False)
+    consumption = 0.0
+    if previous:
+        # Same-timestamp restocks are applied before a count, see events
+        restocked = db.query(func.coalesce(func.sum(models.RestockHistory.restock_amount), 0)).filter(
+            models.RestockHistory.item_id == entry.item_id,
+            models.RestockHistory.date > previous.date,
+            models.RestockHistory.date <= entry.date
+        ).scalar()
+        consumption = max(0.0, previous.quantity + restocked - entry.quantity)
+    _upsert(
+        db, entry.item_id, day_of(entry.date),
+        increments={"consumption": consumption, "stock_count": 1},
+        values={"closing_quantity": entry.quantity}
+    )
+
+def record_sale(db: Session, entry: models.SalesHistory):
+    """Account for a newly inserted (and flushed) sale"""
+    _upsert(db, entry.item_id, day_of(entry.date), increments={
+        "units_sold": entry.quantity_sold,
+        "revenue": entry.revenue or 0,
+        "sales_count": 1
+    })
+
+def record_restock(db: Session, entry: models.RestockHistory, amount: Optional[float] = None, count: int = 1):
+    """Account for a restock; pass a negative amount/count to back one out"""
+    _upsert(db, entry.item_id, day_of(entry.date), increments={
+        "restocked_amount": entry.restock_amount if amount is None else amount,
+        "restock_count": count
+    })
+
+# Batches from the bulk ingestion routes: every entry is stamped with the same
+# date, later than the existing history
+
+def record_stock_counts(db: Session, entries: List[Dict]):
+    """Account for a batch of inserted stock counts, in insertion order"""
+    StockHistory = models.StockHistory
+    RestockHistory = models.RestockHistory
+    when = entries[0]["date"]
+
+    # Each item's latest count before the batch, and what was restocked after it
+    ranked = select(
+        StockHistory.item_id,
+        StockHistory.quantity,
+        StockHistory.date,
+        func.row_number().over(
+            partition_by=StockHistory.item_id,
+            order_by=(StockHistory.date.desc(), StockHistory.id.desc())
+        ).label("rank")
+    ).where(
+        StockHistory.item_id.in_({entry["item_id"] for entry in entries}),
+        StockHistory.date < when
+    ).subquery()
+    previous = db.query(
+        ranked.c.item_id,
+        ranked.c.quantity,
+        func.coalesce(func.sum(RestockHistory.restock_amount), 0)
+    ).outerjoin(RestockHistory, and_(
+        RestockHistory.item_id == ranked.c.item_id,
+        RestockHistory.date > ranked.c.date,
+        RestockHistory.date <= when
+    )).filter(ranked.c.rank == 1).group_by(ranked.c.item_id, ranked.c.quantity)
+    opening = {item_id: (quantity, restocked) for item_id, quantity, restocked in previous}
+
+    # Items whose earlier counts were all archived open from their carryover
+    archived = {entry["item_id"] for entry in entries} - set(opening)
+    if archived:
+        Carryover = models.StockCarryover
+        carried = db.query(
+            Carryover.item_id,
+            Carryover.quantity,
+            func.coalesce(func.sum(RestockHistory.restock_amount), 0)
+        ).outerjoin(RestockHistory, and_(
+            RestockHistory.item_id == Carryover.item_id,
+            RestockHistory.date > Carryover.date,
+            RestockHistory.date <= when
+        )).filter(Carryover.item_id.in_(archived)).group_by(Carryover.item_id, Carryover.quantity)
+        opening.update({item_id: (quantity, restocked) for item_id, quantity, restocked in carried})
+
+    increments: Dict[int, Dict] = {}
+    for entry in entries:
+        item_id = entry["item_id"]
+        consumption = 0.0
+        if item_id in opening:
+            quantity, restocked = opening[item_id]
+            consumption = max(0.0, quantity + restocked - entry["quantity"])
+        opening[item_id] = (entry["quantity"], 0.0)
+        totals = increments.setdefault(item_id, {"consumption": 0.0, "stock_count": 0})
+        totals["consumption"] += consumption
+        totals["stock_count"] += 1
+    # opening now holds each item's last count of the batch
+    closing = {item_id: {"closing_quantity": opening[item_id][0]} for item_id in increments}
+    _upsert_many(db, day_of(when), increments, closing)
+
+def record_sales(db: Session, entries: List[Dict]):
+    """Account for a batch of inserted sales"""
+    increments: Dict[int, Dict] = {}
+    for entry in entries:
+        totals = increments.setdefault(entry["item_id"], {"units_sold": 0.0, "revenue": 0.0, "sales_count": 0})
+        totals["units_sold"] += entry["quantity_sold"]
+        totals["revenue"] += entry.get("revenue") or 0
+        totals["sales_count"] += 1
+    _upsert_many(db, day_of(entries[0]["date"]), increments)
+
+def record_restocks(db: Session, entries: List[Dict]):
+    """Account for a batch of inserted restocks (no later count depends on them yet)"""
+    increments: Dict[int, Dict] = {}
+    for entry in entries:
+        totals = increments.setdefault(entry["item_id"], {"restocked_amount": 0.0, "restock_count": 0})
+        totals["restocked_amount"] += entry["restock_amount"]
+        totals["restock_count"] += 1
+    _upsert_many(db, day_of(entries[0]["date"]), increments)
+
+def rebuild_rollups(db: Session, item_ids: Optional[List[int]] = None) -> int:
+    """Recompute rollups from raw history with grouped queries. Returns rows written."""
+    StockHistory = models.StockHistory
+    SalesHistory = models.SalesHistory
+    RestockHistory = models.RestockHistory
+
+    delete_query = db.query(models.ItemDailyRollup)
+    if item_ids is not None:
+        delete_query = delete_query.filter(models.ItemDailyRollup.item_id.in_(item_ids))
+    horizon = retention.archive_horizon(db)
+    if horizon is not None:
+        delete_query = delete_query.filter(models.ItemDailyRollup.day >= horizon)
+    delete_query.delete(synchronize_session=False)
+
+    rollups: Dict = {}
+    def row(item_id, day):
+        key = (item_id, day_of(day))
+        if key not in rollups:
+            rollups[key] = {
+                "item_id": key[0], "day": key[1], "closing_quantity": None, **{field: 0 for field in ROLLUP_FIELDS}
+            }
+        return rollups[key]
+
+    # Stock: usage between consecutive counts goes to the later count's day
+    stock_day = func.date(StockHistory.date)
+    stock_rows = db.query(StockHistory.item_id, stock_day, func.count()).group_by(StockHistory.item_id, stock_day)
+    if item_ids is not None:
+        stock_rows = stock_rows.filter(StockHistory.item_id.in_(item_ids))
+    for item_id, day, count in stock_rows:
+        row(item_id, day)["stock_count"] = count
+
+    ranked = select(
+        StockHistory.item_id,
+        stock_day.label("day"),
+        StockHistory.quantity,
+        func.row_number().over(
+            partition_by=(StockHistory.item_id, stock_day),
+            order_by=(StockHistory.date.desc(), StockHistory.id.desc())
+        ).label("rank")
+    )
+    if item_ids is not None:
+        ranked = ranked.where(StockHistory.item_id.in_(item_ids))
+    ranked = ranked.subquery()
+    for item_id, day, quantity in db.query(ranked.c.item_id, ranked.c.day, ranked.c.quantity).filter(ranked.c.rank == 1):
+        row(item_id, day)["closing_quantity"] = quantity
+
+    intervals = events.usage_intervals(events.merged_events(db, item_ids, kinds=(events.RESTOCK, events.COUNT)))
+    for interval in intervals:
+        row(interval.item_id, interval.end)["consumption"] += interval.consumed
+
+    sales_day = func.date(SalesHistory.date)
+    sales_rows = db.query(
+        SalesHistory.item_id,
+        sales_day,
+        func.sum(SalesHistory.quantity_sold),
+        func.sum(func.coalesce(SalesHistory.revenue, 0)),
+        func.count()
+    ).group_by(SalesHistory.item_id, sales_day)
+    if item_ids is not None:
+        sales_rows = sales_rows.filter(SalesHistory.item_id.in_(item_ids))
+    for item_id, day, units_sold, revenue, count in sales_rows:
+        rollup = row(item_id, day)
+        rollup["units_sold"] = units_sold or 0.0
+        rollup["revenue"] = revenue or 0.0
+        rollup["sales_count"] = count
+
+    restock_day = func.date(RestockHistory.date)
+    restock_rows = db.query(
+        RestockHistory.item_id,
+        restock_day,
+        func.sum(RestockHistory.restock_amount),
+        func.count()
+    ).group_by(RestockHistory.item_id, restock_day)
+    if item_ids is not None:
+        restock_rows = restock_rows.filter(RestockHistory.item_id.in_(item_ids))
+    for item_id, day, amount, count in restock_rows:
+        rollup = row(item_id, day)
+        rollup["restocked_amount"] = amount or 0.0
+        rollup["restock_count"] = count
+
+    if rollups:
+        db.execute(insert(models.ItemDailyRollup), list(rollups.values()))
+
+    return len(rollups)
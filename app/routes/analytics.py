@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from typing import List, Dict, Optional
-from .. import models
+from .. import ingest, jobs, models, rollups, sales_buffer, smoothing
+from ..config import settings
 from ..database import SessionLocal
+from ..cache import cached_response
 from ..ml_analytics import InventoryAnalytics
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
@@ -16,6 +18,12 @@ def get_db():
     finally:
         db.close()
 
+def _prime_snapshots(analytics: InventoryAnalytics, items: List[models.Item], max_staleness: Optional[float]) -> List[models.Item]:
+    """Answer what we can from analytics snapshots, returning the items to compute live"""
+    if max_staleness is None:
+        return items
+    return analytics.prime_from_snapshots(items, max_staleness)
+
 @router.get("/predictions/{item_id}")
 def get_item_predictions(item_id: int, db: Session = Depends(get_db)):
     """Get ML predictions for a specific item"""
@@ -32,11 +40,26 @@ def get_item_predictions(item_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Analytics error: {str(e)}")
 
 @router.get("/restock-predictions")
-def get_all_restock_predictions(db: Session = Depends(get_db)):
-    """Get restock predictions for all items"""
-    analytics = InventoryAnalytics(db)
+@cached_response
+def get_all_restock_predictions(max_staleness: Optional[float] = None, forecast: bool = True,
+                                db: Session = Depends(get_db)):
+    """Get restock predictions for all items
+    
+    With max_staleness (seconds), items with a recent enough analytics
+    snapshot are answered from it instead of being recomputed. With
+    forecast=true (the default) live items are predicted from the trained
+    demand models, forecast for the whole batch at once; forecast=false uses
+    30-day average consumption only.
+    """
+    analytics = InventoryAnalytics(db, use_forecasts=forecast)
     
     items = db.query(models.Item).filter(models.Item.is_active == True).all()
+    analytics.prime_items(items)
+    live_items = _prime_snapshots(analytics, items, max_staleness)
+    live_ids = {item.id for item in live_items}
+    analytics.calculate_daily_consumption_bulk(list(live_ids))
+    analytics.forecast_daily_consumption_bulk(list(live_ids))
+    analytics.calculate_prediction_confidence_bulk(list(live_ids))
     predictions = []
     
     for item in items:
@@ -61,7 +84,8 @@ def get_all_restock_predictions(db: Session = Depends(get_db)):
                 "confidence": confidence,
                 "stock_life_days": stock_life,
                 "optimal_restock_quantity": optimal_quantity,
-                "daily_consumption": daily_consumption
+                "daily_consumption": daily_consumption,
+                "demand_forecast": analytics.forecast_demand(item.id) if item.id in live_ids else None
             })
         except Exception as e:
             continue  # Skip items with errors
@@ -69,11 +93,15 @@ def get_all_restock_predictions(db: Session = Depends(get_db)):
     return predictions
 
 @router.get("/cost-optimization")
+@cached_response
 def get_cost_optimization_analysis(db: Session = Depends(get_db)):
     """Get cost optimization analysis for all items"""
     analytics = InventoryAnalytics(db)
     
     items = db.query(models.Item).filter(models.Item.is_active == True).all()
+    analytics.prime_items(items)
+    analytics.calculate_daily_consumption_bulk([item.id for item in items])
+    analytics.forecast_daily_consumption_bulk([item.id for item in items])
     cost_analysis = []
     
     for item in items:
@@ -92,11 +120,14 @@ def get_cost_optimization_analysis(db: Session = Depends(get_db)):
     return cost_analysis
 
 @router.get("/sales-performance")
+@cached_response
 def get_sales_performance_analysis(db: Session = Depends(get_db)):
     """Get sales performance analysis for all items"""
     analytics = InventoryAnalytics(db)
     
     items = db.query(models.Item).filter(models.Item.is_active == True).all()
+    analytics.prime_items(items)
+    analytics.run_columnar_analytics([item.id for item in items])
     performance_data = []
     
     for item in items:
@@ -114,11 +145,19 @@ def get_sales_performance_analysis(db: Session = Depends(get_db)):
     return performance_data
 
 @router.get("/menu-recommendations")
-def get_menu_optimization_recommendations(db: Session = Depends(get_db)):
-    """Get menu optimization recommendations"""
+@cached_response
+def get_menu_optimization_recommendations(max_staleness: Optional[float] = None, db: Session = Depends(get_db)):
+    """Get menu optimization recommendations
+    
+    With max_staleness (seconds), items with a recent enough analytics
+    snapshot are answered from it instead of being recomputed.
+    """
     analytics = InventoryAnalytics(db)
     
     items = db.query(models.Item).filter(models.Item.is_active == True).all()
+    analytics.prime_items(items)
+    live_items = _prime_snapshots(analytics, items, max_staleness)
+    analytics.run_columnar_analytics([item.id for item in live_items])
     recommendations = []
     
     for item in items:
@@ -136,12 +175,18 @@ def get_menu_optimization_recommendations(db: Session = Depends(get_db)):
     
     return recommendations
 
+@router.post("/sales-log/bulk")
+def bulk_log_sales(rows: List[Dict] = Depends(ingest.read_batch), db: Session = Depends(get_db)):
+    """Log many sales at once: a JSON array or CSV with item_id, quantity_sold, revenue, notes"""
+    return ingest.ingest_sales(db, rows)
+
 @router.post("/sales-log")
 def log_sale(
     item_id: int,
     quantity_sold: float,
     revenue: Optional[float] = None,
     notes: Optional[str] = None,
+    response: Response = None,
     db: Session = Depends(get_db)
 ):
     """Log a sale for analytics"""
@@ -150,6 +195,19 @@ def log_sale(
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
+    if settings.SALES_BUFFER_ENABLED:
+        # Accepted once spooled; written to sales history by the next group commit (see sales_buffer)
+        sale = {
+            "item_id": item_id,
+            "quantity_sold": quantity_sold,
+            "revenue": revenue,
+            "notes": notes,
+            "date": datetime.now(timezone.utc)
+        }
+        sales_buffer.log_sale(sale)
+        response.status_code = 202
+        return {"id": None, "item_name": item.name, "buffered": True, **sale}
+    
     # Create sales history entry
     sale_entry = models.SalesHistory(
         item_id=item_id,
@@ -158,6 +216,9 @@ def log_sale(
         notes=notes
     )
     db.add(sale_entry)
+    db.flush()
+    rollups.record_sale(db, sale_entry)
+    smoothing.record_sale(db, sale_entry)
     
     # Update item's last sale date
     item.last_sale_date = sale_entry.date
@@ -176,11 +237,19 @@ def log_sale(
     }
 
 @router.get("/dashboard-summary")
-def get_analytics_dashboard_summary(db: Session = Depends(get_db)):
-    """Get summary analytics for dashboard"""
+@cached_response
+def get_analytics_dashboard_summary(max_staleness: Optional[float] = None, db: Session = Depends(get_db)):
+    """Get summary analytics for dashboard
+    
+    With max_staleness (seconds), items with a recent enough analytics
+    snapshot are answered from it instead of being recomputed.
+    """
     analytics = InventoryAnalytics(db)
     
     items = db.query(models.Item).filter(models.Item.is_active == True).all()
+    analytics.prime_items(items)
+    live_items = _prime_snapshots(analytics, items, max_staleness)
+    analytics.run_columnar_analytics([item.id for item in live_items])
     
     # Calculate summary statistics
     total_items = len(items)
@@ -206,13 +275,13 @@ def get_analytics_dashboard_summary(db: Session = Depends(get_db)):
             if cost_data and cost_data.get("daily_cost"):
                 total_daily_cost += cost_data["daily_cost"]
             
+            # Check menu recommendations (carries the sales velocity too)
+            menu_data = analytics.generate_menu_recommendations(item.id)
+            
             # Check performance
-            sales_data = analytics.analyze_sales_performance(item.id)
-            if sales_data["sales_velocity"] > 5:  # High performing
+            if menu_data["sales_velocity"] > 5:  # High performing
                 high_performance_items += 1
             
-            # Check menu recommendations
-            menu_data = analytics.generate_menu_recommendations(item.id)
             if menu_data["recommendation"] == "remove":
                 items_to_remove += 1
                 
@@ -230,15 +299,38 @@ def get_analytics_dashboard_summary(db: Session = Depends(get_db)):
     }
 
 @router.post("/update-analytics")
-def update_all_analytics(db: Session = Depends(get_db)):
-    """Update analytics for all items (background job)"""
-    analytics = InventoryAnalytics(db)
+def update_all_analytics(incremental: bool = False):
+    """Start an analytics refresh for all items as a background job
     
+    incremental=true only recomputes items changed since their last snapshot.
+    Poll /analytics/jobs/{job_id} for progress.
+    """
     try:
-        analytics.update_analytics_for_all_items()
-        return {"message": "Analytics updated successfully", "timestamp": datetime.now().isoformat()}
+        job_id = jobs.start_refresh(trigger="manual", incremental=incremental)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to update analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to start analytics update: {str(e)}")
+    
+    if job_id is None:
+        return {
+            "message": "Analytics update already running",
+            "job_id": jobs.running_job_id(),
+            "status": "running"
+        }
+    return {"message": "Analytics update started", "job_id": job_id, "status": "running"}
+
+@router.get("/jobs")
+def list_analytics_jobs(limit: int = 20, db: Session = Depends(get_db)):
+    """Get the most recent analytics jobs"""
+    recent = db.query(models.AnalyticsJob).order_by(models.AnalyticsJob.id.desc()).limit(limit).all()
+    return [jobs.job_status(job) for job in recent]
+
+@router.get("/jobs/{job_id}")
+def get_analytics_job(job_id: int, db: Session = Depends(get_db)):
+    """Get status and progress of an analytics job"""
+    job = db.query(models.AnalyticsJob).filter(models.AnalyticsJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.job_status(job)
 
 @router.get("/item/{item_id}/analytics")
 def get_item_analytics_history(item_id: int, db: Session = Depends(get_db)):
@@ -266,7 +358,8 @@ def get_item_analytics_history(item_id: int, db: Session = Depends(get_db)):
             "avg_daily_consumption": latest_analytics.avg_daily_consumption,
             "sales_velocity": latest_analytics.sales_velocity,
             "model_version": latest_analytics.model_version,
-            "last_training_date": latest_analytics.last_training_date
+            "last_training_date": latest_analytics.last_training_date,
+            "model_accuracy": latest_analytics.model_accuracy
         },
         "menu_optimization": {
             "recommendation": latest_menu.recommendation if latest_menu else None,
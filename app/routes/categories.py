@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import Optional
 from .. import models
 from ..database import SessionLocal
+from ..pagination import OptionalPage
 
 router = APIRouter(prefix="/categories", tags=["Categories"])
 
@@ -79,8 +80,7 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
     db.commit()
     return {"message": "Category deleted successfully"}
 
-# List All Categories
+# List All Categories (by id, paginated when a limit is given)
 @router.get("/")
-def list_categories(db: Session = Depends(get_db)):
-    categories = db.query(models.Category).all()
-    return categories
\ No newline at end of file
+def list_categories(page: OptionalPage = Depends(), db: Session = Depends(get_db)):
+    return page.fetch(db.query(models.Category), models.Category.id)
\ No newline at end of file
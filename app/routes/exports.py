@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Iterator, Optional
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, null, select
+from .. import models
+from ..config import settings
+from ..database import SessionLocal
+from ..pagination import DateRange
+
+router = APIRouter(prefix="/exports", tags=["Export"])
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _stream_rows(statements, format: str) -> Iterator[str]:
+    """Serialize selects' rows, one after another, in chunks of EXPORT_BATCH_SIZE read through a server-side cursor.
+
+    The generator owns its session: the response body is sent after the
+    route returns, so a request-scoped session could already be closed.
+    """
+    db = SessionLocal()
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for number, statement in enumerate(statements):
+            result = db.execute(statement.execution_options(yield_per=settings.EXPORT_BATCH_SIZE))
+            columns = list(result.keys())
+            if format == "csv" and number == 0:
+                writer.writerow(columns)
+                # Header right away, so the client starts receiving before the first batch
+                yield buffer.getvalue()
+            for rows in result.partitions():
+                if format == "csv":
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield "".join(_json_encoder.encode(dict(zip(columns, row))) + "\n" for row in rows)
+    finally:
+        db.close()
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+# One encoder for every row; json.dumps(default=...) builds a new one per call
+_json_encoder = json.JSONEncoder(default=_json_default)
+
+def _summaries(columns, counted, item_id: Optional[int], period: DateRange):
+    """Select archived days' rollups (with item names) that have counted rows, shaped by columns.
+
+    Archived history (see retention) is exported as one row per item and day,
+    with no id, the day as its date, and the day's total (for stock, its last
+    count) as the quantity.
+    """
+    Rollup = models.ItemDailyRollup
+    # No archive makes the horizon NULL, which matches no days
+    horizon = select(func.max(models.HistoryArchive.archived_before)).scalar_subquery()
+    statement = select(
+        *columns, models.Item.name.label("item_name")
+    ).outerjoin(models.Item, models.Item.id == Rollup.item_id).where(
+        Rollup.day < horizon, counted > 0
+    ).order_by(Rollup.day, Rollup.item_id)
+    statement = period.apply_days(statement, Rollup.day)
+    if item_id is not None:
+        statement = statement.where(Rollup.item_id == item_id)
+    return statement
+
+def _export(name: str, model, columns, summaries, item_id: Optional[int], period: DateRange,
+            format: str) -> StreamingResponse:
+    """Stream the archived summaries, then model's rows (with item names), oldest first"""
+    statement = select(
+        *columns, models.Item.name.label("item_name")
+    ).outerjoin(models.Item, models.Item.id == model.item_id).order_by(model.date, model.id)
+    statement = period.apply(statement, model.date)
+    if item_id is not None:
+        statement = statement.where(model.item_id == item_id)
+
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(
+        _stream_rows((summaries, statement), format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# GET - Export Stock History
+@router.get("/stock")
+def export_stock_history(
+    item_id: Optional[int] = None,
+    period: DateRange = Depends(),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
+):
+    StockHistory, Rollup = models.StockHistory, models.ItemDailyRollup
+    return _export("stock_history", StockHistory, (
+        StockHistory.id, StockHistory.item_id, StockHistory.quantity, StockHistory.date,
+        StockHistory.notes, StockHistory.staff_name
+    ), _summaries((
+        null().label("id"), Rollup.item_id, Rollup.closing_quantity.label("quantity"), Rollup.day.label("date"),
+        null().label("notes"), null().label("staff_name")
+    ), Rollup.stock_count, item_id, period), item_id, period, format)
+
+# GET - Export Restock History
+@router.get("/restocks")
+def export_restock_history(
+    item_id: Optional[int] = None,
+    period: DateRange = Depends(),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
+):
+    RestockHistory, Rollup = models.RestockHistory, models.ItemDailyRollup
+    return _export("restock_history", RestockHistory, (
+        RestockHistory.id, RestockHistory.item_id, RestockHistory.restock_amount, RestockHistory.cost_per_unit,
+        RestockHistory.date, RestockHistory.supplier, RestockHistory.notes
+    ), _summaries((
+        null().label("id"), Rollup.item_id, Rollup.restocked_amount.label("restock_amount"),
+        null().label("cost_per_unit"), Rollup.day.label("date"), null().label("supplier"), null().label("notes")
+    ), Rollup.restock_count, item_id, period), item_id, period, format)
+
+# GET - Export Sales History
+@router.get("/sales")
+def export_sales_history(
+    item_id: Optional[int] = None,
+    period: DateRange = Depends(),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
+):
+    SalesHistory, Rollup = models.SalesHistory, models.ItemDailyRollup
+    return _export("sales_history", SalesHistory, (
+        SalesHistory.id, SalesHistory.item_id, SalesHistory.quantity_sold, SalesHistory.revenue,
+        SalesHistory.date, SalesHistory.notes
+    ), _summaries((
+        null().label("id"), Rollup.item_id, Rollup.units_sold.label("quantity_sold"), Rollup.revenue,
+        Rollup.day.label("date"), null().label("notes")
+    ), Rollup.sales_count, item_id, period), item_id, period, format)
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from .. import models
+from .. import models, queries
 from ..database import SessionLocal
+from ..pagination import DateRange, OptionalPage
 
 router = APIRouter(prefix="/items", tags=["Items"])
 
@@ -109,22 +110,19 @@ def get_item(item_id: int, db: Session = Depends(get_db)):
         "category_name": item.category.name if item.category else None
     }
 
-# Get All Items
+# Get All Items (by id, paginated when a limit is given; from/to filter on when the item last changed)
 @router.get("/")
-def get_all_items(db: Session = Depends(get_db)):
-    items = db.query(models.Item).all()
-    return [
-        {
-            "id": item.id,
-            "name": item.name,
-            "quantity": item.quantity,
-            "unit": item.unit,
-            "restock_threshold": item.restock_threshold,
-            "category_id": item.category_id,
-            "category_name": item.category.name if item.category else None
-        }
-        for item in items
-    ]
+def get_all_items(
+    item_id: Optional[int] = None,
+    updated: DateRange = Depends(),
+    page: OptionalPage = Depends(),
+    db: Session = Depends(get_db)
+):
+    query = updated.apply(queries.items(db), models.Item.updated_at)
+    if item_id is not None:
+        query = query.filter(models.Item.id == item_id)
+    items = page.fetch(query, models.Item.id)
+    return queries.rows(items)
 
 # Get All Items Within a Category
 @router.get("/category/{category_id}")
@@ -134,16 +132,5 @@ def get_items_by_category(category_id: int, db: Session = Depends(get_db)):
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    items = db.query(models.Item).filter(models.Item.category_id == category_id).all()
-    return [
-        {
-            "id": item.id,
-            "name": item.name,
-            "quantity": item.quantity,
-            "unit": item.unit,
-            "restock_threshold": item.restock_threshold,
-            "category_id": item.category_id,
-            "category_name": category.name
-        }
-        for item in items
-    ]
+    items = queries.items(db).filter(models.Item.category_id == category_id).all()
+    return queries.rows(items)
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import Optional
-from .. import models
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from .. import ingest, models, queries, rollups, smoothing
 from ..database import SessionLocal
+from ..pagination import DateRange, Page
 
 router = APIRouter(prefix="/restocks", tags=["Restock"])
 
@@ -36,6 +38,10 @@ def log_restock(
         notes=notes
     )
     db.add(restock_entry)
+    db.flush()
+    rollups.record_restock(db, restock_entry)
+    rollups.refresh_stock_days(db, item_id, rollups.restock_days_affected(db, restock_entry))
+    smoothing.record_restock(db, restock_entry)
     
     # Update current stock in items table
     item.quantity += restock_amount
@@ -53,6 +59,11 @@ def log_restock(
         "notes": restock_entry.notes
     }
 
+# POST - Log Many Restocks (JSON array or CSV with item_id, restock_amount, supplier, notes)
+@router.post("/bulk")
+def bulk_log_restocks(rows: List[Dict] = Depends(ingest.read_batch), db: Session = Depends(get_db)):
+    return ingest.ingest_restocks(db, rows)
+
 # PUT - Edit Restock Log
 @router.put("/{restock_id}")
 def edit_restock_log(
@@ -70,11 +81,17 @@ def edit_restock_log(
     old_amount = restock_entry.restock_amount
     if restock_amount is not None and restock_amount != old_amount:
         restock_entry.restock_amount = restock_amount
+        rollups.record_restock(db, restock_entry, amount=restock_amount - old_amount, count=0)
+        db.flush()
+        rollups.refresh_stock_days(db, restock_entry.item_id, rollups.restock_days_affected(db, restock_entry))
+        smoothing.mark_stale(db, restock_entry.item_id)
         # Update current stock in items table
         item = db.query(models.Item).filter(models.Item.id == restock_entry.item_id).first()
         if item:
             # Remove old amount and add new amount
             item.quantity = item.quantity - old_amount + restock_amount
+            # Mark the item for the next incremental analytics run
+            item.updated_at = datetime.now(timezone.utc)
     
     if supplier is not None:
         restock_entry.supplier = supplier
@@ -105,51 +122,57 @@ def delete_restock_log(restock_id: int, db: Session = Depends(get_db)):
     item = db.query(models.Item).filter(models.Item.id == restock_entry.item_id).first()
     if item:
         item.quantity -= restock_entry.restock_amount
+        # Mark the item for the next incremental analytics run
+        item.updated_at = datetime.now(timezone.utc)
     
+    rollups.record_restock(db, restock_entry, amount=-restock_entry.restock_amount, count=-1)
+    affected_days = rollups.restock_days_affected(db, restock_entry)
     db.delete(restock_entry)
+    db.flush()
+    rollups.refresh_stock_days(db, restock_entry.item_id, affected_days)
+    smoothing.mark_stale(db, restock_entry.item_id)
     db.commit()
     
     return {"message": "Restock log deleted successfully"}
 
-# GET - Get All Restock History
+# GET - Get All Restock History (newest first, paginated)
 @router.get("/")
-def get_all_restock_history(db: Session = Depends(get_db)):
-    restock_entries = db.query(models.RestockHistory).order_by(models.RestockHistory.date.desc()).all()
+def get_all_restock_history(
+    item_id: Optional[int] = None,
+    period: DateRange = Depends(),
+    page: Page = Depends(),
+    db: Session = Depends(get_db)
+):
+    query = period.apply(queries.restock_history(db), models.RestockHistory.date)
+    if item_id is not None:
+        query = query.filter(models.RestockHistory.item_id == item_id)
+    restock_entries = page.fetch_history(
+        query, (models.RestockHistory.date, models.RestockHistory.id),
+        queries.archived(db, queries.restock_summaries, period, item_id), queries.SUMMARY_KEYS
+    )
     
-    return [
-        {
-            "id": entry.id,
-            "item_id": entry.item_id,
-            "item_name": entry.item.name if entry.item else None,
-            "restock_amount": entry.restock_amount,
-            "date": entry.date,
-            "supplier": entry.supplier,
-            "notes": entry.notes
-        }
-        for entry in restock_entries
-    ]
+    return queries.rows(restock_entries)
 
-# GET - Get Restock History for Specific Item
+# GET - Get Restock History for Specific Item (newest first, paginated)
 @router.get("/item/{item_id}")
-def get_restock_history_for_item(item_id: int, db: Session = Depends(get_db)):
+def get_restock_history_for_item(
+    item_id: int,
+    period: DateRange = Depends(),
+    page: Page = Depends(),
+    db: Session = Depends(get_db)
+):
     # Check if item exists
     item = db.query(models.Item).filter(models.Item.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    restock_entries = db.query(models.RestockHistory).filter(
-        models.RestockHistory.item_id == item_id
-    ).order_by(models.RestockHistory.date.desc()).all()
+    query = period.apply(
+        queries.restock_history(db).filter(models.RestockHistory.item_id == item_id),
+        models.RestockHistory.date
+    )
+    restock_entries = page.fetch_history(
+        query, (models.RestockHistory.date, models.RestockHistory.id),
+        queries.archived(db, queries.restock_summaries, period, item_id), queries.SUMMARY_KEYS
+    )
     
-    return [
-        {
-            "id": entry.id,
-            "item_id": entry.item_id,
-            "item_name": item.name,
-            "restock_amount": entry.restock_amount,
-            "date": entry.date,
-            "supplier": entry.supplier,
-            "notes": entry.notes
-        }
-        for entry in restock_entries
-    ] 
\ No newline at end of file
+    return queries.rows(restock_entries) 
\ No newline at end of file
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import Optional
-from .. import models
+from typing import Dict, List, Optional
+from datetime import datetime, timezone
+from .. import ingest, models, queries, rollups, smoothing
 from ..database import SessionLocal
+from ..pagination import DateRange, Page
 
 router = APIRouter(prefix="/stock", tags=["Stock"])
 
@@ -36,9 +38,13 @@ def log_stock(
         staff_name=staff_name
     )
     db.add(stock_entry)
+    db.flush()
+    rollups.record_stock_count(db, stock_entry)
+    smoothing.record_stock_count(db, stock_entry)
     
     # Update current stock in items table
     item.quantity = quantity
+    item.updated_at = datetime.now(timezone.utc)
     
     db.commit()
     db.refresh(stock_entry)
@@ -53,6 +59,11 @@ def log_stock(
         "staff_name": stock_entry.staff_name
     }
 
+# POST - Log Many Stock Counts (JSON array or CSV with item_id, quantity, notes, staff_name)
+@router.post("/bulk")
+def bulk_log_stock(rows: List[Dict] = Depends(ingest.read_batch), db: Session = Depends(get_db)):
+    return ingest.ingest_stock_counts(db, rows)
+
 # PUT - Edit Stock Log
 @router.put("/{stock_id}")
 def edit_stock_log(
@@ -67,11 +78,17 @@ def edit_stock_log(
         raise HTTPException(status_code=404, detail="Stock log not found")
     
     if quantity is not None:
+        affected_days = rollups.stock_days_affected(db, stock_entry)
         stock_entry.quantity = quantity
+        db.flush()
+        rollups.refresh_stock_days(db, stock_entry.item_id, affected_days)
+        smoothing.mark_stale(db, stock_entry.item_id)
         # Update current stock in items table
         item = db.query(models.Item).filter(models.Item.id == stock_entry.item_id).first()
         if item:
             item.quantity = quantity
+            # Set explicitly: onupdate doesn't fire when the count equals the current quantity
+            item.updated_at = datetime.now(timezone.utc)
     
     if notes is not None:
         stock_entry.notes = notes
@@ -98,50 +115,59 @@ def delete_stock_log(stock_id: int, db: Session = Depends(get_db)):
     if not stock_entry:
         raise HTTPException(status_code=404, detail="Stock log not found")
     
+    affected_days = rollups.stock_days_affected(db, stock_entry)
     db.delete(stock_entry)
+    db.flush()
+    rollups.refresh_stock_days(db, stock_entry.item_id, affected_days)
+    smoothing.mark_stale(db, stock_entry.item_id)
+    
+    # Mark the item for the next incremental analytics run
+    item = db.query(models.Item).filter(models.Item.id == stock_entry.item_id).first()
+    if item:
+        item.updated_at = datetime.now(timezone.utc)
+    
     db.commit()
     
     return {"message": "Stock log deleted successfully"}
 
-# GET - Get All Stock History
+# GET - Get All Stock History (newest first, paginated)
 @router.get("/")
-def get_all_stock_history(db: Session = Depends(get_db)):
-    stock_entries = db.query(models.StockHistory).order_by(models.StockHistory.date.desc()).all()
-    
-    return [
-        {
-            "id": entry.id,
-            "item_id": entry.item_id,
-            "item_name": entry.item.name if entry.item else None,
-            "quantity": entry.quantity,
-            "date": entry.date,
-            "notes": entry.notes,
-            "staff_name": entry.staff_name
-        }
-        for entry in stock_entries
-    ]
+def get_all_stock_history(
+    item_id: Optional[int] = None,
+    period: DateRange = Depends(),
+    page: Page = Depends(),
+    db: Session = Depends(get_db)
+):
+    query = period.apply(queries.stock_history(db), models.StockHistory.date)
+    if item_id is not None:
+        query = query.filter(models.StockHistory.item_id == item_id)
+    stock_entries = page.fetch_history(
+        query, (models.StockHistory.date, models.StockHistory.id),
+        queries.archived(db, queries.stock_summaries, period, item_id), queries.SUMMARY_KEYS
+    )
+    
+    return queries.rows(stock_entries)
 
-# GET - Get Stock History for Specific Item
+# GET - Get Stock History for Specific Item (newest first, paginated)
 @router.get("/item/{item_id}")
-def get_stock_history_for_item(item_id: int, db: Session = Depends(get_db)):
+def get_stock_history_for_item(
+    item_id: int,
+    period: DateRange = Depends(),
+    page: Page = Depends(),
+    db: Session = Depends(get_db)
+):
     # Check if item exists
     item = db.query(models.Item).filter(models.Item.id == item_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    stock_entries = db.query(models.StockHistory).filter(
-        models.StockHistory.item_id == item_id
-    ).order_by(models.StockHistory.date.desc()).all()
-    
-    return [
-        {
-            "id": entry.id,
-            "item_id": entry.item_id,
-            "item_name": item.name,
-            "quantity": entry.quantity,
-            "date": entry.date,
-            "notes": entry.notes,
-            "staff_name": entry.staff_name
-        }
-        for entry in stock_entries
-    ] 
\ No newline at end of file
+    query = period.apply(
+        queries.stock_history(db).filter(models.StockHistory.item_id == item_id),
+        models.StockHistory.date
+    )
+    stock_entries = page.fetch_history(
+        query, (models.StockHistory.date, models.StockHistory.id),
+        queries.archived(db, queries.stock_summaries, period, item_id), queries.SUMMARY_KEYS
+    )
+    
+    return queries.rows(stock_entries) 
\ No newline at end of file
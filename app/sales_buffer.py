@@ -0,0 +1,241 @@
+"""
+Write-behind logging of sales (SALES_BUFFER_ENABLED).
+
+POST /analytics/sales-log acknowledges a buffered sale once it is appended to
+this worker's spool segment, an append-only NDJSON file in SALES_SPOOL_DIR,
+and fsynced (concurrent appends share one fsync). A flusher thread
+group-commits the spool every SALES_FLUSH_INTERVAL_MS, or sooner once
+SALES_FLUSH_MAX_ROWS sales are waiting. It rotates to a fresh segment, then
+writes the closed segment's sales in one transaction (see
+ingest.write_sales: one INSERT, rollups, Holt-Winters states and one
+last_sale_date per item), recording the segment in sales_spool_segments in
+the same transaction before deleting the file.
+
+On startup, segments left behind by a crashed worker are replayed. A writer
+holds an exclusive flock on its segments, so live workers' segments are
+skipped. Segments already recorded as committed are only deleted, so a crash
+between the commit and the delete doesn't count sales twice.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+from . import ingest, models
+from .config import settings
+from .database import SessionLocal
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single worker
+    fcntl = None
+
+logger = logging.getLogger("stocker.sales")
+
+SEGMENT_PREFIX = "sales-"
+SEGMENT_SUFFIX = ".ndjson"
+
+def _lock(file) -> bool:
+    """Take the exclusive lock that marks a segment as owned by a live worker"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+def _read_segment(path: str) -> List[Dict]:
+    sales = []
+    with open(path) as segment:
+        for number, line in enumerate(segment, start=1):
+            try:
+                sale = json.loads(line)
+            except ValueError:
+                # A torn final write from a crash was never acknowledged
+                logger.warning("Skipping unreadable line %d of %s", number, path)
+                continue
+            sale["date"] = datetime.fromisoformat(sale["date"])
+            sales.append(sale)
+    return sales
+
+def commit_segment(path: str) -> int:
+    """Write a segment's sales to the database unless already committed. Returns rows written."""
+    name = os.path.basename(path)
+    db = SessionLocal()
+    try:
+        if db.query(models.SalesSpoolSegment.id).filter(models.SalesSpoolSegment.name == name).first():
+            return 0
+
+        sales = _read_segment(path)
+        item_ids = {sale["item_id"] for sale in sales}
+        known = {item_id for (item_id,) in db.query(models.Item.id).filter(models.Item.id.in_(item_ids))} if item_ids else set()
+        dropped = [sale for sale in sales if sale["item_id"] not in known]
+        if dropped:
+            logger.warning("Dropping %d spooled sale(s) of deleted items from %s", len(dropped), name)
+            sales = [sale for sale in sales if sale["item_id"] in known]
+
+        if sales:
+            ingest.write_sales(db, sales)
+        db.add(models.SalesSpoolSegment(name=name, rows=len(sales)))
+        db.commit()
+        return len(sales)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def replay_spool(directory: str) -> int:
+    """Commit segments no live worker owns (left by a crash). Returns sales written."""
+    if not os.path.isdir(directory):
+        return 0
+
+    written = 0
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            segment = open(path, "a")
+        except FileNotFoundError:
+            continue
+        try:
+            # Skip segments a live worker holds, or one that committed it meanwhile
+            if not _lock(segment) or os.fstat(segment.fileno()).st_nlink == 0:
+                continue
+            rows = commit_segment(path)
+            os.unlink(path)
+            written += rows
+            logger.info("Replayed %d spooled sale(s) from %s", rows, name)
+        finally:
+            segment.close()
+    return written
+
+class SalesSpool:
+    """This worker's spool: the segment being appended to and closed ones awaiting commit"""
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()  # Current segment and counters
+        self._sync_lock = threading.Lock()  # fsync and rotation; taken before _lock
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._closed: List = []
+        self._written = 0
+        self._synced = 0
+        self._pending = 0
+        self.committed = 0
+        os.makedirs(directory, exist_ok=True)
+        self._file = self._open_segment()
+
+    def _open_segment(self):
+        path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{os.getpid()}-{time.time_ns()}{SEGMENT_SUFFIX}")
+        segment = open(path, "a")
+        _lock(segment)
+        return segment
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sales-spool-flusher", daemon=True)
+        self._thread.start()
+
+    def append(self, sale: Dict):
+        """Spool a sale; once this returns the sale survives a crash"""
+        line = json.dumps({**sale, "date": sale["date"].isoformat()}) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._written += 1
+            sequence = self._written
+            self._pending += 1
+            if self._pending >= settings.SALES_FLUSH_MAX_ROWS:
+                self._wake.set()
+        if settings.SALES_SPOOL_FSYNC:
+            self._sync(sequence)
+
+    def _sync(self, sequence: int):
+        """fsync the current segment unless another append's fsync already covered sequence"""
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                target = self._written
+            os.fsync(self._file.fileno())
+            self._synced = target
+
+    def _rotate(self):
+        """Close the current segment for commit and start a new one"""
+        with self._sync_lock, self._lock:
+            if self._pending == 0:
+                return
+            if settings.SALES_SPOOL_FSYNC:
+                os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._closed.append(self._file)
+            self._file = self._open_segment()
+            self._pending = 0
+
+    def flush(self) -> int:
+        """Commit everything spooled so far. Returns sales written."""
+        written = 0
+        with self._flush_lock:
+            self._rotate()
+            while self._closed:
+                segment = self._closed[0]
+                written += commit_segment(segment.name)
+                os.unlink(segment.name)
+                segment.close()
+                self._closed.pop(0)
+        self.committed += written
+        return written
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(settings.SALES_FLUSH_INTERVAL_MS / 1000)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Segments stay on disk and in _closed, so the next round retries them
+                logger.exception("Committing spooled sales failed")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"pending": self._pending, "awaiting_commit": len(self._closed), "committed": self.committed}
+
+    def close(self):
+        """Stop the flusher, commit what's left and remove the empty current segment"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        with self._lock:
+            os.unlink(self._file.name)
+            self._file.close()
+
+_spool: Optional[SalesSpool] = None
+
+def start():
+    """Replay segments left by crashed workers, then start this worker's spool"""
+    global _spool
+    replayed = replay_spool(settings.SALES_SPOOL_DIR)
+    if replayed:
+        logger.info("Replayed %d spooled sale(s) on startup", replayed)
+    _spool = SalesSpool(settings.SALES_SPOOL_DIR)
+    _spool.start()
+
+def stop():
+    global _spool
+    if _spool is not None:
+        _spool.close()
+        _spool = None
+
+def log_sale(sale: Dict):
+    """Spool a sale (item_id, quantity_sold, revenue, notes, date) for the next group commit"""
+    if _spool is None:
+        raise RuntimeError("Sales buffer is not running")
+    _spool.append(sale)
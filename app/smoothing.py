@@ -0,0 +1,271 @@
+"""
+Incremental Holt-Winters forecasting of each item's daily demand.
+
+An item's demand on a day is what it sold plus any stock loss a count reveals
+beyond those sales and restocks (waste, untracked use). Write routes fold each
+sale, restock and stock count into the item's ItemForecastState in constant
+time: events accumulate into the day in progress, and an event on a later day
+folds that day (and the empty days since, up to MAX_CATCH_UP_DAYS) into the
+level, trend and weekday seasonal offsets. Forecasts are arithmetic on the
+state. Edits and deletes can't be backed out incrementally, so they only mark
+the item's state stale; the next analytics refresh replays its history with
+rebuild_states(), which is also the backfill path. Until then forecasts use the
+state as it was. Days before the archive horizon (see retention) are replayed
+from their daily rollups, one sale, restock and closing count per day.
+
+States are only kept up to date with FORECAST_MODE=smoothing: in the other
+modes nothing reads them, so writes skip the state row and its lock. Run
+rebuild_forecast_states.py when switching smoothing on.
+"""
+import heapq
+from datetime import date, datetime, time, timedelta, timezone
+from types import SimpleNamespace
+from typing import Iterable, Iterator, List, Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from . import events, models, retention, rollups
+from .config import settings
+
+# Bump when the update rules change, and run rebuild_forecast_states.py: stored
+# states aren't compared against it, so nothing rebuilds them automatically
+STATE_VERSION = 1
+
+SEASON_LENGTH = 7
+
+# Empty days folded in when an event follows a gap; longer gaps add nothing more
+MAX_CATCH_UP_DAYS = 4 * SEASON_LENGTH
+
+# Days folded in before one-day-ahead errors count towards accuracy
+WARMUP_DAYS = SEASON_LENGTH
+
+STATE_FIELDS = (
+    "level", "trend", "season", "observations", "day", "day_demand", "last_count_quantity",
+    "sold_since_count", "restocked_since_count", "absolute_error", "actual_demand",
+)
+
+def _new_state_values(item_id: int) -> dict:
+    return dict(
+        item_id=item_id, level=0.0, trend=0.0, season=[0.0] * SEASON_LENGTH, observations=0,
+        day=None, day_demand=0.0, last_count_quantity=None, sold_since_count=0.0,
+        restocked_since_count=0.0, absolute_error=0.0, actual_demand=0.0
+    )
+
+def new_state(item_id: int) -> models.ItemForecastState:
+    return models.ItemForecastState(**_new_state_values(item_id))
+
+def _fold_day(state, day: date, demand: float):
+    """Update level, trend and the weekday's seasonal offset with one day's demand"""
+    season = list(state.season or [0.0] * SEASON_LENGTH)
+    weekday = day.weekday()
+    if state.observations == 0:
+        state.level = demand
+        state.trend = 0.0
+    else:
+        if state.observations >= WARMUP_DAYS:
+            expected = max(0.0, state.level + state.trend + season[weekday])
+            state.absolute_error += abs(demand - expected)
+            state.actual_demand += demand
+        previous_level = state.level
+        alpha, beta, gamma = settings.SMOOTHING_ALPHA, settings.SMOOTHING_BETA, settings.SMOOTHING_GAMMA
+        state.level = alpha * (demand - season[weekday]) + (1 - alpha) * (state.level + state.trend)
+        state.trend = beta * (state.level - previous_level) + (1 - beta) * state.trend
+        season[weekday] = gamma * (demand - state.level) + (1 - gamma) * season[weekday]
+    # A new list, so the JSON column registers the change
+    state.season = season
+    state.observations += 1
+
+def _advance(state, day: date):
+    """Fold the day in progress (and empty days after it) once an event lands on a later day"""
+    if state.day is None:
+        state.day = day
+        return
+    if day <= state.day:
+        return
+
+    _fold_day(state, state.day, state.day_demand)
+    empty_days = (day - state.day).days - 1
+    for offset in range(1, min(empty_days, MAX_CATCH_UP_DAYS) + 1):
+        _fold_day(state, state.day + timedelta(days=offset), 0.0)
+    state.day = day
+    state.day_demand = 0.0
+
+def observe_sale(state, quantity: float, when):
+    _advance(state, rollups.day_of(when))
+    state.day_demand += quantity
+    state.sold_since_count += quantity
+
+def observe_restock(state, amount: float, when):
+    _advance(state, rollups.day_of(when))
+    state.restocked_since_count += amount
+
+def observe_count(state, quantity: float, when):
+    _advance(state, rollups.day_of(when))
+    if state.last_count_quantity is not None:
+        loss = state.last_count_quantity + state.restocked_since_count - quantity - state.sold_since_count
+        state.day_demand += max(0.0, loss)
+    state.last_count_quantity = quantity
+    state.sold_since_count = 0.0
+    state.restocked_since_count = 0.0
+
+def forecast(state, today: date, horizon: int) -> Optional[List[float]]:
+    """Demand for each of the next horizon days starting today, or None without data"""
+    if state is None:
+        return None
+    # Fold the days elapsed since the last event on a copy
+    current = SimpleNamespace(**{field: getattr(state, field) for field in STATE_FIELDS})
+    _advance(current, today)
+    if current.observations == 0:
+        return None
+
+    season = current.season or [0.0] * SEASON_LENGTH
+    return [
+        max(0.0, current.level + (step + 1) * current.trend
+            + season[(today + timedelta(days=step)).weekday()])
+        for step in range(horizon)
+    ]
+
+def accuracy(state) -> Optional[float]:
+    """1 - weighted absolute percentage error of the one-day-ahead forecasts"""
+    if state is None or not state.actual_demand:
+        return None
+    return max(0.0, 1.0 - state.absolute_error / state.actual_demand)
+
+def seasonality_factor(state, day: date) -> Optional[float]:
+    """Expected demand on day's weekday relative to the level"""
+    if state is None or not state.level or state.level <= 0:
+        return None
+    season = state.season or [0.0] * SEASON_LENGTH
+    return max(0.0, state.level + season[day.weekday()]) / state.level
+
+# Live updates from the write routes
+
+def enabled() -> bool:
+    """Whether states are kept up to date and forecast from"""
+    return settings.FORECAST_MODE == "smoothing"
+
+def _lock_states(db: Session, item_ids: Iterable[int]) -> dict:
+    """Lock and return the items' states by item_id, creating missing ones.
+
+    SELECT ... FOR UPDATE locks nothing for a missing row, so two first
+    writes for an item could both add a state and one would fail on the
+    unique item_id. Missing states are inserted with ON CONFLICT DO NOTHING
+    first (as rollups._upsert does), so both writers then lock the same row.
+    """
+    item_ids = set(item_ids)
+    query = db.query(models.ItemForecastState).filter(models.ItemForecastState.item_id.in_(item_ids))
+    states = {state.item_id: state for state in query.with_for_update()}
+    missing = item_ids - set(states)
+    if not missing:
+        return states
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        db.execute(dialect_insert(models.ItemForecastState).values(
+            [{**_new_state_values(item_id), "updated_at": datetime.now(timezone.utc)} for item_id in missing]
+        ).on_conflict_do_nothing(index_elements=["item_id"]))
+        query = db.query(models.ItemForecastState).filter(models.ItemForecastState.item_id.in_(missing))
+        states.update((state.item_id, state) for state in query.with_for_update())
+        return states
+
+    # Generic fallback: add them and rely on the unique item_id
+    for item_id in missing:
+        states[item_id] = new_state(item_id)
+        db.add(states[item_id])
+    return states
+
+def _state_for_update(db: Session, item_id: int) -> models.ItemForecastState:
+    state = _lock_states(db, [item_id])[item_id]
+    state.updated_at = datetime.now(timezone.utc)
+    return state
+
+def record_sale(db: Session, entry: models.SalesHistory):
+    if not enabled():
+        return
+    observe_sale(_state_for_update(db, entry.item_id), entry.quantity_sold, entry.date)
+
+def record_restock(db: Session, entry: models.RestockHistory):
+    if not enabled():
+        return
+    observe_restock(_state_for_update(db, entry.item_id), entry.restock_amount, entry.date)
+
+def record_stock_count(db: Session, entry: models.StockHistory):
+    if not enabled():
+        return
+    observe_count(_state_for_update(db, entry.item_id), entry.quantity, entry.date)
+
+def record_batch(db: Session, kind: int, entries: List[dict]):
+    """Fold a batch of inserted history rows of one kind (see events) into their items' states"""
+    if not enabled():
+        return
+    states = _lock_states(db, {entry["item_id"] for entry in entries})
+    now = datetime.now(timezone.utc)
+    observe, field = {
+        events.SALE: (observe_sale, "quantity_sold"),
+        events.RESTOCK: (observe_restock, "restock_amount"),
+        events.COUNT: (observe_count, "quantity"),
+    }[kind]
+    for entry in entries:
+        state = states[entry["item_id"]]
+        observe(state, entry[field], entry["date"])
+        state.updated_at = now
+
+# Backfill
+
+def mark_stale(db: Session, item_id: int):
+    """Have the next analytics refresh rebuild the item's state, after an edit or delete of its history"""
+    db.query(models.ItemForecastState).filter(models.ItemForecastState.item_id == item_id).update(
+        {"stale": True}, synchronize_session=False
+    )
+
+def _archived_events(db: Session, item_ids: Optional[List[int]], before: date) -> Iterator[events.Event]:
+    """Archived days as events from their rollups: sales and restocks at midnight, the closing count at day end"""
+    Rollup = models.ItemDailyRollup
+    query = db.query(
+        Rollup.item_id, Rollup.day, Rollup.units_sold, Rollup.restocked_amount, Rollup.closing_quantity
+    ).filter(Rollup.day < before)
+    if item_ids is not None:
+        query = query.filter(Rollup.item_id.in_(item_ids))
+    for item_id, day, sold, restocked, closing in query.order_by(Rollup.item_id, Rollup.day).yield_per(events.BATCH_SIZE):
+        if sold:
+            yield events.Event(item_id, datetime.combine(day, time.min), events.SALE, 0, sold)
+        if restocked:
+            yield events.Event(item_id, datetime.combine(day, time.min), events.RESTOCK, 0, restocked)
+        if closing is not None:
+            yield events.Event(item_id, datetime.combine(day, time.max), events.COUNT, 0, closing)
+
+def rebuild_states(db: Session, item_ids: Optional[List[int]] = None) -> int:
+    """Replay history into fresh states. Returns states written."""
+    if item_ids is not None and not item_ids:
+        return 0
+    delete_query = db.query(models.ItemForecastState)
+    if item_ids is not None:
+        delete_query = delete_query.filter(models.ItemForecastState.item_id.in_(item_ids))
+    delete_query.delete(synchronize_session=False)
+
+    horizon = retention.archive_horizon(db)
+    if horizon is None:
+        stream = events.merged_events(db, item_ids)
+    else:
+        # The archived days' counts stand in for the carryovers
+        stream = heapq.merge(
+            _archived_events(db, item_ids, horizon), events.merged_events(db, item_ids, carryovers=False)
+        )
+
+    observe = {events.SALE: observe_sale, events.RESTOCK: observe_restock, events.COUNT: observe_count}
+    states = {}
+    for event in stream:
+        if event.item_id not in states:
+            states[event.item_id] = new_state(event.item_id)
+        observe[event.kind](states[event.item_id], event.value, event.date)
+
+    db.add_all(states.values())
+    db.flush()
+    return len(states)
+
+def rebuild_stale_states(db: Session) -> int:
+    """Rebuild the states marked stale (see mark_stale). Returns states written."""
+    item_ids = [item_id for (item_id,) in db.query(models.ItemForecastState.item_id).filter(
+        models.ItemForecastState.stale.is_(True)
+    )]
+    return rebuild_states(db, item_ids)
@@ -0,0 +1,81 @@
+"""
+Tuned SQLite profile, installed by database.py when DATABASE_URL is SQLite.
+
+Every connection is set up with:
+- journal_mode=WAL: readers and the writer don't block each other, and a
+  commit appends to the write-ahead log instead of rewriting pages.
+- synchronous=NORMAL: the log is fsynced at checkpoints, not every commit.
+  In WAL mode this can't corrupt the database; a power loss (not a crash of
+  the process) can undo the last commits.
+- mmap_size: pages are read through a memory map instead of read() calls.
+- busy_timeout: a write waits this long for another connection's write lock
+  instead of failing with "database is locked".
+
+SQLite has one write lock per database file. With SQLITE_SINGLE_WRITER a
+worker's threads queue for it on a process-wide lock, taken at a
+transaction's first write and released when its connection goes back to the
+pool. The next writer then starts as soon as the last one is done, where
+SQLite's busy handler would poll with sleeps of up to 100 ms. pysqlite opens
+a transaction just before its first write, so a transaction never holds a
+read snapshot older than the lock. Other processes still meet at
+busy_timeout.
+"""
+import re
+import threading
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+
+# Statements that need SQLite's write lock
+_WRITE = re.compile(r"\s*(INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b", re.IGNORECASE)
+
+class WriterLock:
+    """Process-wide lock on SQLite's write lock, released from whichever thread checks the connection in"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.owner: Optional[int] = None  # Thread that took it
+
+    def acquire(self, timeout: float) -> bool:
+        if self.owner == threading.get_ident():
+            # This thread's other connection holds it; let SQLite arbitrate as it would without the lock
+            return False
+        if not self._lock.acquire(timeout=timeout):
+            return False
+        self.owner = threading.get_ident()
+        return True
+
+    def release(self):
+        self.owner = None
+        self._lock.release()
+
+writer_lock = WriterLock()
+
+def tune_engine(engine: Engine):
+    """Apply the SQLite profile to every connection of engine"""
+    @event.listens_for(engine, "connect")
+    def _configure(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+            cursor.execute(f"PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}")
+            cursor.execute(f"PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+        finally:
+            cursor.close()
+
+    if not settings.SQLITE_SINGLE_WRITER:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _take_write_lock(conn, cursor, statement, parameters, context, executemany):
+        info = conn.connection.record_info
+        if "writer" in info or not _WRITE.match(statement):
+            return
+        # Past the timeout, go ahead and let busy_timeout decide
+        info["writer"] = writer_lock.acquire(settings.SQLITE_BUSY_TIMEOUT_MS / 1000)
+
+    @event.listens_for(engine, "checkin")
+    def _release_write_lock(dbapi_connection, connection_record):
+        if connection_record.record_info.pop("writer", False):
+            writer_lock.release()
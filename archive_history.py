@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+History Archive Script
+Archives raw stock, sales and restock history older than
+HISTORY_RETENTION_MONTHS (or --before a day) into its daily rollups, and on
+PostgreSQL creates the monthly history partitions ahead (see app/retention.py)
+
+Usage:
+    python archive_history.py                      # archive past HISTORY_RETENTION_MONTHS
+    python archive_history.py --before 2024-01-01
+"""
+
+import argparse
+import sys
+import os
+from datetime import date
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, SessionLocal
+from app import migrations, retention
+from app.jobs import RefreshLock
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Archive old history into daily rollups")
+    parser.add_argument("--before", type=date.fromisoformat,
+                        help="Archive history dated before this day (default: HISTORY_RETENTION_MONTHS ago)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    before = args.before or retention.retention_cutoff()
+
+    # Bring older databases up to the current schema (partitions history on PostgreSQL)
+    migrations.upgrade(engine)
+    created = retention.maintain_partitions(engine)
+    if created:
+        print(f"🗂️  Created partitions {', '.join(created)}")
+
+    if before is None:
+        print("✅ HISTORY_RETENTION_MONTHS is 0, nothing to archive (pass --before to archive anyway)")
+        return
+
+    # Archive between analytics refreshes, which read the history being removed
+    lock = RefreshLock()
+    if not lock.acquire():
+        print("⏳ An analytics refresh is running, try again once it finishes")
+        sys.exit(1)
+
+    print(f"📦 Archiving history before {before}...")
+    db = SessionLocal()
+    try:
+        result = retention.archive_history(db, before)
+        if result is None:
+            print(f"✅ History before {retention.archive_horizon(db)} is already archived")
+            return
+        db.commit()
+        print(f"✅ Archived {result['stock_history']} stock counts, {result['sales_history']} sales "
+              f"and {result['restock_history']} restocks")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error archiving history: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+        lock.release()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Analytics benchmark suite
+Seeds a throwaway SQLite database with synthetic coffee-shop data, then times
+every InventoryAnalytics method and /analytics/* endpoint, reporting wall time,
+SQL statement count and peak Python memory. Results are written as JSON so runs
+can be compared across commits. The concurrent cases post stock counts and
+sales from --writers threads, alongside as many readers, to compare database
+profiles (the SQLite profile, or PostgreSQL via --database-url).
+
+Usage:
+    python benchmarks/run_benchmarks.py --items 200 --days 180 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json   # show ratios vs an earlier run
+    python benchmarks/run_benchmarks.py --only concurrent --database-url postgresql://...
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Stocker analytics")
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (median is reported)")
+    parser.add_argument("--only", help="Run only cases whose name contains this string")
+    parser.add_argument("--writers", type=int, default=8, help="Writer (and reader) threads of the concurrent cases")
+    parser.add_argument("--database-url", help="Benchmark an existing database instead of a throwaway SQLite file")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    return parser.parse_args()
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+class StatementCounter:
+    """Counts SQL statements sent through the engine"""
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def measure(name, kind, run, counter, repeat):
+    """Time run() repeat times, then once more under tracemalloc for peak memory"""
+    timings = []
+    statements = None
+    for _ in range(repeat):
+        before = counter.count
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+        if statements is None:
+            statements = counter.count - before
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "name": name,
+        "kind": kind,
+        "wall_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "statements": statements,
+        "peak_memory_bytes": peak
+    }
+
+def method_cases(SessionLocal, InventoryAnalytics, item_ids):
+    """(name, callable) pairs for InventoryAnalytics methods; each run gets a fresh instance"""
+    def per_item(method):
+        def run():
+            db = SessionLocal()
+            try:
+                analytics = InventoryAnalytics(db)
+                for item_id in item_ids:
+                    getattr(analytics, method)(item_id)
+            finally:
+                db.close()
+        return run
+
+    def bulk(method, *args, **kwargs):
+        def run():
+            db = SessionLocal()
+            try:
+                getattr(InventoryAnalytics(db), method)(*args, **kwargs)
+            finally:
+                db.rollback()
+                db.close()
+        return run
+
+    per_item_methods = [
+        "calculate_daily_consumption",
+        "predict_restock_date",
+        "predict_stock_life",
+        "predict_optimal_restock_quantity",
+        "calculate_cost_optimization",
+        "analyze_sales_performance",
+        "generate_menu_recommendations",
+        "run_full_analytics",
+    ]
+    cases = [(f"{method} (all items)", per_item(method)) for method in per_item_methods]
+    cases += [
+        ("calculate_daily_consumption_bulk", bulk("calculate_daily_consumption_bulk", item_ids)),
+        ("run_columnar_analytics", bulk("run_columnar_analytics", item_ids)),
+        ("load_latest_snapshots", bulk("load_latest_snapshots", item_ids)),
+        ("find_dirty_items", bulk("find_dirty_items")),
+        ("update_analytics_for_all_items", bulk("update_analytics_for_all_items")),
+        ("update_analytics_for_all_items (incremental)", bulk("update_analytics_for_all_items", incremental=True)),
+    ]
+    return cases
+
+def endpoint_cases(client, item_id):
+    """(name, callable) pairs for /analytics/* endpoints"""
+    def get(path, **params):
+        def run():
+            response = client.get(path, params=params)
+            response.raise_for_status()
+        return run
+
+    def refresh():
+        # The refresh runs in the background; wait for it so it doesn't overlap other cases
+        job_id = client.post("/analytics/update-analytics").json()["job_id"]
+        while client.get(f"/analytics/jobs/{job_id}").json()["status"] == "running":
+            time.sleep(0.01)
+
+    def log_sale():
+        client.post("/analytics/sales-log", params={"item_id": item_id, "quantity_sold": 1, "revenue": 3.5}).raise_for_status()
+
+    return [
+        ("GET /analytics/restock-predictions", get("/analytics/restock-predictions")),
+        ("GET /analytics/restock-predictions?max_staleness", get("/analytics/restock-predictions", max_staleness=3600)),
+        ("GET /analytics/cost-optimization", get("/analytics/cost-optimization")),
+        ("GET /analytics/sales-performance", get("/analytics/sales-performance")),
+        ("GET /analytics/menu-recommendations", get("/analytics/menu-recommendations")),
+        ("GET /analytics/menu-recommendations?max_staleness", get("/analytics/menu-recommendations", max_staleness=3600)),
+        ("GET /analytics/dashboard-summary", get("/analytics/dashboard-summary")),
+        ("GET /analytics/dashboard-summary?max_staleness", get("/analytics/dashboard-summary", max_staleness=3600)),
+        ("GET /analytics/predictions/{item_id}", get(f"/analytics/predictions/{item_id}")),
+        ("GET /analytics/item/{item_id}/analytics", get(f"/analytics/item/{item_id}/analytics")),
+        ("GET /analytics/jobs", get("/analytics/jobs")),
+        ("POST /analytics/sales-log", log_sale),
+        ("POST /analytics/update-analytics (until done)", refresh),
+    ]
+
+def concurrent_cases(client, item_ids, writers):
+    """(name, callable) pairs that write (and read) from many threads at once, as a busy store does"""
+    requests_per_thread = 25
+
+    def hammer(request, readers=0):
+        def run():
+            def thread(number):
+                for index in range(requests_per_thread):
+                    request(item_ids[(number * requests_per_thread + index) % len(item_ids)]).raise_for_status()
+
+            def read(_):
+                for _ in range(requests_per_thread):
+                    client.get("/stock/", params={"limit": 50}).raise_for_status()
+
+            with concurrent.futures.ThreadPoolExecutor(writers + readers) as pool:
+                futures = [pool.submit(thread, number) for number in range(writers)]
+                futures += [pool.submit(read, number) for number in range(readers)]
+                for future in futures:
+                    future.result()
+        return run
+
+    def log_stock(item_id):
+        return client.post("/stock/", params={"item_id": item_id, "quantity": 40})
+
+    def log_sale(item_id):
+        return client.post("/analytics/sales-log", params={"item_id": item_id, "quantity_sold": 1, "revenue": 3.5})
+
+    return [
+        (f"concurrent POST /stock/ ({writers} threads)", hammer(log_stock)),
+        (f"concurrent POST /analytics/sales-log ({writers} threads)", hammer(log_sale)),
+        (f"concurrent POST + GET /stock/ ({writers}+{writers} threads)",
+         hammer(log_stock, readers=writers)),
+    ]
+
+def print_results(results, baseline=None):
+    baseline_by_name = {result["name"]: result for result in (baseline or {}).get("results", [])}
+    print(f"\n{'case':<56} {'wall ms':>10} {'stmts':>7} {'peak KiB':>10}" + ("  vs base" if baseline else ""))
+    for result in results:
+        line = (f"{result['name']:<56} {result['wall_seconds'] * 1000:>10.2f} "
+                f"{result['statements']:>7} {result['peak_memory_bytes'] / 1024:>10.1f}")
+        previous = baseline_by_name.get(result["name"])
+        if previous and previous["wall_seconds"]:
+            line += f"  {result['wall_seconds'] / previous['wall_seconds']:>6.2f}x"
+        print(line)
+
+def main():
+    args = parse_args()
+
+    # Configure the app before it is imported: engine and settings are read at import time
+    workdir = tempfile.mkdtemp(prefix="stocker-bench-")
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["ANALYTICS_CACHE_TTL"] = "0"  # Time the computation, not the response cache
+    os.environ["ANALYTICS_REFRESH_INTERVAL"] = "0"
+    os.environ.setdefault("ANALYTICS_LOCK_FILE", os.path.join(workdir, "analytics.lock"))
+    os.environ.setdefault("MODEL_STORE_DIR", os.path.join(workdir, "models"))
+    sys.path.insert(0, ROOT)
+
+    from fastapi.testclient import TestClient
+    from app import models
+    from app.config import settings
+    from app.database import SessionLocal, engine
+    from app.main import app
+    from app.ml_analytics import InventoryAnalytics
+    from benchmarks.seed_data import seed
+
+    counts = None
+    if not args.database_url:
+        print(f"☕ Seeding {args.items} items x {args.days} days...")
+        counts = seed(args.categories, args.items, args.days, args.seed)
+
+    db = SessionLocal()
+    item_ids = [item_id for (item_id,) in db.query(models.Item.id).filter(models.Item.is_active == True)]
+    db.close()
+
+    counter = StatementCounter(engine)
+    client = TestClient(app)
+
+    # Snapshots exist before the snapshot-backed cases run
+    db = SessionLocal()
+    InventoryAnalytics(db).update_analytics_for_all_items()
+    db.close()
+
+    cases = [("method", name, run) for name, run in method_cases(SessionLocal, InventoryAnalytics, item_ids)]
+    cases += [("endpoint", name, run) for name, run in endpoint_cases(client, item_ids[0])]
+    cases += [("concurrent", name, run) for name, run in concurrent_cases(client, item_ids, args.writers)]
+
+    results = []
+    for kind, name, run in cases:
+        if args.only and args.only not in name:
+            continue
+        print(f"⏱️  {name}")
+        results.append(measure(name, kind, run, counter, args.repeat))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "sqlite_profile": {
+            "journal_mode": settings.SQLITE_JOURNAL_MODE,
+            "synchronous": settings.SQLITE_SYNCHRONOUS,
+            "mmap_size": settings.SQLITE_MMAP_SIZE,
+            "single_writer": settings.SQLITE_SINGLE_WRITER
+        } if engine.dialect.name == "sqlite" else None,
+        "parameters": {
+            "categories": args.categories,
+            "items": args.items,
+            "days": args.days,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "writers": args.writers
+        },
+        "row_counts": counts,
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\n✅ Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Synthetic coffee-shop data generator for benchmarks
+Fills a database with categories, items and K days of stock, sales and restock
+history with a morning rush (daily seasonality) and busier weekends (weekly
+seasonality).
+
+Usage (the target database comes from DATABASE_URL):
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/seed_data.py --items 200 --days 180
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+# Add the project root to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from app.database import engine, SessionLocal
+from app import models
+
+CATEGORY_NAMES = [
+    "Coffee Beans", "Milk & Dairy", "Syrups", "Tea", "Pastries",
+    "Packaging", "Cleaning Supplies", "Sandwiches", "Cold Drinks", "Snacks",
+]
+UNITS = ["kg", "L", "bottles", "boxes", "pcs"]
+
+# Relative sales volume per weekday (Mon..Sun) and per opening hour (7..18)
+WEEKDAY_FACTORS = [0.85, 0.9, 0.9, 0.95, 1.1, 1.35, 1.25]
+HOUR_WEIGHTS = {7: 6, 8: 10, 9: 8, 10: 5, 11: 4, 12: 6, 13: 6, 14: 3, 15: 3, 16: 3, 17: 2, 18: 1}
+
+# Rows per executemany call
+INSERT_BATCH = 5000
+
+def _flush(db, model, rows):
+    if rows:
+        db.execute(insert(model), rows)
+        rows.clear()
+
+def seed(categories: int = 5, items: int = 50, days: int = 90, seed: int = 42, reset: bool = True) -> dict:
+    """Generate the dataset and return row counts per table"""
+    rng = random.Random(seed)
+
+    if reset:
+        models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    counts = {"categories": categories, "items": items, "stock_history": 0, "sales_history": 0, "restock_history": 0}
+    try:
+        category_rows = []
+        for i in range(categories):
+            name = CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+            if i >= len(CATEGORY_NAMES):
+                name = f"{name} {i // len(CATEGORY_NAMES) + 1}"
+            category_rows.append(models.Category(name=name, description=f"Synthetic {name.lower()}"))
+        db.add_all(category_rows)
+        db.flush()
+
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+        start = now - timedelta(days=days)
+        hours = list(HOUR_WEIGHTS)
+        hour_weights = list(HOUR_WEIGHTS.values())
+
+        stock_rows, sales_rows, restock_rows = [], [], []
+        tables = (
+            (models.StockHistory, stock_rows, "stock_history"),
+            (models.SalesHistory, sales_rows, "sales_history"),
+            (models.RestockHistory, restock_rows, "restock_history"),
+        )
+        for i in range(items):
+            category = category_rows[i % categories]
+            capacity = rng.choice([20, 50, 100, 200])
+            threshold = capacity * rng.uniform(0.15, 0.3)
+            daily_demand = capacity * rng.uniform(0.02, 0.12)
+            unit_price = round(rng.uniform(2.5, 7.5), 2)
+            # A few items stop selling partway through, to exercise "remove" recommendations
+            stops_selling_after = days - rng.randint(40, days) if rng.random() < 0.1 and days > 40 else None
+
+            item = models.Item(
+                name=f"{category.name} #{i + 1}",
+                quantity=capacity,
+                unit=rng.choice(UNITS),
+                restock_threshold=round(threshold, 2),
+                category_id=category.id,
+                cost_per_unit=round(rng.uniform(0.5, 4.0), 2) if rng.random() < 0.8 else None,
+                is_active=rng.random() < 0.95
+            )
+            db.add(item)
+            db.flush()
+
+            quantity = float(capacity)
+            last_sale = None
+            for day in range(days):
+                date = start + timedelta(days=day)
+                weekday_factor = WEEKDAY_FACTORS[date.weekday()]
+                selling = stops_selling_after is None or day < stops_selling_after
+                demand = daily_demand * weekday_factor * rng.uniform(0.7, 1.3) if selling else 0.0
+
+                # Sales events cluster around the morning rush
+                events = max(1, int(rng.gauss(4 * weekday_factor, 1))) if selling else 0
+                for _ in range(events):
+                    sale_time = date.replace(hour=rng.choices(hours, hour_weights)[0], minute=rng.randint(0, 59))
+                    sold = round(demand / events, 2)
+                    sales_rows.append({
+                        "item_id": item.id, "quantity_sold": sold, "date": sale_time,
+                        "revenue": round(sold * unit_price, 2), "notes": None
+                    })
+                    last_sale = sale_time
+
+                # Closing count most days; restock next morning once below the threshold
+                quantity = max(0.0, quantity - demand)
+                if rng.random() < 0.85:
+                    stock_rows.append({
+                        "item_id": item.id, "quantity": round(quantity, 2), "date": date.replace(hour=19),
+                        "notes": "Closing count", "staff_name": rng.choice(["Ana", "Ben", "Chris", "Dee"])
+                    })
+                if quantity <= threshold:
+                    amount = round(capacity - quantity, 2)
+                    quantity = float(capacity)
+                    restock_rows.append({
+                        "item_id": item.id, "restock_amount": amount,
+                        "date": (date + timedelta(days=1)).replace(hour=6),
+                        "supplier": rng.choice(["Roastery Co", "Dairy Direct", "Wholesale Club"]),
+                        "notes": None, "cost_per_unit": item.cost_per_unit
+                    })
+
+            item.quantity = round(quantity, 2)
+            item.last_sale_date = last_sale
+
+            for model, rows, key in tables:
+                if len(rows) >= INSERT_BATCH:
+                    counts[key] += len(rows)
+                    _flush(db, model, rows)
+
+        for model, rows, key in tables:
+            counts[key] += len(rows)
+            _flush(db, model, rows)
+
+        db.commit()
+    finally:
+        db.close()
+
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a database with synthetic coffee-shop data")
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("☕ Seeding synthetic coffee-shop data...")
+    counts = seed(args.categories, args.items, args.days, args.seed)
+    for table, count in counts.items():
+        print(f"- {table}: {count}")
+
+if __name__ == "__main__":
+    main()
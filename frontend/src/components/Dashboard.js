@@ -7,7 +7,7 @@ const Dashboard = () => {
     items: [],
     categories: [],
     stockRecords: [],
-    restockRecords: []
+    todayRestocks: { rows: [], next: null }
   });
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
@@ -19,18 +19,20 @@ const Dashboard = () => {
   const fetchDashboardData = async () => {
     try {
       setLoading(true);
-      const [items, categories, stockRecords, restockRecords] = await Promise.all([
+      // Only the latest counts and today's restocks, not the whole history
+      const today = new Date().toISOString().split('T')[0];
+      const [items, categories, stockRecords, todayRestocks] = await Promise.all([
         apiClient.getItems(),
         apiClient.getCategories(),
-        apiClient.getStockRecords(),
-        apiClient.getRestockRecords()
+        apiClient.getStockRecords({ limit: 5 }),
+        apiClient.getRestockRecords({ from: `${today}T00:00:00`, limit: 1000 })
       ]);
 
       setData({
         items: items || [],
         categories: categories || [],
-        stockRecords: stockRecords || [],
-        restockRecords: restockRecords || []
+        stockRecords: stockRecords.rows || [],
+        todayRestocks
       });
     } catch (err) {
       setError('Failed to load dashboard data');
@@ -52,10 +54,8 @@ const Dashboard = () => {
   };
 
   const getTodayRestocksCount = () => {
-    const today = new Date().toISOString().split('T')[0];
-    return data.restockRecords.filter(record => 
-      record.date && record.date.startsWith(today)
-    ).length;
+    const count = data.todayRestocks.rows.length;
+    return data.todayRestocks.next ? `${count}+` : count;
   };
 
   if (loading) {
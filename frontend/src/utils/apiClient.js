@@ -2,6 +2,9 @@ import axios from 'axios';
 
 const API_BASE_URL = 'http://localhost:8000';
 
+// Rows requested per page of history
+const PAGE_SIZE = 50;
+
 class APIClient {
   constructor() {
     this.api = axios.create({
@@ -25,6 +28,20 @@ class APIClient {
     }
   }
 
+  // Fetch one page of a paginated history endpoint: { rows, next }, where next is
+  // the cursor to pass as `after` for the following page (null on the last page)
+  async fetchPage(endpoint, params = {}, after = null) {
+    try {
+      const response = await this.api.get(endpoint, {
+        params: { limit: PAGE_SIZE, ...params, ...(after ? { after } : {}) },
+      });
+      return { rows: response.data, next: response.headers['x-next-cursor'] || null };
+    } catch (error) {
+      console.error('API Error:', error);
+      throw error;
+    }
+  }
+
   // Categories
   async getCategories() {
     return this.makeRequest('GET', '/categories/');
@@ -77,8 +94,9 @@ class APIClient {
   }
 
   // Stock Records
-  async getStockRecords() {
-    return this.makeRequest('GET', '/stock/');
+  // History is newest first; params can narrow it with limit, from and to
+  async getStockRecords(params = {}, after = null) {
+    return this.fetchPage('/stock/', params, after);
   }
 
   async logStock(itemId, quantity, notes = null, staffName = null) {
@@ -88,13 +106,13 @@ class APIClient {
     return this.makeRequest('POST', '/stock/', params);
   }
 
-  async getStockRecordsForItem(itemId) {
-    return this.makeRequest('GET', `/stock/item/${itemId}`);
+  async getStockRecordsForItem(itemId, params = {}, after = null) {
+    return this.fetchPage(`/stock/item/${itemId}`, params, after);
   }
 
   // Restock Records
-  async getRestockRecords() {
-    return this.makeRequest('GET', '/restocks/');
+  async getRestockRecords(params = {}, after = null) {
+    return this.fetchPage('/restocks/', params, after);
   }
 
   async logRestock(itemId, restockAmount, supplier = null, notes = null) {
@@ -104,8 +122,8 @@ class APIClient {
     return this.makeRequest('POST', '/restocks/', params);
   }
 
-  async getRestockRecordsForItem(itemId) {
-    return this.makeRequest('GET', `/restocks/item/${itemId}`);
+  async getRestockRecordsForItem(itemId, params = {}, after = null) {
+    return this.fetchPage(`/restocks/item/${itemId}`, params, after);
   }
 
   // Analytics
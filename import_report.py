@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Import Time Report
+Imports the API in a fresh interpreter with `python -X importtime` and reports
+the slowest modules, the total cold-start import time, and whether the ML stack
+(pandas, NumPy, scikit-learn) was loaded. Exits non-zero when --budget is
+exceeded, so it can guard cold start in CI.
+
+Usage:
+    python import_report.py --top 20 --budget 2.0
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Packages that should only load on first analytics use
+ML_PACKAGES = ("numpy", "pandas", "sklearn", "scipy")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report per-module import time of the API")
+    parser.add_argument("--module", default="app.main", help="Module to import (default: app.main)")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest modules to list")
+    parser.add_argument("--budget", type=float, help="Fail if the total import time exceeds this many seconds")
+    return parser.parse_args()
+
+def measure_imports(module: str):
+    """Return [(depth, module, self_us, cumulative_us)] from a fresh interpreter"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "import failed")
+
+    imports = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return imports
+
+def main():
+    args = parse_args()
+    print(f"⏱️  Measuring import of {args.module}...")
+    try:
+        imports = measure_imports(args.module)
+    except RuntimeError as e:
+        print(f"❌ Import failed: {e}")
+        sys.exit(1)
+
+    # Top-level entries (depth 0) add up to the whole import
+    total = sum(cumulative for depth, _, _, cumulative in imports if depth == 0) / 1e6
+    top_level = sorted(
+        ((name, cumulative) for depth, name, _, cumulative in imports if depth == 0),
+        key=lambda entry: entry[1], reverse=True
+    )
+
+    print(f"\n{'module':<50} {'cumulative ms':>14}")
+    for name, cumulative in top_level[:args.top]:
+        print(f"{name:<50} {cumulative / 1000:>14.1f}")
+
+    app_modules = [(name, self_us) for _, name, self_us, _ in imports if name.startswith("app")]
+    print(f"\n{'app module':<50} {'self ms':>14}")
+    for name, self_us in sorted(app_modules, key=lambda entry: entry[1], reverse=True):
+        print(f"{name:<50} {self_us / 1000:>14.1f}")
+
+    loaded_ml = sorted({name.split(".")[0] for _, name, _, _ in imports if name.split(".")[0] in ML_PACKAGES})
+    print(f"\n📦 Total import time: {total:.2f}s ({len(imports)} modules)")
+    if loaded_ml:
+        print(f"⚠️  ML stack loaded at import: {', '.join(loaded_ml)}")
+    else:
+        print("✅ ML stack not loaded at import")
+
+    if args.budget is not None and total > args.budget:
+        print(f"❌ Over budget: {total:.2f}s > {args.budget:.2f}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Index Usage Report
+EXPLAINs the hot queries of the API against the database in DATABASE_URL and
+reports which index each one uses, which indexes on the history and
+analytics tables serve which queries, and which queries still scan a whole
+table or sort. Exits non-zero with --fail-on-scan when any query does, so it
+can guard a schema change in CI.
+
+Usage:
+    python index_report.py --analyze --fail-on-scan
+"""
+
+import argparse
+import json
+import re
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import inspect, text
+from app.config import settings
+from app.database import engine, SessionLocal
+from app import events, models, queries
+
+# Tables whose indexes are reported
+TABLES = ("stock_history", "sales_history", "restock_history", "item_analytics", "menu_optimization")
+
+def hot_queries(db, item_ids, since):
+    """(name, query) for the history lookups the routes, rollups and analytics run most"""
+    StockHistory, SalesHistory, RestockHistory = models.StockHistory, models.SalesHistory, models.RestockHistory
+    item_id = item_ids[0]
+    page = settings.DEFAULT_PAGE_SIZE + 1
+    return [
+        ("GET /stock/ page", queries.stock_history(db).order_by(
+            StockHistory.date.desc(), StockHistory.id.desc()).limit(page)),
+        ("GET /stock/?item_id page", queries.stock_history(db).filter(StockHistory.item_id == item_id).order_by(
+            StockHistory.date.desc(), StockHistory.id.desc()).limit(page)),
+        ("GET /restocks/ page", queries.restock_history(db).order_by(
+            RestockHistory.date.desc(), RestockHistory.id.desc()).limit(page)),
+        ("GET /restocks/?item_id page", queries.restock_history(db).filter(
+            RestockHistory.item_id == item_id).order_by(RestockHistory.date.desc(), RestockHistory.id.desc()).limit(page)),
+        ("events: counts of items", events._query(db, events.COUNT, item_ids, since, None)),
+        ("events: sales of items", events._query(db, events.SALE, item_ids, since, None)),
+        ("events: restocks of items", events._query(db, events.RESTOCK, item_ids, since, None)),
+        ("rollups: previous stock count", db.query(StockHistory.id).filter(
+            StockHistory.item_id == item_id, StockHistory.date < since
+        ).order_by(StockHistory.date.desc(), StockHistory.id.desc()).limit(1)),
+        ("rollups: restocks between counts", db.query(RestockHistory.restock_amount).filter(
+            RestockHistory.item_id == item_id, RestockHistory.date > since - timedelta(days=7),
+            RestockHistory.date <= since)),
+        ("analytics: last sale of item", db.query(SalesHistory.id).filter(
+            SalesHistory.item_id == item_id).order_by(SalesHistory.date.desc()).limit(1)),
+        ("analytics: latest snapshot of item", db.query(models.ItemAnalytics.id).filter(
+            models.ItemAnalytics.item_id == item_id).order_by(models.ItemAnalytics.date.desc()).limit(1)),
+        ("analytics: latest menu advice of item", db.query(models.MenuOptimization.id).filter(
+            models.MenuOptimization.item_id == item_id).order_by(models.MenuOptimization.date.desc()).limit(1)),
+        ("refresh: sales since snapshot", db.query(SalesHistory.id).filter(
+            SalesHistory.item_id == item_id, SalesHistory.date > since).limit(1)),
+        ("exports: sales from date", db.query(SalesHistory.id, SalesHistory.quantity_sold, SalesHistory.date).filter(
+            SalesHistory.date >= since).order_by(SalesHistory.date, SalesHistory.id)),
+    ]
+
+def _plan_sqlite(connection, sql):
+    """(indexes used, tables scanned in full, sorts) from EXPLAIN QUERY PLAN"""
+    used, scans, sorts = [], [], 0
+    for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"):
+        detail = row[-1]
+        match = re.search(r"USING (?:COVERING )?INDEX (\w+)", detail)
+        if match:
+            used.append(match.group(1))
+        elif re.match(r"SCAN (\w+)$", detail):
+            scans.append(detail.split()[1])
+        if "TEMP B-TREE" in detail:
+            sorts += 1
+    return used, scans, sorts
+
+def _plan_postgresql(connection, sql):
+    """(indexes used, tables scanned in full, sorts) from EXPLAIN (FORMAT JSON)"""
+    used, scans, sorts = [], [], 0
+    plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}").scalar()
+    nodes = [(json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            used.append(node["Index Name"])
+        elif node["Node Type"] == "Seq Scan":
+            scans.append(node["Relation Name"])
+        if node["Node Type"] in ("Sort", "Incremental Sort"):
+            sorts += 1
+        nodes.extend(node.get("Plans", []))
+    return used, scans, sorts
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Report which indexes serve the API's hot queries")
+    parser.add_argument("--analyze", action="store_true", help="Run ANALYZE first so the planner has statistics")
+    parser.add_argument("--fail-on-scan", action="store_true", help="Exit non-zero if a query scans a table or sorts")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    explain = {"sqlite": _plan_sqlite, "postgresql": _plan_postgresql}.get(engine.dialect.name)
+    if explain is None:
+        print(f"❌ No EXPLAIN support for {engine.dialect.name}")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        if args.analyze:
+            db.execute(text("ANALYZE"))
+            db.commit()
+        item_ids = [item_id for (item_id,) in db.query(models.Item.id).order_by(models.Item.id).limit(2)] or [1, 2]
+        since = datetime.now() - timedelta(days=30)
+
+        connection = db.connection()
+        served, flagged = {}, []
+        print(f"🔎 Hot queries ({engine.dialect.name})\n")
+        for name, query in hot_queries(db, item_ids, since):
+            sql = str(query.statement.compile(
+                dialect=engine.dialect, compile_kwargs={"literal_binds": True, "render_postcompile": True}
+            ))
+            used, scans, sorts = explain(connection, sql)
+            for index in used:
+                served.setdefault(index, []).append(name)
+            problems = [f"scans {table}" for table in scans] + (["sorts"] if sorts else [])
+            if problems:
+                flagged.append(name)
+            mark = "⚠️ " if problems else "✅"
+            print(f"{mark} {name:<40} {', '.join(used) or '-'}{'  (' + ', '.join(problems) + ')' if problems else ''}")
+
+        print("\n📇 Indexes\n")
+        inspector = inspect(connection)
+        for table in TABLES:
+            if not inspector.has_table(table):
+                continue
+            for index in inspector.get_indexes(table):
+                columns = ", ".join(index["column_names"])
+                users = served.get(index["name"])
+                print(f"{'✅' if users else '💤'} {index['name']:<34} {table} ({columns})")
+                for name in users or ():
+                    print(f"      {name}")
+    finally:
+        db.close()
+
+    if flagged:
+        print(f"\n⚠️  {len(flagged)} quer{'y' if len(flagged) == 1 else 'ies'} scan a table or sort; "
+              "run `python migrate.py` if migrations are pending")
+        if args.fail_on_scan:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
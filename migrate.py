@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Schema Migration Script
+Applies pending schema migrations (see app/migrations.py) to the database in
+DATABASE_URL without touching existing data, or lists which are applied.
+
+Usage:
+    python migrate.py            # apply all pending migrations
+    python migrate.py --to 2     # apply up to version 2
+    python migrate.py status
+"""
+
+import argparse
+import sys
+import os
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine
+from app import migrations
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations")
+    parser.add_argument("command", nargs="?", choices=("upgrade", "status"), default="upgrade")
+    parser.add_argument("--to", type=int, help="Stop after this version")
+    return parser.parse_args()
+
+def status():
+    applied = set(migrations.applied_versions(engine))
+    for migration in migrations.MIGRATIONS:
+        mark = "✅" if migration.version in applied else "⏳"
+        manual = "" if migration.startup else "  (migrate.py only)"
+        print(f"{mark} {migration.version:>3}  {migration.description}{manual}")
+    pending = len(migrations.MIGRATIONS) - len(applied)
+    print(f"\n{pending} pending" if pending else "\nUp to date")
+
+def main():
+    args = parse_args()
+    if args.command == "status":
+        status()
+        return
+
+    print("🗄️  Migrating database...")
+    try:
+        applied = migrations.upgrade(engine, args.to)
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+    for migration in applied:
+        print(f"✅ {migration.version}: {migration.description}")
+    print("🎉 Database is up to date" if applied else "✅ Nothing to apply")
+
+if __name__ == "__main__":
+    main()
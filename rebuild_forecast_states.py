@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Forecast State Rebuild Script
+Replays raw stock, sales and restock history into the per-item Holt-Winters
+forecast states
+"""
+
+import sys
+import os
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, SessionLocal
+from app import migrations
+from app.smoothing import rebuild_states
+
+def main():
+    """Backfill item_forecast_states"""
+    print("📈 Rebuilding forecast states...")
+
+    # Bring older databases up to the current schema
+    migrations.upgrade(engine)
+
+    db = SessionLocal()
+    try:
+        states = rebuild_states(db)
+        db.commit()
+        print(f"✅ Wrote {states} forecast states")
+        print("💡 Set FORECAST_MODE=smoothing to forecast from the states")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error rebuilding forecast states: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Rollup Rebuild Script
+Recomputes the per-item daily rollups from raw stock, sales and restock history
+"""
+
+import sys
+import os
+
+# Add the app directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import engine, SessionLocal
+from app import migrations
+from app.rollups import rebuild_rollups
+
+def main():
+    """Backfill item_daily_rollups"""
+    print("📊 Rebuilding daily rollups...")
+
+    # Bring older databases up to the current schema
+    migrations.upgrade(engine)
+
+    db = SessionLocal()
+    try:
+        rows = rebuild_rollups(db)
+        db.commit()
+        print(f"✅ Wrote {rows} rollup rows")
+        print("💡 Set USE_DAILY_ROLLUPS=true to serve analytics from the rollups")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error rebuilding rollups: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from app.database import engine
-from app import models
+from app import migrations, models
 
 def reset_database():
     """Drop all tables and recreate them"""
@@ -23,20 +23,21 @@ def reset_database():
         models.Base.metadata.drop_all(bind=engine)
         print("✅ Tables dropped successfully")
         
-        # Create all tables with new schema
+        # Create all tables with new schema and mark every migration applied
         print("📈 Creating new tables...")
-        models.Base.metadata.create_all(bind=engine)
+        migrations.upgrade(engine)
         print("✅ Tables created successfully")
         
         print("🎉 Database reset complete!")
         print("\n📋 New tables created:")
-        print("- items (with cost_per_unit, is_active, last_sale_date)")
+        print("- items (with cost_per_unit, is_active, last_sale_date, updated_at)")
         print("- categories")
         print("- stock_history")
         print("- restock_history (with cost_per_unit)")
         print("- sales_history (NEW)")
         print("- item_analytics (NEW)")
         print("- menu_optimization (NEW)")
+        print("- item_daily_rollups (NEW)")
         
     except Exception as e:
         print(f"❌ Error resetting database: {e}")
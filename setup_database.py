@@ -8,7 +8,7 @@ import os
 import sys
 from sqlalchemy import create_engine, text
 from app.database import engine
-from app.models import Base
+from app import migrations
 
 def create_database():
     """Create the database if it doesn't exist"""
@@ -44,7 +44,7 @@ def create_database():
 def create_tables():
     """Create all tables"""
     try:
-        Base.metadata.create_all(bind=engine)
+        migrations.upgrade(engine)
         print("✅ All tables created successfully")
         return True
     except Exception as e:
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The app builds its engine at import time; keep it off the PostgreSQL default
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,32 @@
+"""Bounds of the analytics response cache"""
+import time
+from app.cache import KEY_LOCK_STRIPES, ResponseCache
+
+def test_least_recently_used_entries_are_evicted_past_max_entries():
+    cache = ResponseCache(ttl_seconds=60, max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.get_or_compute(key, lambda key=key: key.upper())
+    cache.get_or_compute("a", lambda: "recomputed")  # Hit: "a" becomes most recent
+
+    cache.get_or_compute("d", lambda: "D")
+
+    assert list(cache._entries) == ["c", "a", "d"]
+    assert cache.get_or_compute("a", lambda: "recomputed") == "A"
+
+def test_expired_entries_are_dropped_on_write():
+    cache = ResponseCache(ttl_seconds=0.01, max_entries=100)
+    for value in range(10):
+        cache.get_or_compute(("params", value), lambda: value)
+    time.sleep(0.02)
+
+    cache.get_or_compute("fresh", lambda: 1)
+
+    assert list(cache._entries) == ["fresh"]
+
+def test_key_locks_stay_fixed():
+    cache = ResponseCache(ttl_seconds=60, max_entries=10)
+    for value in range(1000):
+        cache.get_or_compute(("max_staleness", value / 7), lambda: value)
+
+    assert len(cache._key_locks) == KEY_LOCK_STRIPES
+    assert cache.stats()["entries"] == 10
@@ -0,0 +1,47 @@
+"""Validation of bulk ingestion rows"""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from app import ingest, models
+
+def make_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}")
+    models.Base.metadata.create_all(engine)
+    db = Session(engine)
+    db.add(models.Item(id=1, name="Milk", quantity=10))
+    db.commit()
+    return db
+
+def test_refunds_are_accepted_but_negative_quantities_are_not(tmp_path):
+    db = make_session(tmp_path)
+
+    result = ingest.ingest_sales(db, [
+        {"item_id": 1, "quantity_sold": 1, "revenue": -4.5},
+        {"item_id": 1, "quantity_sold": -1, "revenue": 4.5},
+        {"item_id": 1, "quantity_sold": 2, "revenue": "inf"},
+    ])
+
+    assert result["inserted"] == 1
+    assert result["errors"] == [
+        {"index": 1, "error": "quantity_sold must be a non-negative number"},
+        {"index": 2, "error": "revenue must be a finite number"},
+    ]
+    assert db.query(models.SalesHistory.revenue).scalar() == -4.5
+
+def test_unknown_csv_columns_are_ignored_once(tmp_path):
+    db = make_session(tmp_path)
+    rows = ingest._parse_csv(b"item_id,item_name,quantity\n1,Milk,8\n1,Milk,7,extra\n")
+
+    result = ingest.ingest_stock_counts(db, rows)
+
+    assert result["inserted"] == 1
+    assert result["ignored_columns"] == ["item_name"]
+    assert result["errors"] == [{"index": 1, "error": "more values than header columns"}]
+    assert db.get(models.Item, 1).quantity == 8
+
+def test_unknown_json_fields_are_still_errors(tmp_path):
+    db = make_session(tmp_path)
+
+    result = ingest.ingest_stock_counts(db, [{"item_id": 1, "quantity": 8, "item_name": "Milk"}])
+
+    assert result["errors"] == [{"index": 0, "error": "unknown field(s): item_name"}]
+    assert result["ignored_columns"] == []
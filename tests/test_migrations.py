@@ -0,0 +1,78 @@
+"""Upgrading databases created before schema migrations existed"""
+from datetime import datetime
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+from app import migrations, models
+
+# Schema of databases created by reset_database.py before migrations (the
+# original models, without users and the analytics tables)
+BASELINE_SCHEMA = [
+    """CREATE TABLE categories (
+        id INTEGER NOT NULL, name VARCHAR, description VARCHAR, PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE items (
+        id INTEGER NOT NULL, name VARCHAR, quantity FLOAT, unit VARCHAR, restock_threshold FLOAT,
+        category_id INTEGER, is_active BOOLEAN, cost_per_unit FLOAT, last_sale_date DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(category_id) REFERENCES categories (id)
+    )""",
+    """CREATE TABLE stock_history (
+        id INTEGER NOT NULL, item_id INTEGER, quantity FLOAT NOT NULL, date DATETIME, notes VARCHAR,
+        staff_name VARCHAR, PRIMARY KEY (id), FOREIGN KEY(item_id) REFERENCES items (id)
+    )""",
+    """CREATE TABLE restock_history (
+        id INTEGER NOT NULL, item_id INTEGER, restock_amount FLOAT NOT NULL, date DATETIME, supplier VARCHAR,
+        notes VARCHAR, cost_per_unit FLOAT, PRIMARY KEY (id), FOREIGN KEY(item_id) REFERENCES items (id)
+    )""",
+    """CREATE TABLE sales_history (
+        id INTEGER NOT NULL, item_id INTEGER, quantity_sold FLOAT NOT NULL, date DATETIME, revenue FLOAT,
+        notes VARCHAR, PRIMARY KEY (id), FOREIGN KEY(item_id) REFERENCES items (id)
+    )""",
+    "INSERT INTO categories (id, name) VALUES (1, 'Dairy')",
+    "INSERT INTO items (id, name, quantity, unit, restock_threshold, category_id, is_active) "
+    "VALUES (1, 'Milk', 12, 'L', 4, 1, 1)",
+    "INSERT INTO stock_history (item_id, quantity, date) VALUES (1, 15, '2026-01-05 09:00:00')",
+    "INSERT INTO stock_history (item_id, quantity, date) VALUES (1, 12, '2026-01-06 09:00:00')",
+]
+
+def baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_SCHEMA:
+            connection.exec_driver_sql(statement)
+    return engine
+
+def test_upgrade_baseline_keeps_data_and_matches_models(tmp_path):
+    engine = baseline_engine(tmp_path)
+
+    applied = migrations.upgrade(engine)
+
+    assert [migration.version for migration in applied] == [migration.version for migration in migrations.MIGRATIONS]
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        assert set(table.columns.keys()) <= columns, table.name
+    with Session(engine) as db:
+        item = db.query(models.Item).one()
+        assert (item.name, item.quantity) == ("Milk", 12)
+        assert isinstance(item.updated_at, datetime)
+        assert db.query(models.StockHistory).count() == 2
+        # Closing counts are backfilled only for days with rollups, which come from rebuild_rollups.py
+        assert db.query(models.ItemDailyRollup).count() == 0
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = baseline_engine(tmp_path)
+    migrations.upgrade(engine)
+
+    assert migrations.upgrade(engine) == []
+    assert migrations.pending(engine) == []
+
+def test_startup_upgrade_leaves_manual_steps_pending(tmp_path):
+    engine = baseline_engine(tmp_path)
+
+    applied = migrations.upgrade(engine, startup=True)
+
+    manual = [migration.version for migration in migrations.MIGRATIONS if not migration.startup]
+    assert manual
+    assert [migration.version for migration in migrations.pending(engine)] == manual
+    assert not {migration.version for migration in applied} & set(manual)
+    assert [migration.version for migration in migrations.upgrade(engine)] == manual
@@ -0,0 +1,104 @@
+"""Archiving history into daily rollups, and paging across the archive horizon"""
+from datetime import date, datetime, timedelta
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import Session, sessionmaker
+from app import models, retention, rollups
+from app.routes import stock_history
+
+HORIZON = date(2026, 2, 1)
+DAYS = 55  # 2026-01-05 through 2026-02-28
+
+def make_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retention.db'}")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+    db = session()
+    db.add_all([models.Item(id=item_id, name=f"item{item_id}", quantity=100) for item_id in (1, 2)])
+    for offset in range(DAYS):
+        day = datetime(2026, 1, 5) + timedelta(days=offset)
+        for item_id in (1, 2):
+            if offset % 2 == 0:
+                db.add(models.StockHistory(item_id=item_id, quantity=110 - offset, date=day.replace(hour=9)))
+            db.add(models.StockHistory(item_id=item_id, quantity=100 - offset, date=day.replace(hour=18)))
+            db.add(models.SalesHistory(item_id=item_id, quantity_sold=item_id + offset % 3, revenue=2.5 * item_id,
+                                       date=day.replace(hour=12)))
+            if offset % 7 == 0:
+                db.add(models.RestockHistory(item_id=item_id, restock_amount=20, date=day.replace(hour=8)))
+    db.flush()
+    rollups.rebuild_rollups(db)
+    db.commit()
+    return session, db
+
+def totals(db: Session, horizon) -> tuple:
+    """Stock counts, units sold, revenue and units restocked: rollups before horizon plus raw rows from it"""
+    Rollup = models.ItemDailyRollup
+    before = horizon or date.min
+    archived = db.query(
+        func.coalesce(func.sum(Rollup.stock_count), 0), func.coalesce(func.sum(Rollup.units_sold), 0),
+        func.coalesce(func.sum(Rollup.revenue), 0), func.coalesce(func.sum(Rollup.restocked_amount), 0)
+    ).filter(Rollup.day < before).one()
+    since = datetime.combine(before, datetime.min.time())
+    raw = (
+        db.query(func.count(models.StockHistory.id)).filter(models.StockHistory.date >= since).scalar(),
+        db.query(func.coalesce(func.sum(models.SalesHistory.quantity_sold), 0)).filter(models.SalesHistory.date >= since).scalar(),
+        db.query(func.coalesce(func.sum(models.SalesHistory.revenue), 0)).filter(models.SalesHistory.date >= since).scalar(),
+        db.query(func.coalesce(func.sum(models.RestockHistory.restock_amount), 0)).filter(models.RestockHistory.date >= since).scalar(),
+    )
+    return tuple(a + b for a, b in zip(archived, raw))
+
+def test_archiving_keeps_rollup_plus_raw_totals(tmp_path):
+    _, db = make_session(tmp_path)
+    expected = totals(db, None)
+    # Drifted rollups are rebuilt from the raw rows before those go
+    db.query(models.ItemDailyRollup).filter(models.ItemDailyRollup.day == date(2026, 1, 10)).delete()
+    db.commit()
+
+    result = retention.archive_history(db, HORIZON)
+    db.commit()
+
+    assert result["stock_history"] == 2 * (27 + 14)
+    assert retention.archive_horizon(db) == HORIZON
+    assert db.query(models.SalesHistory).filter(models.SalesHistory.date < datetime(2026, 2, 1)).count() == 0
+    assert totals(db, HORIZON) == expected
+    assert retention.archive_history(db, HORIZON) is None
+
+@pytest.mark.parametrize("limit", [7, 10, 500])
+def test_cursor_continues_past_the_archive_horizon(tmp_path, limit):
+    session, db = make_session(tmp_path)
+    retention.archive_history(db, HORIZON)
+    db.commit()
+    raw_rows = db.query(models.StockHistory).count()
+
+    def get_db():
+        with session() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(stock_history.router)
+    app.dependency_overrides[stock_history.get_db] = get_db
+    client = TestClient(app)
+
+    rows, after = [], None
+    while True:
+        response = client.get("/stock/", params={"limit": limit, **({"after": after} if after else {})})
+        assert response.status_code == 200
+        assert len(response.json()) <= limit
+        rows += response.json()
+        after = response.headers.get("x-next-cursor")
+        if not after:
+            break
+
+    raw = [row for row in rows if not row.get("summary")]
+    summaries = [row for row in rows if row.get("summary")]
+    assert rows == raw + summaries
+    assert len(raw) == raw_rows and len({row["id"] for row in raw}) == raw_rows
+    assert all(row["date"] >= "2026-02-01" for row in raw)
+    # One summary per item and archived day, standing for every archived count
+    assert len(summaries) == 2 * 27
+    assert len({(row["date"], row["item_id"]) for row in summaries}) == len(summaries)
+    assert all(row["date"] < "2026-02-01" for row in summaries)
+    assert [row["date"] for row in summaries] == sorted((row["date"] for row in summaries), reverse=True)
+    assert sum(row["count"] for row in summaries) == 2 * (27 + 14)
@@ -0,0 +1,80 @@
+"""Replaying the sales spool after a crash"""
+import json
+import os
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models, sales_buffer
+
+@pytest.fixture
+def db_session(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sales.db'}")
+    models.Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)
+    monkeypatch.setattr(sales_buffer, "SessionLocal", session)
+    with session() as db:
+        db.add(models.Item(id=1, name="Milk", quantity=10))
+        db.commit()
+    return session
+
+def sale(quantity: float, hour: int) -> dict:
+    return {"item_id": 1, "quantity_sold": quantity, "revenue": 2 * quantity, "notes": None,
+            "date": datetime(2026, 3, 2, hour)}
+
+def segments(directory) -> list:
+    return [name for name in os.listdir(directory) if name.startswith(sales_buffer.SEGMENT_PREFIX)]
+
+def sold(session) -> list:
+    with session() as db:
+        return [quantity for (quantity,) in db.query(models.SalesHistory.quantity_sold).order_by(models.SalesHistory.date)]
+
+def test_sales_spooled_before_a_crash_are_replayed(tmp_path, db_session):
+    spool = sales_buffer.SalesSpool(str(tmp_path / "spool"))
+    for quantity, hour in ((1, 9), (2, 10), (3, 11)):
+        spool.append(sale(quantity, hour))
+    # The worker dies before its flusher commits: the segment stays, its lock goes
+    spool._file.close()
+
+    assert sales_buffer.replay_spool(spool.directory) == 3
+
+    assert sold(db_session) == [1, 2, 3]
+    assert segments(spool.directory) == []
+    with db_session() as db:
+        assert db.get(models.Item, 1).last_sale_date == datetime(2026, 3, 2, 11)
+
+def test_torn_final_record_is_skipped(tmp_path, db_session):
+    directory = tmp_path / "spool"
+    directory.mkdir()
+    lines = [json.dumps({**entry, "date": entry["date"].isoformat()}) for entry in (sale(1, 9), sale(2, 10))]
+    (directory / "sales-1-1.ndjson").write_text("\n".join(lines) + '\n{"item_id": 1, "quant')
+
+    assert sales_buffer.replay_spool(str(directory)) == 2
+
+    assert sold(db_session) == [1, 2]
+    assert segments(directory) == []
+
+def test_replay_skips_segments_already_committed(tmp_path, db_session):
+    spool = sales_buffer.SalesSpool(str(tmp_path / "spool"))
+    spool.append(sale(4, 9))
+    path = spool._file.name
+    spool._file.close()
+    # A flush committed the segment, then the worker died before deleting it
+    assert sales_buffer.commit_segment(path) == 1
+
+    assert sales_buffer.replay_spool(spool.directory) == 0
+
+    assert sold(db_session) == [4]
+    assert segments(spool.directory) == []
+
+def test_live_segments_are_left_alone(tmp_path, db_session):
+    spool = sales_buffer.SalesSpool(str(tmp_path / "spool"))
+    spool.append(sale(5, 9))
+
+    assert sales_buffer.replay_spool(spool.directory) == 0
+    assert sold(db_session) == []
+
+    assert spool.flush() == 1
+    assert sold(db_session) == [5]
+    spool.close()
+    assert segments(spool.directory) == []
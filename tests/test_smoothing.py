@@ -0,0 +1,113 @@
+"""Creating and locking forecast states from the write paths, and rebuilding them"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import create_engine, event
+import pytest
+from sqlalchemy.orm import Session
+from app import events, models, retention, rollups, smoothing
+from app.config import settings
+
+@pytest.fixture(autouse=True)
+def smoothing_mode(monkeypatch):
+    monkeypatch.setattr(settings, "FORECAST_MODE", "smoothing")
+
+def make_session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'smoothing.db'}")
+    models.Base.metadata.create_all(engine)
+    db = Session(engine)
+    db.add_all([models.Item(id=item_id, name=f"item{item_id}", quantity=10) for item_id in (1, 2)])
+    db.commit()
+    return engine, db
+
+def test_first_writes_create_one_state(tmp_path):
+    _, db = make_session(tmp_path)
+    smoothing.record_batch(db, events.COUNT, [{"item_id": 1, "quantity": 10, "date": datetime(2026, 1, 5)}])
+    db.commit()
+
+    smoothing.record_batch(db, events.SALE, [
+        {"item_id": 1, "quantity_sold": 2, "date": datetime(2026, 1, 5)},
+        {"item_id": 2, "quantity_sold": 3, "date": datetime(2026, 1, 5)},
+    ])
+    db.commit()
+
+    states = {state.item_id: state for state in db.query(models.ItemForecastState)}
+    assert sorted(states) == [1, 2]
+    assert (states[1].day_demand, states[1].last_count_quantity) == (2, 10)
+    assert states[2].day_demand == 3
+
+def test_states_are_skipped_outside_smoothing_mode(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "FORECAST_MODE", "category")
+    _, db = make_session(tmp_path)
+
+    smoothing.record_batch(db, events.SALE, [{"item_id": 1, "quantity_sold": 2, "date": datetime(2026, 1, 5)}])
+    smoothing.record_sale(db, models.SalesHistory(item_id=2, quantity_sold=1, date=datetime(2026, 1, 5)))
+    db.commit()
+
+    assert db.query(models.ItemForecastState).count() == 0
+
+def test_state_created_concurrently_is_reused(tmp_path):
+    engine, db = make_session(tmp_path)
+
+    # Another writer creates the state after this one saw it missing
+    def create_elsewhere(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO item_forecast_states") and not created:
+            created.append(True)
+            cursor.execute("INSERT INTO item_forecast_states (item_id, level, trend, season, observations, "
+                           "day_demand, sold_since_count, restocked_since_count, absolute_error, actual_demand) "
+                           "VALUES (1, 0, 0, '[0, 0, 0, 0, 0, 0, 0]', 0, 5, 0, 0, 0, 0)")
+    created = []
+    event.listen(engine, "before_cursor_execute", create_elsewhere)
+
+    state = smoothing._state_for_update(db, 1)
+    db.commit()
+
+    assert created
+    assert state.day_demand == 5
+    assert db.query(models.ItemForecastState).count() == 1
+
+def add_history(db, days: int):
+    """A sale at 09:00 and a count at 18:00 every day from 2026-01-05"""
+    for offset in range(days):
+        day = datetime(2026, 1, 5) + timedelta(days=offset)
+        sold = 3 + offset % 7
+        db.add(models.SalesHistory(item_id=1, quantity_sold=sold, date=day.replace(hour=9)))
+        db.add(models.StockHistory(item_id=1, quantity=100 - offset, date=day.replace(hour=18)))
+    db.flush()
+    rollups.rebuild_rollups(db)
+    db.commit()
+
+def state_values(db):
+    state = db.query(models.ItemForecastState).filter(models.ItemForecastState.item_id == 1).one()
+    return {field: getattr(state, field) for field in smoothing.STATE_FIELDS}
+
+def test_stale_states_are_rebuilt_from_history(tmp_path):
+    _, db = make_session(tmp_path)
+    add_history(db, 30)
+    smoothing.rebuild_states(db)
+    db.commit()
+    rebuilt = state_values(db)
+
+    db.query(models.ItemForecastState).update({"level": 0.0})
+    smoothing.mark_stale(db, 1)
+    db.commit()
+
+    assert smoothing.rebuild_stale_states(db) == 1
+    db.commit()
+    assert state_values(db) == rebuilt
+    assert smoothing.rebuild_stale_states(db) == 0
+
+def test_rebuild_replays_archived_days_from_rollups(tmp_path):
+    _, db = make_session(tmp_path)
+    add_history(db, 60)
+    smoothing.rebuild_states(db)
+    db.commit()
+    before_archive = state_values(db)
+
+    retention.archive_history(db, date(2026, 2, 1))
+    db.commit()
+    smoothing.rebuild_states(db)
+    db.commit()
+
+    assert db.query(models.SalesHistory).filter(models.SalesHistory.date < datetime(2026, 2, 1)).count() == 0
+    after_archive = state_values(db)
+    for field in smoothing.STATE_FIELDS:
+        assert after_archive[field] == before_archive[field], field